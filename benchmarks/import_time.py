@@ -0,0 +1,115 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Import time of requests_chef, measured in fresh interpreters.
+
+Each statement runs in a new 'python' process, as a short-lived CLI
+wrapper would, and the median of --runs runs is reported along with
+the heavy dependencies it loaded. The processes run in the checkout
+this script is in, so they import (and time) its requests_chef:
+
+    $ python benchmarks/import_time.py --save baseline.json
+    $ python benchmarks/import_time.py --compare baseline.json
+
+With --compare, exits non-zero if any statement got slower than the
+baseline by more than --threshold.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+STATEMENTS = (
+    'import requests_chef',
+    'import requests_chef.clock',
+    'from requests_chef import ChefAuth',
+    'from requests_chef import ChefSession',
+)
+
+HEAVY = ('requests', 'cryptography')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+%s
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [name for name in %r if name in sys.modules]]))
+"""
+
+
+def measure(statement, runs):
+    """Return the median seconds and the heavy modules for 'statement'."""
+    times = []
+    loaded = []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, '-c', _SCRIPT % (statement, HEAVY)], cwd=ROOT)
+        elapsed, loaded = json.loads(output.decode('utf-8'))
+        times.append(elapsed)
+    return {'seconds': statistics.median(times), 'loaded': loaded}
+
+
+def compare(results, baseline, threshold):
+    """Print changes against 'baseline', returning the regressed names."""
+    regressed = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        change = result['seconds'] / baseline[name]['seconds'] - 1
+        flag = ''
+        if change > threshold:
+            regressed.append(name)
+            flag = '  REGRESSION'
+        print('%-40s %+7.1f%%%s' % (name, change * 100, flag))
+    return regressed
+
+
+def main(argv=None):
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=15,
+                        help='fresh interpreters per statement')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fractional slowdown counted as a regression')
+    args = parser.parse_args(argv)
+
+    results = {}
+    print('%-40s %10s  %s' % ('statement', 'ms', 'loaded'))
+    for statement in STATEMENTS:
+        results[statement] = measure(statement, args.runs)
+        print('%-40s %10.2f  %s' % (
+            statement, results[statement]['seconds'] * 1000,
+            ', '.join(results[statement]['loaded']) or '-'))
+
+    if args.save:
+        with open(args.save, 'w') as baseline:
+            json.dump(results, baseline, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressed = compare(results, json.load(baseline), args.threshold)
+        if regressed:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
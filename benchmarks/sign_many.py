@@ -0,0 +1,73 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare ChefAuth.sign_many with signing requests one at a time.
+
+Run it from a checkout, which it benchmarks:
+
+    $ python benchmarks/sign_many.py --requests 2000 --distinct 500
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+# benchmark the checkout this script is in, not an installed copy
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from cryptography.hazmat import backends as crypto_backends  # noqa
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa
+
+import requests_chef  # noqa
+
+
+def main(argv=None):
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='requests per batch')
+    parser.add_argument('--distinct', type=int, default=None,
+                        help='distinct node paths (default: all distinct)')
+    parser.add_argument('--key-size', type=int, default=2048)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    key = rsa.generate_private_key(
+        public_exponent=65537, key_size=args.key_size,
+        backend=crypto_backends.default_backend())
+    auth = requests_chef.ChefAuth('bench-user', key)
+    distinct = args.distinct or args.requests
+    batch = [('GET', '/nodes/node-%d' % (i % distinct))
+             for i in range(args.requests)]
+
+    def one_at_a_time():
+        for method, path_url in batch:
+            auth.sign_request(method, path_url)
+
+    def all_at_once():
+        auth.sign_many(batch)
+
+    single = min(timeit.repeat(one_at_a_time, number=1, repeat=args.repeat))
+    batched = min(timeit.repeat(all_at_once, number=1, repeat=args.repeat))
+    print('%d requests, %d distinct, %d-bit key' % (
+        args.requests, distinct, args.key_size))
+    print('  sign_request: %8.1f req/s' % (args.requests / single))
+    print('  sign_many:    %8.1f req/s' % (args.requests / batched))
+    print('  speedup:      %8.2fx' % (single / batched))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Microbenchmarks for the signing hot path.
+
+Measures digester, splitter, canonical_request, RSAKey.sign, a full
+ChefAuth.__call__ and an end-to-end request loop against a local
+fake_server.FakeChefServer, for several body sizes, key sizes and
+str/bytes bodies. Each benchmark reports ops/sec, the memory blocks one
+call allocates and keeps (in its result or in caches) and its peak
+traced bytes.
+
+Run it from a checkout, which it benchmarks:
+
+    $ python benchmarks/signing.py --save baseline.json
+    $ python benchmarks/signing.py --compare baseline.json
+
+With --compare, exits non-zero if any benchmark got slower than the
+baseline by more than --threshold.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# benchmark the checkout this script is in, not an installed copy
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from cryptography.hazmat import backends as crypto_backends  # noqa
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa
+import requests  # noqa
+
+import requests_chef  # noqa
+from requests_chef import fake_server  # noqa
+from requests_chef import mixlib_auth  # noqa
+
+SIZES = {'K': 1024, 'M': 1024 * 1024}
+
+TIMESTAMP = '2015-06-29T15:30:22Z'
+
+# leave tracemalloc's own allocations out of the block counts
+_TRACE_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+
+def parse_size(size):
+    """Parse '0', '64K' or '100M' into a number of bytes."""
+    size = size.strip().upper()
+    if size[-1:] in SIZES:
+        return int(size[:-1]) * SIZES[size[-1]]
+    return int(size)
+
+
+def measure(func, min_time=0.2):
+    """Return ops/sec, blocks allocated and peak bytes for 'func'.
+
+    'blocks' counts the memory blocks one call allocates that are still
+    held once it returns, by its result or by caches.
+    """
+    func()  # warm up
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        traced, _ = tracemalloc.get_traced_memory()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    blocks = sum(stat.count_diff for stat in after.filter_traces(
+        _TRACE_FILTERS).compare_to(before.filter_traces(_TRACE_FILTERS),
+                                   'filename'))
+    return {'ops_per_sec': number / elapsed, 'blocks': blocks,
+            'peak_bytes': peak - traced}
+
+
+def benchmarks(key_sizes, body_sizes, end_to_end=True):
+    """Yield (name, func) pairs to measure."""
+    yield 'splitter', lambda: list(mixlib_auth.splitter('x' * 344))
+    yield 'digester[path]', lambda: mixlib_auth.digester('/nodes/node-1')
+    for size in body_sizes:
+        text = 'x' * size
+        data = text.encode('utf-8')
+        yield ('digester[str,%d]' % size,
+               lambda text=text: mixlib_auth.digester(text))
+        yield ('digester[bytes,%d]' % size,
+               lambda data=data: mixlib_auth.digester(data))
+
+    for key_size in key_sizes:
+        key = requests_chef.RSAKey(rsa.generate_private_key(
+            public_exponent=65537, key_size=key_size,
+            backend=crypto_backends.default_backend()))
+        auth = requests_chef.ChefAuth('bench-user', key)
+        hashed = mixlib_auth.digester('')
+        canonical = auth.canonical_request('GET', hashed, hashed, TIMESTAMP)
+        yield ('canonical_request[%d]' % key_size,
+               lambda auth=auth: auth.canonical_request(
+                   'GET', hashed, hashed, TIMESTAMP))
+        yield ('canonical_request_bytes[%d]' % key_size,
+               lambda auth=auth: auth.canonical_request_bytes(
+                   'GET', hashed, hashed, TIMESTAMP))
+        yield ('RSAKey.sign[%d]' % key_size,
+               lambda key=key: key.sign(canonical))
+
+        for size in body_sizes:
+            text = 'x' * size
+            data = text.encode('utf-8')
+            for kind, body in (('str', text), ('bytes', data)):
+                request = requests.Request(
+                    'PUT', 'http://chef/sandboxes/abc', data=body).prepare()
+                yield ('ChefAuth.__call__[%d,%s,%d]' % (key_size, kind, size),
+                       lambda auth=auth, request=request: auth(request))
+
+        if end_to_end:
+            server = fake_server.FakeChefServer({'bench-user': key})
+            url = server.start()
+            session = requests.Session()
+            session.auth = auth
+            yield ('end_to_end[%d]' % key_size,
+                   lambda session=session, url=url: session.get(
+                       url + '/nodes/node-1'))
+            session.close()
+            server.stop()
+
+
+def compare(results, baseline, threshold):
+    """Print changes against 'baseline', returning the regressed names."""
+    regressed = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        before = baseline[name]['ops_per_sec']
+        change = result['ops_per_sec'] / before - 1
+        flag = ''
+        if change < -threshold:
+            regressed.append(name)
+            flag = '  REGRESSION'
+        print('%-45s %+7.1f%%%s' % (name, change * 100, flag))
+    return regressed
+
+
+def main(argv=None):
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0])
+    parser.add_argument('--key-sizes', default='2048,4096',
+                        help='comma separated RSA key sizes')
+    parser.add_argument('--body-sizes', default='0,1K,64K,1M,100M',
+                        help='comma separated body sizes, e.g. 0,1K,100M')
+    parser.add_argument('--filter', default='',
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='minimum seconds to run each benchmark')
+    parser.add_argument('--no-end-to-end', action='store_true',
+                        help='skip the local HTTP round trip benchmarks')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fractional slowdown counted as a regression')
+    args = parser.parse_args(argv)
+
+    key_sizes = [int(size) for size in args.key_sizes.split(',')]
+    body_sizes = [parse_size(size) for size in args.body_sizes.split(',')]
+
+    results = {}
+    print('%-45s %14s %10s %14s' % ('benchmark', 'ops/sec', 'blocks',
+                                    'peak bytes'))
+    for name, func in benchmarks(key_sizes, body_sizes,
+                                 end_to_end=not args.no_end_to_end):
+        if args.filter not in name:
+            continue
+        results[name] = measure(func, min_time=args.min_time)
+        print('%-45s %14.1f %10d %14d' % (
+            name, results[name]['ops_per_sec'], results[name]['blocks'],
+            results[name]['peak_bytes']))
+
+    if args.save:
+        with open(args.save, 'w') as baseline:
+            json.dump(results, baseline, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressed = compare(results, json.load(baseline), args.threshold)
+        if regressed:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
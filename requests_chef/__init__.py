@@ -14,10 +14,58 @@
 #
 # pylint: disable=wildcard-import
 
-"""requests-chef."""
+"""requests-chef.
 
+The classes below are imported on first use (PEP 562), so a bare
+'import requests_chef' does not load requests or cryptography.
+"""
+
+import importlib
 import os  # noqa
 
-from requests_chef.mixlib_auth import ChefAuth  # noqa
-from requests_chef.mixlib_auth import RSAKey  # noqa
+from requests_chef import __about__
 from requests_chef.__about__ import *  # noqa
+
+# Public names, by the module that defines them.
+_EXPORTS = {
+    'LRUCache': 'cache',
+    'SharedLRUCache': 'cache',
+    'Clock': 'clock',
+    'FixedClock': 'clock',
+    'MultiChefAuth': 'identity',
+    'ChefAuth': 'mixlib_auth',
+    'RSAKey': 'mixlib_auth',
+    'SigningPool': 'pool',
+    'ChefSearch': 'search',
+    'ChefSession': 'session',
+    'SandboxUploader': 'upload',
+    'ChefAuthVerifier': 'verify',
+}
+
+# 'from requests_chef import *' gets the classes through __getattr__.
+__all__ = tuple(sorted(_EXPORTS)) + __about__.__all__
+
+# Submodules that were reachable as attributes when __init__ imported
+# them all, e.g. requests_chef.mixlib_auth.digester.
+_SUBMODULES = frozenset(_EXPORTS.values()) | frozenset(
+    ('instrument', 'presign', 'signers'))
+
+
+def __getattr__(name):
+    """Import an exported class or submodule the first time it is used."""
+    if name in _EXPORTS:
+        module = importlib.import_module(
+            'requests_chef.%s' % _EXPORTS[name])
+        value = getattr(module, name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module('requests_chef.%s' % name)
+    else:
+        raise AttributeError(
+            "module 'requests_chef' has no attribute %r" % name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    """List the lazily imported names too."""
+    return sorted(set(globals()) | set(_EXPORTS) | _SUBMODULES)
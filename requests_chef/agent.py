@@ -0,0 +1,479 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sign with a private key held by a signing agent on a Unix socket.
+
+The agent loads the key once per host, and any number of processes sign
+through it:
+
+    # once per host
+    python -m requests_chef.agent /run/chef-user.sock ~/chef-user.pem
+
+    # in each process
+    key = RSAKey(AgentBackend('/run/chef-user.sock'))
+    auth = ChefAuth('chef-user', key)
+
+Requests that arrive together, from any number of connections, are
+signed as one batch by the agent's backend, and identical payloads in a
+batch are signed once.
+
+Wire format (integers are big-endian):
+
+    request:  algorithm (B), count (I), count x [length (I), data]
+    response: status (B), count (I), count x [length (I), data]
+
+A failed request gets status 1 and a single item, the error message.
+"""
+
+import argparse
+import collections
+from concurrent import futures
+import os
+import socket
+import stat
+import struct
+import tempfile
+import threading
+
+import six
+from six.moves import queue
+from six.moves import socketserver
+
+from requests_chef import mixlib_auth
+from requests_chef import signers
+
+_HEADER = struct.Struct('!BI')
+_LENGTH = struct.Struct('!I')
+
+# Wire codes for the signing algorithms.
+ALGORITHM_CODES = {None: 0, 'sha1': 1, 'sha256': 2}
+_ALGORITHMS = dict((code, name) for name, code in ALGORITHM_CODES.items())
+
+# Limits on a single request, to bound the agent's memory use.
+MAX_COUNT = 4096
+MAX_ITEM_SIZE = 64 * 1024
+
+_OK = 0
+_ERROR = 1
+
+
+class AgentError(RuntimeError):
+
+    """The signing agent could not sign a request."""
+
+
+class MessageTooLarge(ValueError):
+
+    """A message was over MAX_COUNT items or MAX_ITEM_SIZE bytes."""
+
+
+def _pack(code, items):
+    """Return a message with 'code' and 'items'."""
+    parts = [_HEADER.pack(code, len(items))]
+    for item in items:
+        parts.append(_LENGTH.pack(len(item)))
+        parts.append(item)
+    return b''.join(parts)
+
+
+def _error_message(exc):
+    """Return an error reply for 'exc'."""
+    return _pack(_ERROR, [six.text_type(exc).encode('utf_8')])
+
+
+def _read_exact(rfile, size):
+    """Read exactly 'size' bytes from 'rfile'."""
+    data = rfile.read(size)
+    if len(data) < size:
+        raise EOFError('Connection closed mid-message.')
+    return data
+
+
+def _skip(rfile, size):
+    """Read and discard 'size' bytes from 'rfile'."""
+    while size:
+        size -= len(_read_exact(rfile, min(size, MAX_ITEM_SIZE)))
+
+
+def _read_message(rfile):
+    """Read one message from 'rfile', returning (code, items).
+
+    An oversized message is read to its end, without being kept, and
+    MessageTooLarge raised; the connection can be used again after it.
+    """
+    code, count = _HEADER.unpack(_read_exact(rfile, _HEADER.size))
+    items = []
+    error = None
+    if count > MAX_COUNT:
+        error = 'Too many items: %d (at most %d).' % (count, MAX_COUNT)
+    for _ in range(count):
+        size, = _LENGTH.unpack(_read_exact(rfile, _LENGTH.size))
+        if size > MAX_ITEM_SIZE and error is None:
+            error = 'Item too large: %d bytes (at most %d).' % (
+                size, MAX_ITEM_SIZE)
+        if error is None:
+            items.append(_read_exact(rfile, size))
+        else:
+            _skip(rfile, size)
+    if error is not None:
+        raise MessageTooLarge(error)
+    return code, items
+
+
+def _backend(private_key, password=None):
+    """Return the signer backend for any key ChefAuth accepts."""
+    if isinstance(private_key, mixlib_auth.RSAKey):
+        return private_key.backend
+    if isinstance(private_key, signers.SignerBackend):
+        return private_key
+    return mixlib_auth.RSAKey.load_pem(
+        private_key, password=password).backend
+
+
+class _Request(object):
+
+    """Payloads from one connection, waiting to be signed."""
+
+    __slots__ = ('algorithm', 'payloads', 'future')
+
+    def __init__(self, algorithm, payloads):
+        self.algorithm = algorithm
+        self.payloads = payloads
+        self.future = futures.Future()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    """Serve signing requests on one connection."""
+
+    def setup(self):
+        """Track the connection, so shutdown() can close it."""
+        socketserver.StreamRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections.add(self.connection)
+
+    def finish(self):
+        """Stop tracking the connection."""
+        with self.server.lock:
+            self.server.connections.discard(self.connection)
+        socketserver.StreamRequestHandler.finish(self)
+
+    def handle(self):
+        """Answer each request until the client disconnects."""
+        while True:
+            try:
+                code, payloads = _read_message(self.rfile)
+            except MessageTooLarge as exc:
+                self.wfile.write(_error_message(exc))
+                continue
+            except (EOFError, struct.error):
+                return
+            try:
+                if code not in _ALGORITHMS:
+                    raise ValueError('Unknown algorithm code %d.' % code)
+                signatures = self.server.agent.submit(
+                    _ALGORITHMS[code], payloads).result()
+            except Exception as exc:  # pylint: disable=broad-except
+                message = _error_message(exc)
+            else:
+                message = _pack(_OK, signatures)
+            self.wfile.write(message)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path, agent):
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        self.agent = agent
+        self.lock = threading.Lock()
+        self.connections = set()
+
+    def close_connections(self):
+        """Disconnect every client."""
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+class SigningAgent(object):
+
+    """Serve signatures from one private key over a Unix socket.
+
+    :param private_key: Any key ChefAuth accepts (a PEM string or path,
+                        an RSAPrivateKey, an RSAKey) or a SignerBackend.
+    :param path: Path of the Unix socket; it is created readable and
+                 writable by the current user only.
+    :param workers: Threads signing batches.
+    :param max_batch: Most payloads signed in one batch.
+    """
+
+    def __init__(self, private_key, path, workers=1, max_batch=256,
+                 password=None):
+        """Load the key; call start() or serve_forever() to listen."""
+        self.backend = _backend(private_key, password=password)
+        self.path = path
+        self.workers = workers
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._server = None
+        self._threads = []
+
+    def __repr__(self):
+        """Show the socket path and backend."""
+        return '%s(%s, %r)' % (type(self).__name__, self.path, self.backend)
+
+    def __enter__(self):
+        """Start the agent in the background."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop the agent."""
+        self.shutdown()
+
+    def submit(self, algorithm, payloads):
+        """Queue 'payloads' for signing and return a Future."""
+        request = _Request(algorithm, payloads)
+        self._queue.put(request)
+        return request.future
+
+    def _bind(self):
+        """Create the listening socket and the signing threads."""
+        if os.path.exists(self.path):
+            if not stat.S_ISSOCK(os.stat(self.path).st_mode):
+                raise ValueError('%s exists and is not a socket.'
+                                 % self.path)
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except socket.error:
+                # left behind by an agent that did not shut down
+                os.unlink(self.path)
+            else:
+                raise ValueError('An agent is already listening on %s.'
+                                 % self.path)
+            finally:
+                probe.close()
+        self._server = self._listen()
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _listen(self):
+        """Return a _Server on 'path' that only this user can connect to.
+
+        The socket is bound in a new 0700 directory and made 0600 before
+        it is moved to 'path', so other users never get a window in which
+        to connect and sign with the key.
+        """
+        private_dir = tempfile.mkdtemp(
+            prefix='.', dir=os.path.dirname(os.path.abspath(self.path)))
+        bound = os.path.join(private_dir, 's')
+        try:
+            server = _Server(bound, self)
+            try:
+                os.chmod(bound, 0o600)
+                os.rename(bound, self.path)
+            except OSError:
+                server.server_close()
+                raise
+        finally:
+            if os.path.exists(bound):
+                os.unlink(bound)
+            os.rmdir(private_dir)
+        return server
+
+    def start(self):
+        """Listen in a background thread."""
+        self._bind()
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def serve_forever(self):
+        """Listen in this thread until shutdown() is called."""
+        self._bind()
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """Stop listening, finish queued requests and remove the socket."""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server.close_connections()
+        for _ in range(self.workers):
+            self._queue.put(None)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads = []
+        self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _run(self):
+        """Signing thread: sign queued requests in batches."""
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            size = len(request.payloads)
+            while size < self.max_batch:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    # let the loop exit after this batch
+                    self._queue.put(None)
+                    break
+                batch.append(request)
+                size += len(request.payloads)
+            self._sign(batch)
+
+    def _sign(self, batch):
+        """Sign a batch of requests, one backend call per algorithm."""
+        by_algorithm = collections.defaultdict(list)
+        for request in batch:
+            by_algorithm[request.algorithm].append(request)
+        for algorithm, requests in by_algorithm.items():
+            unique = list(collections.OrderedDict.fromkeys(
+                data for request in requests for data in request.payloads))
+            try:
+                signed = dict(zip(unique, self.backend.sign_batch(
+                    unique, algorithm=algorithm)))
+            except Exception as exc:  # pylint: disable=broad-except
+                for request in requests:
+                    request.future.set_exception(exc)
+                continue
+            for request in requests:
+                request.future.set_result(
+                    [signed[data] for data in request.payloads])
+
+
+class AgentBackend(signers.SignerBackend):
+
+    """Sign through a SigningAgent listening on the Unix socket 'path'.
+
+    Each thread (and each process, after a fork) keeps its own
+    connection to the agent.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        """Sign through the agent at 'path'."""
+        self.path = path
+        # an agent holds a single key
+        self.fingerprint = 'agent:%s' % os.path.abspath(path)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __repr__(self):
+        """Show the socket path."""
+        return '%s(%s)' % (type(self).__name__, self.path)
+
+    def _connection(self):
+        """Return this thread's (sock, rfile), connecting if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and conn[0] != os.getpid():
+            # inherited through a fork; the parent keeps using it
+            conn[1].close()
+            conn = None
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except socket.error:
+                sock.close()
+                raise
+            conn = (os.getpid(), sock, sock.makefile('rb'))
+            self._local.conn = conn
+        return conn[1], conn[2]
+
+    def close(self):
+        """Close this thread's connection to the agent."""
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            conn[2].close()
+            conn[1].close()
+
+    def sign(self, data, algorithm=None):
+        """Return the raw PKCS1v15 signature of 'data'."""
+        return self.sign_batch([data], algorithm=algorithm)[0]
+
+    def sign_batch(self, payloads, algorithm=None):
+        """Sign all of 'payloads', MAX_COUNT per round trip to the agent."""
+        payloads = [data if isinstance(data, six.binary_type)
+                    else data.encode('utf_8') for data in payloads]
+        signatures = []
+        for start in range(0, len(payloads), MAX_COUNT):
+            signatures.extend(self._round_trip(_pack(
+                ALGORITHM_CODES[algorithm],
+                payloads[start:start + MAX_COUNT])))
+        return signatures
+
+    def _round_trip(self, message):
+        """Send one request message and return the signatures."""
+        # signing is idempotent, so a request on a connection the agent
+        # has since dropped (e.g. it restarted) is retried once
+        for attempt in range(2):
+            try:
+                sock, rfile = self._connection()
+                sock.sendall(message)
+                status, items = _read_message(rfile)
+                break
+            except (socket.error, EOFError):
+                self.close()
+                if attempt:
+                    raise
+        if status != _OK:
+            raise AgentError(items[0].decode('utf_8'))
+        return items
+
+
+def main(argv=None):
+    """Run a signing agent until interrupted."""
+    parser = argparse.ArgumentParser(
+        prog='python -m requests_chef.agent',
+        description='Serve Chef request signatures over a Unix socket.')
+    parser.add_argument('socket', help='path of the Unix socket')
+    parser.add_argument('key', help='path of the PEM private key')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='signing threads (default: %(default)s)')
+    parser.add_argument('--max-batch', type=int, default=256,
+                        help='most payloads per batch (default: %(default)s)')
+    args = parser.parse_args(argv)
+    agent = SigningAgent(args.key, args.socket, workers=args.workers,
+                         max_batch=args.max_batch)
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.shutdown()
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,216 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Chef authentication for asyncio clients (Python 3 only).
+
+AsyncChefAuth runs the same signing core as ChefAuth (sign_request) in
+an executor, so hashing and RSA signing never block the event loop and
+both paths produce identical headers.
+
+With httpx:
+
+    auth = AsyncChefAuth('chef-user', '~/chef-user.pem')
+    async with httpx.AsyncClient(auth=auth.httpx_auth()) as client:
+        await client.get('https://chef.example.com/nodes')
+
+With aiohttp (3.12+ client middlewares):
+
+    async with aiohttp.ClientSession(
+            middlewares=(auth.aiohttp_middleware,)) as session:
+        await session.get('https://chef.example.com/nodes')
+
+On the server side, ASGIMiddleware verifies signed requests before they
+reach an ASGI app.
+"""
+
+import asyncio
+
+from six.moves.urllib import parse as urlparse
+
+from requests_chef import mixlib_auth
+from requests_chef import verify
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+
+class AsyncChefAuth(object):
+
+    """Sign requests with user's private key without blocking the loop.
+
+    Takes the same arguments as ChefAuth, or an existing ChefAuth as the
+    only argument. 'executor' is passed to loop.run_in_executor; the
+    default executor is used if it is None.
+    """
+
+    def __init__(self, user_id, private_key=None, executor=None, **kwargs):
+        """Wrap (or build) the ChefAuth used to sign."""
+        if isinstance(user_id, mixlib_auth.ChefAuth):
+            self.auth = user_id
+        else:
+            self.auth = mixlib_auth.ChefAuth(user_id, private_key, **kwargs)
+        self.executor = executor
+
+    def __repr__(self):
+        """Show the auth handler object."""
+        return '%s(%s)' % (type(self).__name__, self.auth.user_id)
+
+    async def sign(self, method, path_url, body=None, timestamp=None):
+        """Return the auth headers for a request.
+
+        Unlike ChefAuth.sign_request the body is not returned, so it
+        must be bytes, text or a seekable file (not a generator).
+        """
+        headers, _ = await self.sign_request(
+            method, path_url, body=body, timestamp=timestamp)
+        return headers
+
+    async def sign_request(self, method, path_url, body=None,
+                           timestamp=None):
+        """Run ChefAuth.sign_request in the executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.auth.sign_request,
+            method, path_url, body, timestamp)
+
+    async def aiohttp_middleware(self, request, handler):
+        """Sign an aiohttp ClientRequest, for ClientSession(middlewares=)."""
+        body = request.body
+        if hasattr(body, 'as_bytes'):
+            body = await body.as_bytes()
+        headers = await self.sign(
+            request.method, request.url.raw_path_qs, body=body)
+        request.headers.update(headers)
+        return await handler(request)
+
+    def httpx_auth(self):
+        """Return an httpx.Auth that signs with this object."""
+        if httpx is None:
+            raise ImportError("httpx is required for httpx_auth().")
+        return _HTTPXChefAuth(self)
+
+
+if httpx is not None:
+
+    class _HTTPXChefAuth(httpx.Auth):
+
+        """httpx auth flow, signing in the executor for async clients."""
+
+        requires_request_body = True
+
+        def __init__(self, signer):
+            """Sign with 'signer', an AsyncChefAuth."""
+            self.signer = signer
+
+        def auth_flow(self, request):
+            """Sign the request inline, for synchronous clients."""
+            headers, _ = self.signer.auth.sign_request(
+                request.method, request.url.raw_path.decode('ascii'),
+                request.content)
+            request.headers.update(headers)
+            yield request
+
+        async def async_auth_flow(self, request):
+            """Sign the request without blocking the event loop."""
+            headers = await self.signer.sign(
+                request.method, request.url.raw_path.decode('ascii'),
+                body=request.content)
+            request.headers.update(headers)
+            yield request
+
+
+class ASGIMiddleware(object):
+
+    """Verify requests before passing them to an ASGI app.
+
+    The asyncio counterpart of verify.WSGIMiddleware: unsigned or badly
+    signed HTTP requests get a 401 with a Chef-style JSON error, and
+    verified ones reach 'app' with the client's user id in
+    scope[scope_key]. The body is read (to check its hash) and replayed
+    to the app. Verifying a public-key signature is cheap, so it runs on
+    the loop.
+    """
+
+    def __init__(self, app, verifier, scope_key='chef.user_id'):
+        """Wrap 'app', verifying with a verify.ChefAuthVerifier."""
+        self.app = app
+        self.verifier = verifier
+        self.scope_key = scope_key
+
+    async def __call__(self, scope, receive, send):
+        """Verify an HTTP request, then call the app or answer 401."""
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        body = await _read_body(receive)
+        headers = dict((name.decode('latin-1'), value.decode('latin-1'))
+                       for name, value in scope['headers']
+                       if name[:6].lower() == b'x-ops-')
+        try:
+            user_id = self.verifier.verify(
+                scope['method'], _asgi_path(scope), headers, body)
+        except verify.AuthenticationError as exc:
+            await _unauthorized(send, exc)
+            return
+        scope = dict(scope)
+        scope[self.scope_key] = user_id
+        await self.app(scope, _replay(body, receive), send)
+
+
+async def _read_body(receive):
+    """Return the whole request body (what arrived, on a disconnect)."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def _asgi_path(scope):
+    """Return the request path as the client sent (and signed) it."""
+    raw_path = scope.get('raw_path')
+    if raw_path:
+        return raw_path.decode('latin-1').partition('?')[0]
+    return urlparse.quote(
+        (scope.get('root_path', '') + scope['path']).encode('utf_8'))
+
+
+def _replay(body, receive):
+    """Return a receive() that yields 'body' once, then defers."""
+    sent = []
+
+    async def replay():
+        if not sent:
+            sent.append(True)
+            return {'type': 'http.request', 'body': body,
+                    'more_body': False}
+        return await receive()
+
+    return replay
+
+
+async def _unauthorized(send, exc):
+    """Send a 401 response for an AuthenticationError."""
+    payload = verify.error_document(exc)
+    await send({
+        'type': 'http.response.start',
+        'status': 401,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(payload)).encode('ascii'))],
+    })
+    await send({'type': 'http.response.body', 'body': payload})
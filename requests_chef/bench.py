@@ -0,0 +1,632 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load test a Chef server with signed requests.
+
+    # against a local fake_server.FakeChefServer, in its own process
+    requests-chef-bench --requests 5000 --concurrency 32
+
+    # against a real Chef server
+    requests-chef-bench --url https://chef.example.com/organizations/acme \\
+        --user chef-user --key ~/chef-user.pem --mix get=8,search=1,put=1
+
+Requests are drawn from a weighted --mix of GET nodes/<name>, a node
+search, and PUTs of --put-size bytes to data bag items (in the
+--data-bag data bag, created if missing). They are sent from threads,
+processes (each with its own threads) or an asyncio loop (with httpx),
+and signed in one of the --signing modes of mixlib_auth, so runs can be
+compared to size client pools and choose a mode.
+
+The report gives throughput, latency percentiles (per kind of request
+too) and the share of the request time spent signing. Python 3 only;
+asyncio mode needs httpx.
+"""
+
+import argparse
+import asyncio
+import bisect
+import collections
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+
+from concurrent import futures
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from six.moves.urllib import parse as urlparse
+
+from requests_chef import aio
+from requests_chef import cache
+from requests_chef import fake_server
+from requests_chef import instrument as instruments
+from requests_chef import mixlib_auth
+from requests_chef import pool
+from requests_chef import session as sessions
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+KINDS = ('get', 'search', 'put')
+
+SIGNING_MODES = ('plain', 'cache', 'pool', 'presign')
+
+CONCURRENCY_MODES = ('thread', 'process', 'asyncio')
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+_SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+# Result of one request: its kind, HTTP status (0 if it failed to send)
+# and latency in seconds.
+Record = collections.namedtuple('Record', 'kind status seconds')
+
+
+def parse_mix(text):
+    """Return [(kind, weight)] from 'get=8,search=1,put=1'."""
+    mix = []
+    for term in text.split(','):
+        kind, _, weight = term.strip().partition('=')
+        if kind not in KINDS:
+            raise ValueError('Unknown request kind %r; choose from %s.'
+                             % (kind, ', '.join(KINDS)))
+        weight = float(weight or 1)
+        if weight < 0:
+            raise ValueError('Weight of %r must not be negative.' % kind)
+        if weight:
+            mix.append((kind, weight))
+    if not mix:
+        raise ValueError('The request mix is empty.')
+    return mix
+
+
+def parse_size(text):
+    """Return a number of bytes from e.g. '512', '64k' or '1M'."""
+    text = text.strip().lower().rstrip('b')
+    unit = text[-1:] if text[-1:] in _SIZE_UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * _SIZE_UNITS[unit])
+
+
+def schedule(mix, count, seed=0):
+    """Return 'count' request kinds drawn from 'mix', reproducibly."""
+    kinds = [kind for kind, _ in mix]
+    bounds = []
+    total = 0
+    for _, weight in mix:
+        total += weight
+        bounds.append(total)
+    draw = random.Random(seed).random
+    return [kinds[bisect.bisect(bounds, draw() * total)]
+            for _ in range(count)]
+
+
+def percentile(ordered, percent):
+    """Return the nearest-rank 'percent' percentile of sorted values."""
+    if not ordered:
+        return 0.0
+    rank = int(len(ordered) * percent / 100.0 + 0.5)
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+class Workload(object):
+
+    """The requests of each kind: (method, path, body) by kind and index.
+
+    :param nodes: Node names to GET, in turn.
+    :param put_size: Bytes in each PUT body.
+    :param data_bag: Data bag the PUT items are kept in.
+    :param items: Number of data bag items PUT in turn.
+    :param query: Node search query.
+    """
+
+    def __init__(self, nodes, put_size=1024 ** 2,
+                 data_bag='requests-chef-bench', items=8, query='*:*'):
+        """Build the PUT bodies up front, so they are not timed."""
+        self.nodes = list(nodes)
+        self.put_size = put_size
+        self.data_bag = data_bag
+        self.items = ['item-%d' % i for i in range(items)]
+        self.query = query
+        self.bodies = dict((item, self._body(item)) for item in self.items)
+
+    def _body(self, item):
+        """Return a data bag item of (at least) 'put_size' bytes."""
+        overhead = len(json.dumps({'id': item, 'data': ''}))
+        return json.dumps({
+            'id': item, 'data': 'x' * max(self.put_size - overhead, 0),
+        }).encode('utf_8')
+
+    def request(self, kind, index):
+        """Return the (method, path, body) of request 'index' of 'kind'."""
+        if kind == 'get':
+            node = self.nodes[index % len(self.nodes)]
+            return 'GET', 'nodes/%s' % node, None
+        if kind == 'search':
+            return 'GET', 'search/node?%s' % urlparse.urlencode(
+                {'q': self.query, 'rows': 10}), None
+        item = self.items[index % len(self.items)]
+        return ('PUT', 'data/%s/%s' % (self.data_bag, item),
+                self.bodies[item])
+
+    def get_paths(self):
+        """Return the paths of every GET request, to presign."""
+        return [self.request('get', index)[1]
+                for index in range(len(self.nodes))] + [
+                    self.request('search', 0)[1]]
+
+
+def prepare(session, mix, put_size, data_bag):
+    """Return the Workload for 'mix', creating what it needs first.
+
+    Looks up the nodes to GET and creates the data bag and items to PUT
+    (if they are not there already).
+    """
+    kinds = set(kind for kind, _ in mix)
+    nodes = []
+    if 'get' in kinds:
+        response = session.get('nodes')
+        response.raise_for_status()
+        nodes = sorted(response.json())[:100]
+        if not nodes:
+            raise ValueError('The server has no nodes to GET.')
+    workload = Workload(nodes, put_size=put_size, data_bag=data_bag)
+    if 'put' in kinds:
+        _ensure_created(session.post('data', json={'name': data_bag}))
+        for item in workload.items:
+            _ensure_created(session.post('data/%s' % data_bag,
+                                         json={'id': item}))
+    return workload
+
+
+def _ensure_created(response):
+    """Raise for a failed POST, unless the object already existed."""
+    if response.status_code != 409:
+        response.raise_for_status()
+
+
+class SignTimes(instruments.Instrument):
+
+    """An instrument collecting the seconds each request took to sign."""
+
+    def __init__(self):
+        """Start with no timings."""
+        self.seconds = []
+
+    def record(self, timings, body_bytes):
+        """Keep the total signing time."""
+        # list.append is atomic, so threads need no lock
+        self.seconds.append(timings['total'])
+
+
+def make_auth(config, instrument=None, workload=None):
+    """Return (ChefAuth, SigningPool or None) for config['signing'].
+
+    In presign mode, the GET requests of 'workload' are presigned.
+    """
+    private_key = config['key']
+    signing_pool = None
+    if config['signing'] == 'pool':
+        signing_pool = private_key = pool.SigningPool(
+            private_key, max_workers=config['pool_workers'])
+    auth = mixlib_auth.ChefAuth(
+        config['user'], private_key, protocol=config['protocol'],
+        instrument=instrument,
+        signature_cache=(cache.LRUCache() if config['signing'] == 'cache'
+                         else None))
+    if workload is not None and config['signing'] == 'presign':
+        base_url = config['url'].rstrip('/') + '/'
+        for path in workload.get_paths():
+            auth.presign('GET', urlparse.urlsplit(
+                urlparse.urljoin(base_url, path)).path)
+    return auth, signing_pool
+
+
+def _close_auth(auth, signing_pool):
+    """Cancel presigned headers and stop the signing pool."""
+    auth.unpresign()
+    if signing_pool is not None:
+        signing_pool.shutdown()
+
+
+def _slots(kinds, worker, workers, deadline):
+    """Yield (index, kind) for one of 'workers', until 'deadline'.
+
+    Without a deadline, the worker's share of 'kinds' is run once;
+    with one, it is repeated until the deadline has passed.
+    """
+    while True:
+        for index in range(worker, len(kinds), workers):
+            if deadline is not None and instruments.timer() >= deadline:
+                return
+            yield index, kinds[index]
+        if deadline is None:
+            return
+
+
+def _send_all(session, workload, slots, records):
+    """Send the requests of 'slots', appending a Record for each."""
+    for index, kind in slots:
+        method, path, body = workload.request(kind, index)
+        start = instruments.timer()
+        try:
+            status = session.request(method, path, data=body).status_code
+        except IOError:
+            status = 0
+        records.append(Record(kind, status, instruments.timer() - start))
+
+
+def run_threads(config, workload, kinds, duration=None, barrier=None):
+    """Send 'kinds' from config['threads'] threads of a ChefSession.
+
+    Returns (records, seconds spent signing each request, elapsed
+    seconds). The run starts once everything is set up and 'barrier',
+    if any, has been passed.
+    """
+    sign_times = SignTimes()
+    auth, signing_pool = make_auth(config, sign_times, workload)
+    session = sessions.ChefSession(config['url'], auth=auth,
+                                   pool_maxsize=config['threads'],
+                                   max_retries=0)
+    session.headers['Content-Type'] = 'application/json'
+    records = []
+    threads = config['threads']
+    try:
+        if barrier is not None:
+            barrier.wait()
+        del sign_times.seconds[:]
+        start = instruments.timer()
+        deadline = None if duration is None else start + duration
+        workers = [threading.Thread(target=_send_all, args=(
+            session, workload, _slots(kinds, worker, threads, deadline),
+            records)) for worker in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = instruments.timer() - start
+    finally:
+        session.close()
+        _close_auth(auth, signing_pool)
+    return records, sign_times.seconds, elapsed
+
+
+def _process_worker(config, workload, kinds, duration, barrier):
+    """Run one process's threads, returning picklable results."""
+    records, sign_seconds, elapsed = run_threads(
+        config, workload, kinds, duration=duration, barrier=barrier)
+    return [tuple(record) for record in records], sign_seconds, elapsed
+
+
+def run_processes(config, workload, kinds, duration=None):
+    """Split 'kinds' across config['processes'] processes of threads.
+
+    The processes start sending together, after they have all started.
+    """
+    processes = config['processes']
+    manager = multiprocessing.Manager()
+    try:
+        barrier = manager.Barrier(processes)
+        with futures.ProcessPoolExecutor(processes) as executor:
+            results = list(executor.map(
+                _process_worker, [config] * processes,
+                [workload] * processes,
+                [kinds[worker::processes] for worker in range(processes)],
+                [duration] * processes, [barrier] * processes))
+    finally:
+        manager.shutdown()
+    records = [Record(*record) for result in results
+               for record in result[0]]
+    sign_seconds = [seconds for result in results for seconds in result[1]]
+    return records, sign_seconds, max(result[2] for result in results)
+
+
+async def _send_tasks(client, workload, slots, records):
+    """Send the requests of 'slots' with httpx, appending Records."""
+    for index, kind in slots:
+        method, path, body = workload.request(kind, index)
+        start = instruments.timer()
+        try:
+            status = (await client.request(method, path,
+                                           content=body)).status_code
+        except httpx.TransportError:
+            status = 0
+        records.append(Record(kind, status, instruments.timer() - start))
+
+
+async def _run_tasks(config, workload, kinds, duration, signer):
+    """Send 'kinds' from config['threads'] tasks; return (records, secs)."""
+    tasks = config['threads']
+    records = []
+    async with httpx.AsyncClient(
+            base_url=config['url'].rstrip('/') + '/',
+            auth=signer.httpx_auth(), timeout=60.0,
+            headers={'Accept': 'application/json',
+                     'Content-Type': 'application/json'},
+            limits=httpx.Limits(max_connections=tasks)) as client:
+        start = instruments.timer()
+        deadline = None if duration is None else start + duration
+        await asyncio.gather(*[_send_tasks(
+            client, workload, _slots(kinds, task, tasks, deadline), records)
+            for task in range(tasks)])
+        elapsed = instruments.timer() - start
+    return records, elapsed
+
+
+def run_asyncio(config, workload, kinds, duration=None):
+    """Send 'kinds' from config['threads'] asyncio tasks, with httpx.
+
+    Requests are signed by an AsyncChefAuth in a pool of
+    config['sign_threads'] threads.
+    """
+    sign_times = SignTimes()
+    auth, signing_pool = make_auth(config, sign_times, workload)
+    executor = futures.ThreadPoolExecutor(config['sign_threads'])
+    try:
+        del sign_times.seconds[:]
+        records, elapsed = asyncio.run(_run_tasks(
+            config, workload, kinds, duration,
+            aio.AsyncChefAuth(auth, executor=executor)))
+    finally:
+        executor.shutdown()
+        _close_auth(auth, signing_pool)
+    return records, sign_times.seconds, elapsed
+
+
+RUNNERS = {
+    'thread': run_threads,
+    'process': run_processes,
+    'asyncio': run_asyncio,
+}
+
+
+def summarize(records, sign_seconds, elapsed):
+    """Return the report for a run, as a dict (latencies in ms)."""
+    ordered = sorted(record.seconds for record in records)
+    total = sum(ordered)
+    statuses = collections.Counter(record.status for record in records)
+    report = {
+        'requests': len(records),
+        'seconds': elapsed,
+        'throughput': len(records) / elapsed if elapsed else 0.0,
+        'errors': sum(count for status, count in statuses.items()
+                      if not 200 <= status < 300),
+        'statuses': dict((str(status), count)
+                         for status, count in statuses.items()),
+        'latency_ms': _latencies(ordered),
+        'signed': len(sign_seconds),
+        'signing_share': sum(sign_seconds) / total if total else 0.0,
+        'sign_ms': 1000.0 * sum(sign_seconds) / max(len(sign_seconds), 1),
+        'kinds': {},
+    }
+    for kind in KINDS:
+        latencies = sorted(record.seconds for record in records
+                           if record.kind == kind)
+        if latencies:
+            report['kinds'][kind] = dict(_latencies(latencies),
+                                         count=len(latencies))
+    return report
+
+
+def _latencies(ordered):
+    """Return the mean, percentiles and max of sorted seconds, in ms."""
+    latencies = {
+        'mean': 1000.0 * sum(ordered) / max(len(ordered), 1),
+        'max': 1000.0 * (ordered[-1] if ordered else 0.0),
+    }
+    for percent in PERCENTILES:
+        latencies['p%g' % percent] = 1000.0 * percentile(ordered, percent)
+    return latencies
+
+
+def format_report(report):
+    """Return the report as text."""
+    columns = ['mean'] + ['p%g' % percent for percent in PERCENTILES] + [
+        'max']
+    lines = [
+        '%d requests in %.2fs: %.1f requests/s, %d errors %s' % (
+            report['requests'], report['seconds'], report['throughput'],
+            report['errors'], json.dumps(report['statuses'],
+                                         sort_keys=True)),
+        'signing: %.1f%% of request time, %.3f ms per signature '
+        '(%d signed)' % (100 * report['signing_share'], report['sign_ms'],
+                         report['signed']),
+        '',
+        '%-8s %7s ' % ('ms', 'count') + ' '.join(
+            '%8s' % column for column in columns),
+    ]
+    rows = [('all', dict(report['latency_ms'], count=report['requests']))]
+    rows.extend((kind, report['kinds'][kind]) for kind in KINDS
+                if kind in report['kinds'])
+    for name, latencies in rows:
+        lines.append('%-8s %7d ' % (name, latencies['count']) + ' '.join(
+            '%8.2f' % latencies[column] for column in columns))
+    return '\n'.join(lines)
+
+
+def generate_key():
+    """Return a new PEM private key, for the local server's client."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(serialization.Encoding.PEM,
+                             serialization.PrivateFormat.TraditionalOpenSSL,
+                             serialization.NoEncryption())
+
+
+def _serve(clients, nodes, conn):
+    """Run a FakeChefServer, sending its URL on 'conn' until told to stop."""
+    server = fake_server.FakeChefServer(
+        clients, nodes=fake_server.make_nodes(nodes))
+    conn.send(server.start())
+    try:
+        conn.recv()
+    except EOFError:
+        pass
+    finally:
+        server.stop()
+
+
+class LocalServer(object):
+
+    """A FakeChefServer in a child process, so it has a CPU of its own."""
+
+    def __init__(self, clients, nodes=100):
+        """Serve 'clients' (a dict of {user_id: key}) and 'nodes' nodes."""
+        self.clients = clients
+        self.nodes = nodes
+        self.url = None
+        self._conn = None
+        self._process = None
+
+    def __enter__(self):
+        """Start the server; 'url' is its organization URL."""
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(self.clients, self.nodes, child))
+        self._process.daemon = True
+        self._process.start()
+        self.url = self._conn.recv()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop the server."""
+        self._conn.send(None)
+        self._process.join()
+
+
+def _argument(parse):
+    """Return 'parse' as an argparse type, reporting its ValueErrors."""
+    def argument(text):
+        try:
+            return parse(text)
+        except ValueError as exc:
+            raise argparse.ArgumentTypeError(str(exc))
+    argument.__name__ = parse.__name__
+    return argument
+
+
+def build_parser():
+    """Return the command line parser."""
+    parser = argparse.ArgumentParser(
+        prog='requests-chef-bench',
+        description='Load test a Chef server with signed requests.')
+    parser.add_argument('--url', help='Chef organization URL (default: a '
+                        'local fake server)')
+    parser.add_argument('--user', default='requests-chef-bench',
+                        help='client to sign as (default: %(default)s)')
+    parser.add_argument('--key', help="the client's private key file "
+                        '(default for the local server: a new key)')
+    parser.add_argument('--mix', type=_argument(parse_mix),
+                        default='get=8,search=1,put=1',
+                        help='weights of the get, search and put requests '
+                        '(default: %(default)s)')
+    parser.add_argument('--put-size', type=_argument(parse_size),
+                        default='1M',
+                        help='bytes in each PUT body (default: %(default)s)')
+    parser.add_argument('--data-bag', default='requests-chef-bench',
+                        help='data bag PUT to (default: %(default)s)')
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='requests to send (default: %(default)s)')
+    parser.add_argument('--duration', type=float,
+                        help='send requests for this many seconds instead')
+    parser.add_argument('--mode', choices=CONCURRENCY_MODES,
+                        default='thread', help='concurrency (default: '
+                        '%(default)s)')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='requests in flight; threads, or asyncio '
+                        'tasks (default: %(default)s)')
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='processes to split --concurrency across in '
+                        'process mode (default: %(default)s)')
+    parser.add_argument('--signing', choices=SIGNING_MODES, default='plain',
+                        help='plain, with a signature cache, in a signing '
+                        'pool, or with presigned GETs (default: '
+                        '%(default)s)')
+    parser.add_argument('--protocol', default='1.0',
+                        choices=sorted(mixlib_auth.PROTOCOLS),
+                        help='signing protocol (default: %(default)s)')
+    parser.add_argument('--pool-workers', type=int,
+                        help='signing pool processes (default: one per CPU)')
+    parser.add_argument('--sign-threads', type=int, default=4,
+                        help='signing threads in asyncio mode (default: '
+                        '%(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for the request mix (default: '
+                        '%(default)s)')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    return parser
+
+
+def _config(args, url, key):
+    """Return the picklable run configuration."""
+    processes = args.processes if args.mode == 'process' else 1
+    processes = max(min(processes, args.concurrency), 1)
+    return {
+        'url': url,
+        'user': args.user,
+        'key': key,
+        'protocol': args.protocol,
+        'signing': args.signing,
+        'pool_workers': args.pool_workers,
+        'processes': processes,
+        'threads': max(args.concurrency // processes, 1),
+        'sign_threads': args.sign_threads,
+    }
+
+
+def bench(args, url, key):
+    """Prepare and run the benchmark against 'url'; return the report."""
+    config = _config(args, url, key)
+    auth, _ = make_auth(dict(config, signing='plain'))
+    session = sessions.ChefSession(url, auth=auth)
+    try:
+        workload = prepare(session, args.mix, args.put_size, args.data_bag)
+    finally:
+        session.close()
+    kinds = schedule(args.mix, args.requests, seed=args.seed)
+    records, sign_seconds, elapsed = RUNNERS[args.mode](
+        config, workload, kinds, duration=args.duration)
+    return summarize(records, sign_seconds, elapsed)
+
+
+def main(argv=None):
+    """Run the benchmark and print the report."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.url and not args.key:
+        parser.error('--key is required with --url')
+    if args.mode == 'asyncio' and httpx is None:
+        parser.error('--mode asyncio requires httpx')
+    key = args.key
+    if key is not None:
+        with open(os.path.expanduser(key), 'rb') as pem:
+            key = pem.read()
+    if args.url:
+        report = bench(args, args.url, key)
+    else:
+        key = key or generate_key()
+        with LocalServer({args.user: key}) as server:
+            report = bench(args, server.url, key)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(format_report(report))
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,241 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded caches used to skip repeated signing work."""
+
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from six.moves import cPickle as pickle
+
+_clock = getattr(time, 'monotonic', time.time)
+
+# SharedLRUCache's clock, which must be the same in every process.
+_wall_clock = time.time
+
+
+class LRUCache(object):
+
+    """Thread-safe LRU cache whose entries also expire after 'ttl' seconds.
+
+    Entries never expire if 'ttl' is None. Lookups are counted in 'hits'
+    and 'misses'.
+    """
+
+    def __init__(self, maxsize=1024, ttl=5.0):
+        """Bound the cache to 'maxsize' entries of at most 'ttl' seconds."""
+        if maxsize < 1:
+            raise ValueError("'maxsize' must be at least 1.")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """Show the cache size and counters."""
+        return '%s(size=%d, hits=%d, misses=%d)' % (
+            type(self).__name__, len(self), self.hits, self.misses)
+
+    def __len__(self):
+        """Return the number of entries, including expired ones."""
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Return the cached value for 'key', or 'default'."""
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < _clock():
+                self.misses += 1
+                return default
+            # reinsert as the most recently used entry
+            self._data[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Cache 'value' under 'key', evicting the oldest entry if full."""
+        with self._lock:
+            self._data.pop(key, None)
+            expires = None if self.ttl is None else _clock() + self.ttl
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class SharedLRUCache(object):
+
+    """LRU cache shared by every process on a host, stored in SQLite.
+
+    A drop-in for LRUCache (e.g. as ChefAuth's signature_cache or
+    content_hash_cache) for pre-forked workers signing as the same
+    client: one worker's signatures and file hashes are hits for the
+    others. Keys must have a stable repr() (bytes, text, numbers and
+    tuples of them). Values are pickled, so anyone who can write to the
+    file can run code in every process that uses the cache: only point
+    'path' at a file no other user can write to. The file is created
+    mode 0600.
+
+    Entries expire 'ttl' seconds (of wall clock time, which the processes
+    share) after they are set, or never if 'ttl' is None, and the least
+    recently used entries are evicted beyond 'maxsize'. Give each cache
+    its own file: 'maxsize' bounds everything in the file. 'hits' and
+    'misses' count this process's lookups only.
+
+    A hit records when the entry was used at most every 'touch_interval'
+    seconds, since each record is a write and writes from all processes
+    take turns. A database error (e.g. 'database is locked' after
+    'timeout') makes get() a miss and set() a no-op, and an entry that
+    does not unpickle (e.g. truncated by a crash) is dropped as a miss,
+    so the cache never fails a request.
+    """
+
+    def __init__(self, path, maxsize=1024, ttl=5.0, timeout=5.0,
+                 touch_interval=1.0):
+        """Use (or create) the cache database at 'path'.
+
+        :param timeout: Seconds to wait for another process's write.
+        :param touch_interval: Seconds of use an entry's LRU position may
+                               lag behind.
+        """
+        if maxsize < 1:
+            raise ValueError("'maxsize' must be at least 1.")
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timeout = timeout
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        # create the file before sqlite3 does, so it is not world readable
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key BLOB PRIMARY KEY, value BLOB, expires REAL, used REAL)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+
+    def __repr__(self):
+        """Show the path and counters."""
+        return '%s(%r, hits=%d, misses=%d)' % (
+            type(self).__name__, self.path, self.hits, self.misses)
+
+    def __len__(self):
+        """Return the number of entries, including expired ones."""
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def _connection(self):
+        """Return this thread's connection, reopened after a fork."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                         isolation_level=None)
+            # a cache may lose writes on a crash, but not block on fsync
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    @staticmethod
+    def _key(key):
+        """Return the stored form of 'key'."""
+        return sqlite3.Binary(
+            hashlib.sha256(repr(key).encode('utf_8')).digest())
+
+    def get(self, key, default=None):
+        """Return the cached value for 'key', or 'default'."""
+        stored_key = self._key(key)
+        try:
+            value = self._get(stored_key)
+        except sqlite3.Error:
+            value = None
+        if value is not None:
+            try:
+                value = pickle.loads(bytes(value))
+            except Exception:  # pylint: disable=broad-except
+                # corrupt, truncated or pickled by another version
+                self._discard(stored_key)
+            else:
+                self.hits += 1
+                return value
+        self.misses += 1
+        return default
+
+    def _get(self, stored_key):
+        """Return the pickled value under 'stored_key', or None."""
+        now = _wall_clock()
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT value, expires, used FROM entries WHERE key = ?',
+            (stored_key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < now):
+            return None
+        if now - row[2] >= self.touch_interval:
+            connection.execute('UPDATE entries SET used = ? WHERE key = ?',
+                               (now, stored_key))
+        return row[0]
+
+    def _discard(self, stored_key):
+        """Delete the entry under 'stored_key', if the database allows."""
+        try:
+            self._connection().execute('DELETE FROM entries WHERE key = ?',
+                                       (stored_key,))
+        except sqlite3.Error:
+            pass
+
+    def set(self, key, value):
+        """Cache 'value' under 'key', evicting the oldest entries if full."""
+        payload = sqlite3.Binary(
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        try:
+            self._set(self._key(key), payload)
+        except sqlite3.Error:
+            pass
+
+    def _set(self, stored_key, payload):
+        """Store 'payload' under 'stored_key' and evict beyond maxsize."""
+        now = _wall_clock()
+        expires = None if self.ttl is None else now + self.ttl
+        with self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                (stored_key, payload, expires, now))
+            connection.execute(
+                'DELETE FROM entries WHERE key IN (SELECT key FROM entries '
+                'ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.maxsize,))
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        self._connection().execute('DELETE FROM entries')
+        self.hits = 0
+        self.misses = 0
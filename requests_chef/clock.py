@@ -0,0 +1,90 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Clocks producing X-Ops-Timestamp values.
+
+Timestamps have one second resolution, so a Clock formats each
+wall-clock second once and hands out the cached string until the next
+second. The cache is a single tuple, replaced atomically, so clocks can
+be shared by threads without locking.
+"""
+
+import calendar
+import datetime
+import re
+import time
+
+DATETIME_FMT = '%Y-%m-%dT%H:%M:%SZ'
+
+_TIMESTAMP = re.compile(r'^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)Z$')
+
+
+def parse_timestamp(timestamp):
+    """Return seconds since the epoch for an X-Ops-Timestamp value."""
+    match = _TIMESTAMP.match(timestamp)
+    if match is None:
+        raise ValueError('Bad X-Ops-Timestamp %r.' % timestamp)
+    return calendar.timegm(tuple(int(field) for field in match.groups()))
+
+
+class Clock(object):
+
+    """Source of X-Ops-Timestamp values.
+
+    :param offset: Seconds added to the local time, to correct for a
+                   host clock that has drifted from the Chef server's.
+    :param time_func: Returns the current time in seconds since the
+                      epoch; time.time by default.
+    """
+
+    def __init__(self, offset=0.0, time_func=time.time):
+        """Create a clock reading 'time_func' shifted by 'offset'."""
+        self.offset = offset
+        self._time = time_func
+        self._cached = (None, None)
+
+    def __repr__(self):
+        """Show the clock offset."""
+        return '%s(offset=%r)' % (type(self).__name__, self.offset)
+
+    def time(self):
+        """Return the corrected time in seconds since the epoch."""
+        return self._time() + self.offset
+
+    def correct(self, server_time):
+        """Set the offset so the clock reads 'server_time' now."""
+        self.offset = server_time - self._time()
+
+    def timestamp(self):
+        """Return the current X-Ops-Timestamp value."""
+        second = int(self.time())
+        cached_second, formatted = self._cached
+        if second != cached_second:
+            formatted = time.strftime(DATETIME_FMT, time.gmtime(second))
+            self._cached = (second, formatted)
+        return formatted
+
+
+class FixedClock(Clock):
+
+    """A clock stopped at 'when', a UTC datetime or seconds since epoch."""
+
+    def __init__(self, when, offset=0.0):
+        """Stop the clock at 'when'."""
+        if isinstance(when, datetime.datetime):
+            when = calendar.timegm(when.utctimetuple())
+        super(FixedClock, self).__init__(offset=offset,
+                                         time_func=lambda: when)
+
+
+# The clock shared by ChefAuth instances that are not given one.
+DEFAULT_CLOCK = Clock()
@@ -0,0 +1,515 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local stand-in for the Chef server API, for tests and load tests.
+
+    with FakeChefServer({'chef-user': '~/chef-user.pem'}) as server:
+        session = ChefSession(server.url, 'chef-user', '~/chef-user.pem')
+        session.get('/nodes/node-1').json()
+
+Every request must be signed (protocol 1.0, 1.1 or 1.3) by one of the
+given clients, with a timestamp inside the allowed clock skew, as checked
+by a verify.ChefAuthVerifier. The server serves canned nodes, roles and
+search, keeps data bags, and accepts sandbox uploads.
+
+The server runs an asyncio event loop in a background thread (Python 3
+only), so it holds thousands of concurrent keep-alive connections.
+To run one from the command line:
+
+    python -m requests_chef.fake_server --client chef-user=chef-user.pem
+"""
+
+import argparse
+import asyncio
+import base64
+import collections
+import fnmatch
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+import six
+from six.moves.urllib import parse as urlparse
+
+from requests_chef import clock as clocks
+from requests_chef import verify
+
+ALLOWED_SKEW = verify.ALLOWED_SKEW
+
+_REASONS = {
+    200: 'OK',
+    201: 'Created',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    409: 'Conflict',
+    500: 'Internal Server Error',
+}
+
+
+def make_nodes(count=100):
+    """Return 'count' canned nodes, alternating the web and db roles."""
+    nodes = []
+    for i in range(count):
+        role = ('web', 'db')[i % 2]
+        nodes.append({
+            'name': 'node-%d' % i,
+            'chef_type': 'node',
+            'json_class': 'Chef::Node',
+            'chef_environment': '_default',
+            'run_list': ['role[%s]' % role],
+            'normal': {'tags': [role]},
+            'automatic': {
+                'ipaddress': '10.0.%d.%d' % (i // 256, i % 256),
+                'platform': 'ubuntu',
+            },
+        })
+    return nodes
+
+
+def make_roles():
+    """Return the canned roles."""
+    return [{
+        'name': name,
+        'chef_type': 'role',
+        'json_class': 'Chef::Role',
+        'description': '%s servers' % name,
+        'run_list': ['recipe[%s]' % name],
+    } for name in ('web', 'db')]
+
+
+def _json_object(body):
+    """Return a request body as a JSON object (dict)."""
+    document = json.loads(body.decode('utf_8'))
+    if not isinstance(document, dict):
+        raise ValueError('Expected a JSON object.')
+    return document
+
+
+def _name(document, field):
+    """Return the name in 'field' of a JSON object."""
+    name = document[field]
+    if not isinstance(name, six.string_types):
+        raise ValueError("'%s' must be a string." % field)
+    return name
+
+
+def _lookup(item, path):
+    """Return an attribute of a node or role by its search path.
+
+    Like Chef's search index, attributes are found at the top level or
+    under any precedence level (automatic, normal, ...).
+    """
+    for source in (item, item.get('automatic', {}), item.get('normal', {}),
+                   item.get('default', {}), item.get('override', {})):
+        value = source
+        for name in path:
+            if not isinstance(value, dict) or name not in value:
+                break
+            value = value[name]
+        else:
+            return value
+    return None
+
+
+def _matches(item, query):
+    """Return True if 'item' matches a simple Chef search query.
+
+    Supports '*:*', 'field:pattern' (with * wildcards), 'role:<name>',
+    'recipe:<name>' and terms joined by AND.
+    """
+    for term in query.split(' AND '):
+        field, _, pattern = term.strip().partition(':')
+        if field == '*' and pattern == '*':
+            continue
+        if field in ('role', 'recipe'):
+            values = [entry[len(field) + 1:-1]
+                      for entry in item.get('run_list', [])
+                      if entry.startswith(field + '[')]
+        else:
+            value = _lookup(item, field.split('_') if field not in item
+                            else [field])
+            values = value if isinstance(value, list) else [value]
+        if not any(fnmatch.fnmatchcase(six.text_type(value), pattern)
+                   for value in values if value is not None):
+            return False
+    return True
+
+
+class FakeChefServer(object):
+
+    """A Chef server API stand-in that verifies request signatures.
+
+    :param clients: dict of {user_id: key}, keys in any form accepted by
+                    verify.load_public_key (e.g. the client's PEM file).
+    :param nodes: Canned nodes (default: make_nodes()).
+    :param roles: Canned roles (default: make_roles()).
+    :param allowed_skew: Seconds a timestamp may differ from the clock.
+    :param clock: requests_chef.clock.Clock the server checks
+                  timestamps against.
+    :param org: Organization name used in the URL.
+    :param backlog: Listen backlog, for many connections at once.
+    """
+
+    def __init__(self, clients, nodes=None, roles=None,
+                 allowed_skew=ALLOWED_SKEW, clock=None, host='127.0.0.1',
+                 port=0, org='acme', backlog=4096):
+        """Configure the server; start() it to listen."""
+        self.nodes = collections.OrderedDict(
+            (node['name'], node) for node in (
+                make_nodes() if nodes is None else nodes))
+        self.roles = collections.OrderedDict(
+            (role['name'], role) for role in (
+                make_roles() if roles is None else roles))
+        self.clock = clocks.DEFAULT_CLOCK if clock is None else clock
+        self.verifier = verify.ChefAuthVerifier(
+            clients, allowed_skew=allowed_skew, clock=self.clock)
+        self.host = host
+        self.port = port
+        self.org = org
+        self.backlog = backlog
+        self.data_bags = {}
+        self.sandboxes = {}
+        self.checksums = {}
+        self.stats = collections.Counter()
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def __repr__(self):
+        """Show the URL."""
+        return '%s(%s)' % (type(self).__name__, self.url)
+
+    def __enter__(self):
+        """Start the server in the background."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop the server."""
+        self.stop()
+
+    @property
+    def url(self):
+        """Return the organization's base URL."""
+        return 'http://%s:%d/organizations/%s' % (self.host, self.port,
+                                                  self.org)
+
+    # request handling
+
+    def respond(self, method, target, headers, body=b''):
+        """Return (status, document) for a request.
+
+        'headers' is a dict with lower-case names.
+        """
+        self.stats['requests'] += 1
+        url = urlparse.urlsplit(target)
+        try:
+            self.verifier.verify(method, url.path, headers, body)
+        except verify.AuthenticationError as exc:
+            self.stats['unauthorized'] += 1
+            return 401, {'error': [str(exc)]}
+        parts = [part for part in url.path.split('/') if part]
+        if parts[:2] == ['organizations', self.org]:
+            parts = parts[2:]
+        if parts[:1] == ['bookshelf']:
+            parts = parts[1:]
+            if method != 'PUT' or len(parts) != 1:
+                return 405, {'error': ['Method not allowed.']}
+            return self._checksum(parts[0], headers, body)
+        handler = getattr(self, '_%s' % (parts[0] if parts else ''), None)
+        if handler is None:
+            return 404, {'error': ['Not found: %s' % url.path]}
+        query = dict(urlparse.parse_qsl(url.query))
+        return handler(method, parts[1:], query, body)
+
+    def _collection(self, items, kind, method, parts):
+        if method != 'GET':
+            return 405, {'error': ['Method not allowed.']}
+        if not parts:
+            return 200, dict((name, '%s/%s/%s' % (self.url, kind, name))
+                             for name in items)
+        if len(parts) == 1 and parts[0] in items:
+            return 200, items[parts[0]]
+        return 404, {'error': ["Cannot load %s %s" % (kind, '/'.join(parts))]}
+
+    def _nodes(self, method, parts, query, body):
+        return self._collection(self.nodes, 'nodes', method, parts)
+
+    def _roles(self, method, parts, query, body):
+        return self._collection(self.roles, 'roles', method, parts)
+
+    def _search(self, method, parts, query, body):
+        indexes = {'node': ('nodes', self.nodes),
+                   'role': ('roles', self.roles)}
+        if not parts:
+            return 200, dict((index, '%s/search/%s' % (self.url, index))
+                             for index in indexes)
+        if len(parts) != 1 or parts[0] not in indexes:
+            return 404, {'error': ['Unknown index.']}
+        kind, items = indexes[parts[0]]
+        q = query.get('q', '*:*')
+        start = int(query.get('start', 0))
+        rows = int(query.get('rows', 1000))
+        found = [item for item in items.values() if _matches(item, q)]
+        page = found[start:start + rows]
+        if method == 'POST':
+            filter_result = _json_object(body)
+            page = [{
+                'url': '%s/%s/%s' % (self.url, kind, item['name']),
+                'data': dict((name, _lookup(item, path))
+                             for name, path in filter_result.items()),
+            } for item in page]
+        elif method != 'GET':
+            return 405, {'error': ['Method not allowed.']}
+        return 200, {'total': len(found), 'start': start, 'rows': page}
+
+    def _data(self, method, parts, query, body):
+        if method == 'GET' and len(parts) < 2:
+            items = self.data_bags if not parts else self.data_bags.get(
+                parts[0])
+            if items is None:
+                return 404, {'error': ["Cannot load data bag %s" % parts[0]]}
+            return self._collection(items, '/'.join(['data'] + parts),
+                                    method, [])
+        if not parts:
+            if method != 'POST':
+                return 405, {'error': ['Method not allowed.']}
+            name = _name(_json_object(body), 'name')
+            if name in self.data_bags:
+                return 409, {'error': ['Data bag already exists']}
+            self.data_bags[name] = collections.OrderedDict()
+            return 201, {'uri': '%s/data/%s' % (self.url, name)}
+        items = self.data_bags.get(parts[0])
+        if items is None:
+            return 404, {'error': ["Cannot load data bag %s" % parts[0]]}
+        return self._data_bag_item(items, method, parts[1:], body)
+
+    def _data_bag_item(self, items, method, parts, body):
+        if method == 'POST' and not parts:
+            item = _json_object(body)
+            if _name(item, 'id') in items:
+                return 409, {'error': ['Data Bag Item already exists']}
+            items[item['id']] = item
+            return 201, item
+        if len(parts) != 1:
+            return 405, {'error': ['Method not allowed.']}
+        if parts[0] not in items:
+            return 404, {'error': ["Cannot load data bag item %s"
+                                   % parts[0]]}
+        if method == 'PUT':
+            items[parts[0]] = _json_object(body)
+        elif method == 'DELETE':
+            return 200, items.pop(parts[0])
+        elif method != 'GET':
+            return 405, {'error': ['Method not allowed.']}
+        return 200, items[parts[0]]
+
+    def _sandboxes(self, method, parts, query, body):
+        if method == 'POST' and not parts:
+            checksums = _json_object(body)['checksums']
+            sandbox_id = uuid.uuid4().hex
+            self.sandboxes[sandbox_id] = {'checksums': list(checksums),
+                                          'is_completed': False}
+            return 201, {
+                'sandbox_id': sandbox_id,
+                'uri': '%s/sandboxes/%s' % (self.url, sandbox_id),
+                'checksums': dict((checksum, {
+                    'url': '%s/bookshelf/%s' % (self.url, checksum),
+                    'needs_upload': checksum not in self.checksums,
+                }) for checksum in checksums),
+            }
+        if method == 'PUT' and len(parts) == 1 and (
+                parts[0] in self.sandboxes):
+            sandbox = self.sandboxes[parts[0]]
+            missing = [checksum for checksum in sandbox['checksums']
+                       if checksum not in self.checksums]
+            if missing:
+                return 400, {'error': ['Checksums not uploaded: %s'
+                                       % ', '.join(missing)]}
+            sandbox['is_completed'] = _json_object(body).get(
+                'is_completed', False)
+            return 200, dict(sandbox, guid=parts[0])
+        return 404, {'error': ['Not found.']}
+
+    def _checksum(self, checksum, headers, body):
+        content_md5 = base64.b64encode(hashlib.md5(body).digest())
+        if (hashlib.md5(body).hexdigest() != checksum or
+                headers.get('content-md5') != content_md5.decode('ascii')):
+            return 400, {'error': ['Content does not match its checksum.']}
+        self.checksums[checksum] = body
+        return 200, {}
+
+    # HTTP over asyncio
+
+    async def _read_body(self, reader, headers):
+        if headers.get('transfer-encoding', '').lower() != 'chunked':
+            return await reader.readexactly(
+                int(headers.get('content-length') or 0))
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if not size:
+                # skip any trailers
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    async def _read_request(self, reader):
+        """Return (method, target, version, headers, body) or None."""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return None
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+        try:
+            body = await self._read_body(reader, headers)
+        except (asyncio.IncompleteReadError, ValueError):
+            return None
+        return method, target, version, headers, body
+
+    def _response(self, status, document, keep_alive):
+        """Return an HTTP response with a JSON 'document' body."""
+        payload = json.dumps(document).encode('utf_8')
+        return (
+            'HTTP/1.1 %d %s\r\n'
+            'Content-Type: application/json\r\n'
+            'Content-Length: %d\r\n'
+            'Date: %s\r\n'
+            'Connection: %s\r\n\r\n' % (
+                status, _REASONS.get(status, ''), len(payload),
+                time.strftime('%a, %d %b %Y %H:%M:%S GMT',
+                              time.gmtime(self.clock.time())),
+                'keep-alive' if keep_alive else 'close')
+        ).encode('latin-1') + payload
+
+    async def _handle(self, reader, writer):
+        """Serve requests on one connection until it closes."""
+        self.stats['connections'] += 1
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    return
+                method, target, version, headers, body = request
+                try:
+                    status, document = self.respond(method, target,
+                                                    headers, body)
+                except (ValueError, KeyError) as exc:
+                    status, document = 400, {'error': [str(exc)]}
+                except Exception as exc:  # pylint: disable=broad-except
+                    # answer, so clients see a status, not a dropped
+                    # connection
+                    status, document = 500, {'error': [repr(exc)]}
+                keep_alive = version == 'HTTP/1.1' and (
+                    headers.get('connection', '').lower() != 'close')
+                writer.write(self._response(status, document, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.CancelledError):
+            # idle keep-alive connections are cancelled by stop()
+            pass
+        finally:
+            writer.close()
+
+    def _run(self, ready, errors):
+        loop = self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            self._server = loop.run_until_complete(asyncio.start_server(
+                self._handle, self.host, self.port, backlog=self.backlog))
+        except Exception as exc:  # pylint: disable=broad-except
+            errors.append(exc)
+            ready.set()
+            loop.close()
+            return
+        self.port = self._server.sockets[0].getsockname()[1]
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            self._server.close()
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+
+    def start(self):
+        """Listen in a background thread; return the base URL."""
+        ready = threading.Event()
+        errors = []
+        self._thread = threading.Thread(target=self._run,
+                                        args=(ready, errors))
+        self._thread.daemon = True
+        self._thread.start()
+        ready.wait()
+        if errors:
+            self._thread.join()
+            raise errors[0]
+        return self.url
+
+    def stop(self):
+        """Stop listening and close every connection."""
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+
+def main(argv=None):
+    """Run a fake Chef server until interrupted."""
+    parser = argparse.ArgumentParser(
+        prog='python -m requests_chef.fake_server',
+        description='Serve a fake Chef API that verifies signatures.')
+    parser.add_argument('--client', action='append', required=True,
+                        metavar='USER_ID=KEY',
+                        help='client and its public or private key file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--org', default='acme')
+    parser.add_argument('--nodes', type=int, default=100,
+                        help='canned nodes (default: %(default)s)')
+    args = parser.parse_args(argv)
+    clients = dict(client.split('=', 1) for client in args.client)
+    server = FakeChefServer(clients, nodes=make_nodes(args.nodes),
+                            host=args.host, port=args.port, org=args.org)
+    print(server.start())
+    try:
+        while server._thread.is_alive():
+            server._thread.join(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+
+    main()
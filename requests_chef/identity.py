@@ -0,0 +1,176 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sign requests to many Chef orgs, each as its own client.
+
+    auth = MultiChefAuth()
+    auth.add_org('acme', 'acme-validator', '~/.chef/acme.pem')
+    auth.add_org('initech', 'initech-client', '~/.chef/initech.pem')
+    auth.add('https://chef-old.example.com', 'legacy', '~/.chef/legacy.pem')
+
+    session = ChefSession('https://chef.example.com', auth=auth)
+    session.get('/organizations/acme/nodes')
+
+Each request is signed by the identity registered for the longest
+matching URL prefix, else by the identity for the org in its
+/organizations/<org>/ path, else by the default identity. Keys are only
+loaded when an identity first signs, through the shared KEY_REGISTRY.
+"""
+
+import re
+import threading
+
+from six.moves.urllib import parse as urlparse
+
+from requests_chef import mixlib_auth
+
+_ORG_PATH = re.compile(r'^/organizations/([^/?]+)')
+
+
+class Identity(object):
+
+    """A Chef client (user id and private key), loaded on first use.
+
+    :param private_key: Anything ChefAuth accepts, e.g. a PEM path.
+    :param auth_kwargs: Further ChefAuth arguments.
+    """
+
+    def __init__(self, user_id, private_key, **auth_kwargs):
+        """Remember the identity; the key is loaded by the first sign."""
+        self.user_id = user_id
+        self.private_key = private_key
+        self.auth_kwargs = auth_kwargs
+        self._auth = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """Show the user id."""
+        return '%s(%s)' % (type(self).__name__, self.user_id)
+
+    @property
+    def auth(self):
+        """Return the ChefAuth for this identity, creating it once."""
+        if self._auth is None:
+            with self._lock:
+                if self._auth is None:
+                    self._auth = mixlib_auth.ChefAuth(
+                        self.user_id, self.private_key, **self.auth_kwargs)
+        return self._auth
+
+
+def _matches(url, prefix):
+    """Return True if 'url' is 'prefix' or a path below it."""
+    return url.startswith(prefix) and (
+        len(url) == len(prefix) or url[len(prefix)] in '/?')
+
+
+class MultiChefAuth(object):
+
+    """Requests auth routing each request to one of many identities.
+
+    :param default: Optional (user_id, private_key) used for requests
+                    that match no prefix or org.
+    :param auth_kwargs: ChefAuth arguments shared by every identity
+                        (e.g. protocol, signature_cache, instrument,
+                        clock); add() and add_org() can override them.
+    """
+
+    def __init__(self, default=None, **auth_kwargs):
+        """Start with no identities but the optional default."""
+        self.auth_kwargs = auth_kwargs
+        self.default = None if default is None else self._identity(
+            *default)
+        # (prefix, identity), longest prefix first
+        self._prefixes = []
+        self._orgs = {}
+
+    def __repr__(self):
+        """Show the number of identities."""
+        return '%s(%d identities)' % (
+            type(self).__name__,
+            len(self._prefixes) + len(self._orgs) + (self.default is not None))
+
+    def __call__(self, request):
+        """Sign the request as the identity it routes to."""
+        return self.route(request.url).auth(request)
+
+    def _identity(self, user_id, private_key, **auth_kwargs):
+        kwargs = dict(self.auth_kwargs)
+        kwargs.update(auth_kwargs)
+        return Identity(user_id, private_key, **kwargs)
+
+    def add(self, prefix, user_id, private_key, **auth_kwargs):
+        """Sign requests below 'prefix' as 'user_id'.
+
+        'prefix' is either an absolute URL (scheme and host, optionally
+        with a path) or a path starting with '/'.
+        """
+        identity = self._identity(user_id, private_key, **auth_kwargs)
+        prefix = prefix.rstrip('/')
+        prefixes = [item for item in self._prefixes if item[0] != prefix]
+        prefixes.append((prefix, identity))
+        prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+        self._prefixes = prefixes
+        return identity
+
+    def add_org(self, org, user_id, private_key, **auth_kwargs):
+        """Sign requests to /organizations/<org>/... as 'user_id'."""
+        identity = self._identity(user_id, private_key, **auth_kwargs)
+        self._orgs[org] = identity
+        return identity
+
+    def _match(self, url):
+        """Return (pool prefix, identity) for 'url', or (None, None)."""
+        parts = urlparse.urlsplit(url)
+        origin = '%s://%s' % (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        for prefix, identity in self._prefixes:
+            if prefix.startswith('/'):
+                if _matches(path, prefix):
+                    return origin + prefix + '/', identity
+            elif _matches(url, prefix):
+                return prefix + '/', identity
+        match = _ORG_PATH.match(path)
+        if match and match.group(1) in self._orgs:
+            return origin + match.group(0) + '/', self._orgs[match.group(1)]
+        return None, None
+
+    def route(self, url):
+        """Return the Identity signing requests to 'url'.
+
+        'url' may be absolute or just the path. Raises ValueError if no
+        identity matches and there is no default.
+        """
+        identity = self._match(url)[1] or self.default
+        if identity is None:
+            raise ValueError('No Chef identity for %s.' % url)
+        return identity
+
+    def pool_prefix(self, url):
+        """Return the URL prefix whose connections 'url' should use.
+
+        Requests for different identities use different prefixes, so a
+        ChefSession keeps a connection pool per identity. None means the
+        session's default pool.
+        """
+        return self._match(url)[0]
+
+    def sign_request(self, method, path_url, body=None, timestamp=None):
+        """Route, then return ChefAuth.sign_request for the identity."""
+        auth = self.route(path_url).auth
+        if '://' in path_url:
+            parts = urlparse.urlsplit(path_url)
+            path_url = parts.path or '/'
+            if parts.query:
+                path_url += '?' + parts.query
+        return auth.sign_request(method, path_url, body=body,
+                                 timestamp=timestamp)
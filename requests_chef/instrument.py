@@ -0,0 +1,114 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Instrumentation for the phases of signing a request.
+
+Pass an instrument to ChefAuth(instrument=...) to receive, once per
+signed request, the seconds spent in each of PHASES and the number of
+body bytes hashed. A plain function is accepted too, and is called as
+callback(timings, body_bytes).
+
+When no instrument is set, ChefAuth does not time anything.
+"""
+
+import time
+
+# Phases of ChefAuth.sign_request, in order, plus the total.
+PHASES = (
+    'body_hash',
+    'path_hash',
+    'canonical_request',
+    'sign',
+    'headers',
+    'total',
+)
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class Instrument(object):
+
+    """Base class for instruments: record() is called for each request."""
+
+    def record(self, timings, body_bytes):
+        """Record one signed request.
+
+        :param timings: dict of seconds spent in each of PHASES.
+        :param body_bytes: number of body bytes hashed.
+        """
+        raise NotImplementedError
+
+
+class CallbackInstrument(Instrument):
+
+    """Pass each record to 'callback(timings, body_bytes)'."""
+
+    def __init__(self, callback):
+        """Call 'callback' for each signed request."""
+        self.callback = callback
+
+    def record(self, timings, body_bytes):
+        """Call the callback."""
+        self.callback(timings, body_bytes)
+
+
+class StatsdInstrument(Instrument):
+
+    """Send timings (in ms) and byte counts to a statsd client.
+
+    Works with any client that has timing(stat, ms) and incr(stat, count)
+    methods, e.g. the 'statsd' and 'datadog' packages.
+    """
+
+    def __init__(self, client, prefix='requests_chef.sign'):
+        """Report to 'client' under 'prefix'."""
+        self.client = client
+        self.prefix = prefix
+
+    def record(self, timings, body_bytes):
+        """Send one timing per phase and the body byte count."""
+        for phase, seconds in timings.items():
+            self.client.timing('%s.%s' % (self.prefix, phase),
+                               seconds * 1000.0)
+        self.client.incr('%s.body_bytes' % self.prefix, body_bytes)
+
+
+class PrometheusInstrument(Instrument):
+
+    """Observe timings with prometheus_client metrics.
+
+    :param histogram: Histogram with a 'phase' label, e.g.
+                      Histogram('chef_sign_seconds', '...', ['phase'])
+    :param counter: Optional Counter for body bytes hashed.
+    """
+
+    def __init__(self, histogram, counter=None):
+        """Report to 'histogram' and 'counter'."""
+        self.histogram = histogram
+        self.counter = counter
+
+    def record(self, timings, body_bytes):
+        """Observe each phase and count the body bytes."""
+        for phase, seconds in timings.items():
+            self.histogram.labels(phase=phase).observe(seconds)
+        if self.counter is not None:
+            self.counter.inc(body_bytes)
+
+
+def get_instrument(instrument):
+    """Return an Instrument for an instrument, a callback or None."""
+    if instrument is None or hasattr(instrument, 'record'):
+        return instrument
+    if callable(instrument):
+        return CallbackInstrument(instrument)
+    raise TypeError("'instrument' must have a record() method or be "
+                    "callable, not {0!r}".format(instrument))
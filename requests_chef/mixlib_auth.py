@@ -22,32 +22,255 @@ https://docs.chef.io/auth.html
 
 import base64
 import collections
-import datetime
+from email import utils as email_utils
 import hashlib
+import io
+import mmap
 import os
+import stat
+import tempfile
+import uuid
+
+try:
+    from collections import abc as collections_abc
+except ImportError:  # pragma: no cover
+    collections_abc = collections
 
 import requests
+from requests import cookies as requests_cookies
 import six
 
 from cryptography.hazmat import backends as crypto_backends
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.asymmetric import rsa
 
+from requests_chef import cache
+from requests_chef import clock as clocks
+from requests_chef import instrument as instruments
+from requests_chef import presign as presigning
+from requests_chef import signers
+
+# Bodies are hashed this many bytes at a time when streamed.
+CHUNK_SIZE = 64 * 1024
+
+# Unseekable bodies larger than this are spooled to disk while hashing.
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# Digest algorithms (hashlib names) used for signing, by cryptography name.
+SIGN_ALGORITHMS = signers.SIGN_ALGORITHMS
+
+# A 401 for a request whose X-Ops-Timestamp was at least this many
+# seconds off the server's Date header is blamed on clock skew.
+SKEW_THRESHOLD = 60
+
+# Content hashes of file bodies, by (device, inode, size, mtime, offset,
+# algorithm), so a file that is sent again is not hashed again.
+CONTENT_HASH_CACHE = cache.LRUCache(maxsize=1024, ttl=None)
+
 
-def digester(data):
-    """Create SHA-1 hash, get digest, b64 encode, split every 60 char."""
-    if not isinstance(data, six.binary_type):
+def digester(data, algorithm='sha1'):
+    """Create SHA-1 hash, get digest, b64 encode, split every 60 char.
+
+    Buffers (bytes, bytearray, memoryview) are hashed without copying.
+    'algorithm' is the name of any hashlib constructor.
+    """
+    if isinstance(data, six.text_type):
         data = data.encode('utf_8')
-    hashof = hashlib.sha1(data).digest()
+    return encode_digest(getattr(hashlib, algorithm)(data).digest())
+
+
+def encode_digest(hashof):
+    """B64 encode a raw digest, split every 60 char."""
     encoded_hash = base64.b64encode(hashof)
     if not isinstance(encoded_hash, six.string_types):
         encoded_hash = encoded_hash.decode('utf_8')
+    if len(encoded_hash) <= 60:
+        # SHA-1 and SHA-256 digests always fit on one line
+        return encoded_hash
     chunked = splitter(encoded_hash, chunksize=60)
     lines = '\n'.join(chunked)
     return lines
 
 
+def file_digester(fileobj, chunksize=CHUNK_SIZE, algorithm='sha1'):
+    """Hash a seekable file-like object from its current position.
+
+    Regular files opened in binary mode are hashed through an mmap,
+    without reading them, and the hash is kept in CONTENT_HASH_CACHE
+    until the file's size or mtime changes. Other files are read in
+    chunks, then rewound to where they started so they can be sent
+    afterwards.
+    """
+    return _file_digest(fileobj, chunksize, algorithm)[0]
+
+
+def _file_version(fileobj):
+    """Return (device, inode, size, mtime) of a regular binary file.
+
+    Returns None for anything else.
+    """
+    if isinstance(fileobj, io.TextIOBase):
+        return None
+    try:
+        file_stat = os.fstat(fileobj.fileno())
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
+    return (file_stat.st_dev, file_stat.st_ino, file_stat.st_size,
+            getattr(file_stat, 'st_mtime_ns', file_stat.st_mtime))
+
+
+def _mapped_digest(fileobj, algorithm, hash_cache=None):
+    """Return (hash, bytes hashed) of a regular file, using mmap.
+
+    Returns None if 'fileobj' cannot be mapped.
+    """
+    if hash_cache is None:
+        hash_cache = CONTENT_HASH_CACHE
+    if hasattr(fileobj, 'flush'):
+        fileobj.flush()
+    version = _file_version(fileobj)
+    if version is None:
+        return None
+    size = version[2]
+    offset = fileobj.tell()
+    cache_key = version + (offset, algorithm)
+    cached = hash_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    hasher = getattr(hashlib, algorithm)()
+    if offset < size:
+        try:
+            mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError):
+            return None
+        try:
+            hasher.update(memoryview(mapped)[offset:size])
+        finally:
+            mapped.close()
+    hashed = (encode_digest(hasher.digest()), max(size - offset, 0))
+    if _file_version(fileobj) == version:
+        # only cache the hash if the file did not change while hashing
+        hash_cache.set(cache_key, hashed)
+    return hashed
+
+
+def _file_digest(fileobj, chunksize, algorithm, hash_cache=None):
+    """Return (hash, bytes hashed) for file_digester."""
+    hashed = _mapped_digest(fileobj, algorithm, hash_cache)
+    if hashed is not None:
+        return hashed
+    hasher = getattr(hashlib, algorithm)()
+    nbytes = 0
+    start = fileobj.tell()
+    if hasattr(fileobj, 'readinto') and not isinstance(fileobj,
+                                                       io.TextIOBase):
+        buf = bytearray(chunksize)
+        view = memoryview(buf)
+        while True:
+            count = fileobj.readinto(buf)
+            if not count:
+                break
+            hasher.update(view[:count])
+            nbytes += count
+    else:
+        for chunk in _read_chunks(fileobj, chunksize):
+            if isinstance(chunk, six.text_type):
+                chunk = chunk.encode('utf_8')
+            hasher.update(chunk)
+            nbytes += len(chunk)
+    fileobj.seek(start)
+    return encode_digest(hasher.digest()), nbytes
+
+
+def iter_digester(iterable, chunksize=CHUNK_SIZE, spool_size=SPOOL_SIZE,
+                  algorithm='sha1'):
+    """Hash an iterable (or unseekable file) of body chunks.
+
+    Since the iterable can only be consumed once, the chunks are spooled
+    to a temporary file (in memory up to 'spool_size' bytes) as they are
+    hashed. Returns a tuple of (hash, body) where 'body' is a generator
+    that replays the content in 'chunksize' pieces.
+    """
+    return _iter_digest(iterable, chunksize, spool_size, algorithm)[:2]
+
+
+def _iter_digest(iterable, chunksize, spool_size, algorithm):
+    """Return (hash, body, bytes hashed) for iter_digester."""
+    if hasattr(iterable, 'read'):
+        iterable = _read_chunks(iterable, chunksize)
+    hasher = getattr(hashlib, algorithm)()
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    for chunk in iterable:
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf_8')
+        hasher.update(chunk)
+        spool.write(chunk)
+    nbytes = spool.tell()
+    spool.seek(0)
+    return encode_digest(hasher.digest()), _replay(spool, chunksize), nbytes
+
+
+def _read_chunks(fileobj, chunksize):
+    """Yield chunks read from 'fileobj' until it is exhausted."""
+    while True:
+        chunk = fileobj.read(chunksize)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _replay(spool, chunksize):
+    """Yield the contents of 'spool' in chunks and close it."""
+    with spool:
+        for chunk in _read_chunks(spool, chunksize):
+            yield chunk
+
+
+def _seekable(fileobj):
+    """Return True if 'fileobj' can be rewound after reading."""
+    try:
+        if hasattr(fileobj, 'seekable'):
+            return fileobj.seekable()
+        fileobj.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        return False
+    return True
+
+
+def content_digester(body, chunksize=CHUNK_SIZE, algorithm='sha1'):
+    """Hash a request body of any type requests can send.
+
+    Returns a tuple of (hash, body). The returned body is the one to send:
+    it is the original object unless it had to be re-supplied because
+    hashing consumed it.
+    """
+    return _content_digest(body, chunksize, algorithm)[:2]
+
+
+def _content_digest(body, chunksize=CHUNK_SIZE, algorithm='sha1',
+                    hash_cache=None):
+    """Return (hash, body, bytes hashed) for content_digester.
+
+    File hashes are cached in 'hash_cache' (default: CONTENT_HASH_CACHE).
+    """
+    if body is None:
+        return digester(b'', algorithm=algorithm), body, 0
+    if isinstance(body, six.text_type):
+        data = body.encode('utf_8')
+        return digester(data, algorithm=algorithm), body, len(data)
+    if isinstance(body, (six.binary_type, bytearray)):
+        return digester(body, algorithm=algorithm), body, len(body)
+    if isinstance(body, memoryview):
+        return digester(body, algorithm=algorithm), body, body.nbytes
+    if hasattr(body, 'read') and _seekable(body):
+        hashed_body, nbytes = _file_digest(body, chunksize, algorithm,
+                                           hash_cache)
+        return hashed_body, body, nbytes
+    return _iter_digest(body, chunksize, SPOOL_SIZE, algorithm)
+
+
 def normpath(path):
     """Normalize a path.
 
@@ -57,12 +280,291 @@ def normpath(path):
     return os.path.abspath(os.path.normpath(os.path.expanduser(path)))
 
 
+# Base64 characters per X-Ops-Authorization-N header.
+AUTHORIZATION_CHUNK_SIZE = 60
+
+# Names of the first X-Ops-Authorization-N headers (a 4096-bit
+# signature needs 12), made once.
+_AUTHORIZATION_NAMES = tuple('X-Ops-Authorization-%d' % (i + 1)
+                             for i in range(16))
+_AUTHORIZATION_INDEX = dict((name, i)
+                            for i, name in enumerate(_AUTHORIZATION_NAMES))
+_AUTHORIZATION_NAME_TUPLES = tuple(_AUTHORIZATION_NAMES[:count] for count
+                                   in range(len(_AUTHORIZATION_NAMES) + 1))
+
+
 def splitter(iterable, chunksize=60):
     """Split an iterable that supports indexing into chunks of 'chunksize'."""
     return (iterable[0+i:chunksize+i]
             for i in range(0, len(iterable), chunksize))
 
 
+def _authorization_headers(signed):
+    """Split a b64 signature into the X-Ops-Authorization-N headers."""
+    return SignedHeaders(signed)
+
+
+class SignedHeaders(collections_abc.Mapping):
+
+    """The X-Ops-Authorization-N headers of one base64 signature.
+
+    A read-only mapping over the signature: the chunked header values
+    are sliced from it the first time they are read and kept, so one
+    object (which may be shared through a signature cache) stands in for
+    the header dict. The values are bytes slices rather than memoryviews:
+    a 60 byte slice is half the size of a memoryview and, unlike one, is
+    not tracked by the garbage collector.
+    """
+
+    __slots__ = ('signature', '_values')
+
+    def __init__(self, signature):
+        """Wrap 'signature', the base64 bytes."""
+        self.signature = signature
+        self._values = None
+
+    def __repr__(self):
+        """Show the number of headers."""
+        return '%s(%d headers)' % (type(self).__name__, len(self))
+
+    def __reduce__(self):
+        """Pickle only the signature, e.g. for a SharedLRUCache."""
+        return type(self), (self.signature,)
+
+    def __len__(self):
+        """Return the number of X-Ops-Authorization-N headers."""
+        return -(-len(self.signature) // AUTHORIZATION_CHUNK_SIZE)
+
+    def __iter__(self):
+        """Iterate over the header names, in order."""
+        return iter(_authorization_names(len(self)))
+
+    def __getitem__(self, name):
+        """Return the value of an X-Ops-Authorization-N header."""
+        index = _AUTHORIZATION_INDEX.get(name)
+        if index is None:
+            index = _authorization_index(name)
+        values = self.values_tuple()
+        if not 0 <= index < len(values):
+            raise KeyError(name)
+        return values[index]
+
+    def values_tuple(self):
+        """Return the header values, in order."""
+        values = self._values
+        if values is None:
+            values = self._values = tuple(
+                splitter(self.signature, AUTHORIZATION_CHUNK_SIZE))
+        return values
+
+    def pairs(self):
+        """Iterate over (name, value), faster than items()."""
+        values = self.values_tuple()
+        return zip(_authorization_names(len(values)), values)
+
+
+def _authorization_names(count):
+    """Return the first 'count' X-Ops-Authorization-N header names."""
+    if count < len(_AUTHORIZATION_NAME_TUPLES):
+        return _AUTHORIZATION_NAME_TUPLES[count]
+    return tuple('X-Ops-Authorization-%d' % (i + 1) for i in range(count))
+
+
+def _authorization_index(name):
+    """Return N - 1 for an X-Ops-Authorization-N name in any case."""
+    prefix, _, number = name.rpartition('-')
+    if prefix.lower() != 'x-ops-authorization' or not number.isdigit():
+        raise KeyError(name)
+    return int(number) - 1
+
+
+# Placeholders used to derive ProtocolV10.canonical_format().
+_CANONICAL_FIELDS = ('\0METHOD\0', '\0PATH\0', '\0CONTENT\0', '\0TIMESTAMP\0')
+
+# Encoded HTTP methods, for ChefAuth.canonical_request_bytes().
+_METHOD_BYTES = {}
+
+
+def _method_bytes(method):
+    """Return the upper case, encoded HTTP method."""
+    try:
+        return _METHOD_BYTES[method]
+    except KeyError:
+        encoded = method.upper().encode('ascii')
+        if len(_METHOD_BYTES) < 64:
+            _METHOD_BYTES[method] = encoded
+        return encoded
+
+
+def _to_bytes(value):
+    """Encode text as UTF-8, passing bytes through."""
+    if isinstance(value, six.binary_type):
+        return value
+    return value.encode('utf_8')
+
+
+def _to_text(value):
+    """Decode UTF-8 bytes, passing text through."""
+    if isinstance(value, six.binary_type):
+        return value.decode('utf_8')
+    return value
+
+
+def _date_header_time(date):
+    """Return seconds since the epoch for an HTTP Date, or None."""
+    parsed = email_utils.parsedate_tz(date) if date else None
+    if parsed is None:
+        return None
+    return email_utils.mktime_tz(parsed)
+
+
+class ProtocolV10(object):
+
+    """Version 1.0 of the Chef signing protocol, the base for the others.
+
+    A protocol decides how the path and user id appear in the canonical
+    request, which digest is used for hashes, and how the canonical
+    request is signed: 'sign_algorithm' is None for a raw PKCS1v15
+    signature of the canonical request itself.
+    """
+
+    version = '1.0'
+    algorithm = 'sha1'
+    sign_algorithm = None
+
+    def __repr__(self):
+        """Show the protocol version."""
+        return '%s(%s)' % (type(self).__name__, self.version)
+
+    @property
+    def sign_header(self):
+        """Return the X-Ops-Sign header value."""
+        return 'algorithm=%s;version=%s' % (self.algorithm, self.version)
+
+    def headers(self):
+        """Return any extra headers this protocol sends."""
+        return {}
+
+    def hash_path(self, path):
+        """Return the path as it appears in the canonical request."""
+        return digester(path, algorithm=self.algorithm)
+
+    def canonical_user_id(self, user_id):
+        """Return the user id as it appears in the canonical request."""
+        return user_id
+
+    def canonical_request(self, method, path, content, timestamp, user_id):
+        """Return the canonical request string.
+
+        'path' and 'user_id' are as returned by hash_path() and
+        canonical_user_id().
+        """
+        request = collections.OrderedDict([
+            ('Method', method.upper()),
+            ('Hashed Path', path),
+            ('X-Ops-Content-Hash', content),
+            ('X-Ops-Timestamp', timestamp),
+            ('X-Ops-UserId', user_id),
+        ])
+        return '\n'.join(['%s:%s' % (key, value)
+                          for key, value in request.items()])
+
+    def canonical_format(self, user_id):
+        """Return the canonical request for 'user_id' as a bytes %-format.
+
+        Formatting it with the (encoded) method, path, content hash and
+        timestamp builds the same bytes as canonical_request() in a single
+        step. It is derived from canonical_request() itself, which must
+        use the four fields in that order.
+        """
+        template = self.canonical_request(
+            *(_CANONICAL_FIELDS + (user_id,))).replace('%', '%%')
+        positions = [template.index(field) for field in _CANONICAL_FIELDS]
+        if positions != sorted(positions):
+            raise ValueError("canonical_request() of %r does not use its "
+                             "fields in order." % self)
+        for field in _CANONICAL_FIELDS:
+            template = template.replace(field, '%s')
+        return template.encode('utf_8')
+
+
+class ProtocolV11(ProtocolV10):
+
+    """Version 1.1 of the Chef signing protocol: the user id is hashed."""
+
+    version = '1.1'
+
+    def canonical_user_id(self, user_id):
+        """Return the hashed user id."""
+        return digester(user_id, algorithm=self.algorithm)
+
+
+class ProtocolV13(ProtocolV10):
+
+    """Version 1.3 of the Chef signing protocol: SHA-256 throughout.
+
+    The path is not hashed, the canonical request also covers
+    X-Ops-Sign and X-Ops-Server-API-Version, and it is signed with a
+    standard PKCS1v15 SHA-256 signature.
+    """
+
+    version = '1.3'
+    algorithm = 'sha256'
+    sign_algorithm = 'sha256'
+
+    def __init__(self, server_api_version=0):
+        """Sign for the given X-Ops-Server-API-Version."""
+        self.server_api_version = str(server_api_version)
+
+    def headers(self):
+        """Return the X-Ops-Server-API-Version header."""
+        return {'X-Ops-Server-API-Version': self.server_api_version}
+
+    def hash_path(self, path):
+        """Return the path unchanged."""
+        return path
+
+    def canonical_request(self, method, path, content, timestamp, user_id):
+        """Return the canonical request string."""
+        request = collections.OrderedDict([
+            ('Method', method.upper()),
+            ('Path', path),
+            ('X-Ops-Content-Hash', content),
+            ('X-Ops-Sign', 'version=%s' % self.version),
+            ('X-Ops-Timestamp', timestamp),
+            ('X-Ops-UserId', user_id),
+            ('X-Ops-Server-API-Version', self.server_api_version),
+        ])
+        return '\n'.join(['%s:%s' % (key, value)
+                          for key, value in request.items()])
+
+
+# Supported protocol versions, for ChefAuth(protocol=...).
+PROTOCOLS = {
+    ProtocolV10.version: ProtocolV10,
+    ProtocolV11.version: ProtocolV11,
+    ProtocolV13.version: ProtocolV13,
+}
+
+# canonical_request() methods ProtocolV10.canonical_format() reproduces.
+_BUILTIN_CANONICAL_REQUESTS = (
+    ProtocolV10.canonical_request,
+    ProtocolV13.canonical_request,
+)
+
+
+def get_protocol(protocol):
+    """Return a protocol instance for a version string or instance."""
+    if isinstance(protocol, ProtocolV10):
+        return protocol
+    try:
+        return PROTOCOLS[str(protocol)]()
+    except KeyError:
+        raise ValueError(
+            "Unsupported Chef signing protocol version {0!r}, expected "
+            "one of {1}.".format(protocol, ', '.join(sorted(PROTOCOLS))))
+
+
 class ChefAuth(requests.auth.AuthBase):  # pylint: disable=R0903
 
     """Sign requests with user's private key.
@@ -71,25 +573,76 @@ class ChefAuth(requests.auth.AuthBase):  # pylint: disable=R0903
         https://docs.chef.io/auth.html#header-format
     """
 
-    datetime_fmt = '%Y-%m-%dT%H:%M:%SZ'
+    def __init__(self, user_id, private_key, signature_cache=None,
+                 protocol='1.0', instrument=None, clock=None,
+                 correct_skew=False, content_hash_cache=None):
+        """Initialize with any callable handlers.
 
-    def __init__(self, user_id, private_key):
-        """Initialize with any callable handlers."""
+        :param protocol: Signing protocol version ('1.0', '1.1' or '1.3')
+                         or a protocol instance, e.g. ProtocolV13 with a
+                         specific server_api_version.
+        :param signature_cache: Optional cache (e.g. an
+                                requests_chef.cache.LRUCache) mapping
+                                canonical requests to signed headers, so
+                                identical requests within the same second
+                                are only signed once. A
+                                cache.SharedLRUCache shares them between
+                                processes. Entries are keyed by the
+                                signing key too, so one cache can be
+                                shared by many identities.
+        :param content_hash_cache: Cache of the content hashes of file
+                                   bodies, by file version; the module's
+                                   CONTENT_HASH_CACHE by default.
+        :param instrument: Optional requests_chef.instrument.Instrument,
+                           or a callback(timings, body_bytes), to time
+                           each phase of signing.
+        :param clock: requests_chef.clock.Clock producing X-Ops-Timestamp
+                      values; defaults to the shared clock.DEFAULT_CLOCK,
+                      or with correct_skew to a Clock of this auth's
+                      own, so corrections for one server do not shift
+                      the timestamps of others.
+        :param correct_skew: On a 401 caused by clock skew, correct the
+                             clock from the server's Date header and
+                             retry the request once (see handle_401).
+        """
         if not all((user_id, private_key)):
             raise ValueError("Authenticating to Chef server requires "
                              "both user_id and private_key.")
         if isinstance(private_key, rsa.RSAPrivateKey):
             private_key = RSAKey(private_key)
-        elif isinstance(private_key, RSAKey):
-            # good to go
+        elif isinstance(private_key, RSAKey) or callable(
+                getattr(private_key, 'sign', None)):
+            # good to go, e.g. a requests_chef.pool.SigningPool
             pass
         else:
             private_key = RSAKey.load_pem(private_key)
         self.private_key = private_key
+        # keeps signatures of other keys in a shared cache apart; a key
+        # that cannot be identified gets a cache space of its own
+        self._key_id = getattr(private_key, 'fingerprint',
+                               None) or uuid.uuid4().hex
         if not isinstance(user_id, six.string_types):
             raise TypeError(
                 "'user_id' must be a 'str' object, not {0!r}".format(user_id))
         self.user_id = user_id
+        self.signature_cache = signature_cache
+        self.protocol = get_protocol(protocol)
+        self._canonical_user_id = self.protocol.canonical_user_id(user_id)
+        # the precompiled format is only used while canonical_request() is
+        # the built-in one, so an overridden one is still what gets signed
+        self._canonical_format = None
+        if (type(self).canonical_request is ChefAuth.canonical_request
+                and type(self.protocol).canonical_request in
+                _BUILTIN_CANONICAL_REQUESTS):
+            self._canonical_format = self.protocol.canonical_format(
+                self._canonical_user_id)
+        self.instrument = instruments.get_instrument(instrument)
+        if clock is None:
+            clock = clocks.Clock() if correct_skew else clocks.DEFAULT_CLOCK
+        self.clock = clock
+        self.correct_skew = correct_skew
+        self.content_hash_cache = content_hash_cache
+        self._presigned = {}
 
     def __repr__(self):
         """Show the auth handler object."""
@@ -97,71 +650,423 @@ class ChefAuth(requests.auth.AuthBase):  # pylint: disable=R0903
 
     def __call__(self, request):
         """Sign the request."""
-        hashed_body = digester(request.body or '')
-        stripped_path = request.path_url.partition('?')[0]
-        hashed_path = digester(stripped_path)
-        timestamp = datetime.datetime.utcnow().strftime(self.datetime_fmt)
-
-        canonical_request = self.canonical_request(
-            request.method, hashed_path, hashed_body, timestamp)
-
-        signed = self.private_key.sign(canonical_request, b64=True)
-        signed_chunks = splitter(signed, chunksize=60)
-        signed_headers = {
-            'X-Ops-Authorization-%d' % (i+1): segment
-            for i, segment in enumerate(signed_chunks)
-        }
+        auth_headers, signed_headers, request.body = self._sign(
+            request.method, request.path_url, request.body)
+        request.headers.update(auth_headers)
+        if signed_headers is not None:
+            request.headers.update(signed_headers.pairs())
+        if self.correct_skew:
+            request.register_hook('response', self.handle_401)
+            if _seekable(request.body):
+                request._chef_body_position = request.body.tell()
+
+        return request
+
+    def handle_401(self, response, **kwargs):
+        """Response hook correcting the clock after a clock-skew 401.
+
+        If the server's Date is SKEW_THRESHOLD or more seconds off the
+        request's X-Ops-Timestamp, the clock is corrected to the server's
+        time and the request is re-signed (with the content hash it was
+        sent with, so the body is not hashed again) and sent once more.
+        Requests whose body was a generator cannot be re-sent; for those
+        only the clock is corrected.
+        """
+        request = response.request
+        if response.status_code != 401 or getattr(
+                request, '_chef_skew_retry', False):
+            return response
+        server_time = _date_header_time(response.headers.get('Date'))
+        try:
+            signed_at = clocks.parse_timestamp(
+                _to_text(request.headers.get('X-Ops-Timestamp', '')))
+        except ValueError:
+            return response
+        if server_time is None or abs(
+                server_time - signed_at) < SKEW_THRESHOLD:
+            return response
+        self.clock.correct(server_time)
+        for bundle in list(self._presigned.values()):
+            bundle.refresh()
+        body = request.body
+        if body is not None and not isinstance(
+                body, (six.string_types, six.binary_type, bytearray)):
+            if not hasattr(request, '_chef_body_position'):
+                return response
+            body.seek(request._chef_body_position)
+        return self._resend(response, **kwargs)
+
+    def _resend(self, response, **kwargs):
+        """Re-sign response.request with the clock's time and send it."""
+        # release the connection so the retry can reuse it
+        response.content  # pylint: disable=pointless-statement
+        response.close()
+        request = response.request.copy()
+        request._chef_skew_retry = True
+        requests_cookies.extract_cookies_to_jar(
+            request._cookies, response.request, response.raw)
+        request.prepare_cookies(request._cookies)
+        hashed_body = _to_text(request.headers['X-Ops-Content-Hash'])
+        timestamp, signed_headers = self._sign_hashed(
+            request.method, request.path_url, hashed_body)
+        request.headers.update(self._auth_headers(hashed_body, timestamp))
+        request.headers.update(signed_headers.pairs())
+        retried = response.connection.send(request, **kwargs)
+        retried.history.append(response)
+        retried.request = request
+        return retried
+
+    def _sign_hashed(self, method, path_url, hashed_body, timestamp=None):
+        """Return (timestamp, signed headers) for an already hashed body."""
+        if timestamp is None:
+            timestamp = self.clock.timestamp()
+        canonical_request = self.canonical_request_bytes(
+            method, self.protocol.hash_path(path_url.partition('?')[0]),
+            hashed_body, timestamp)
+        return timestamp, self.signed_headers(canonical_request)
+
+    def sign_request(self, method, path_url, body=None, timestamp=None):
+        """Return a tuple of (auth headers, body) for a request.
+
+        This is the signing core shared by every client integration.
+        'path_url' may include a query string, which is not signed. The
+        returned body is the one to send (see content_digester).
+        """
+        auth_headers, signed_headers, body = self._sign(
+            method, path_url, body, timestamp)
+        if signed_headers is not None:
+            auth_headers.update(signed_headers.pairs())
+        return auth_headers, body
+
+    def _sign(self, method, path_url, body=None, timestamp=None):
+        """Return (auth headers, SignedHeaders or None, body).
+
+        The X-Ops-Authorization-N headers are either in the SignedHeaders,
+        or already in the auth headers (for presigned headers).
+        """
+        if self._presigned and not body and timestamp is None:
+            bundle = self._presigned.get(
+                (method.upper(), path_url.partition('?')[0]))
+            headers = None if bundle is None else bundle.headers()
+            if headers is not None:
+                return dict(headers), None, body
+        if self.instrument is not None:
+            return self._instrumented_sign(method, path_url, body, timestamp)
+        hashed_body, body, _ = _content_digest(
+            body, algorithm=self.protocol.algorithm,
+            hash_cache=self.content_hash_cache)
+        timestamp, signed_headers = self._sign_hashed(
+            method, path_url, hashed_body, timestamp)
+
+        return self._auth_headers(hashed_body, timestamp), signed_headers, body
+
+    def _instrumented_sign(self, method, path_url, body, timestamp):
+        """Run _sign, timing each phase for the instrument."""
+        protocol = self.protocol
+        start = instruments.timer()
+        hashed_body, body, body_bytes = _content_digest(
+            body, algorithm=protocol.algorithm,
+            hash_cache=self.content_hash_cache)
+        body_hashed = instruments.timer()
+        hashed_path = protocol.hash_path(path_url.partition('?')[0])
+        path_hashed = instruments.timer()
+        if timestamp is None:
+            timestamp = self.clock.timestamp()
+        canonical_request = self.canonical_request_bytes(
+            method, hashed_path, hashed_body, timestamp)
+        canonicalized = instruments.timer()
+        signed_headers = self.signed_headers(canonical_request)
+        signed = instruments.timer()
+        auth_headers = self._auth_headers(hashed_body, timestamp)
+        end = instruments.timer()
+        self.instrument.record({
+            'body_hash': body_hashed - start,
+            'path_hash': path_hashed - body_hashed,
+            'canonical_request': canonicalized - path_hashed,
+            'sign': signed - canonicalized,
+            'headers': end - signed,
+            'total': end - start,
+        }, body_bytes)
+        return auth_headers, signed_headers, body
+
+    def presign(self, method, path, expires_in=60.0, refresh_margin=5.0):
+        """Sign 'method' and 'path' once and reuse the headers.
+
+        Every later body-less request for the same method and path (the
+        full path, e.g. /organizations/<org>/nodes/<name>; any query
+        string is ignored) gets the presigned headers, which are re-signed
+        in the background 'refresh_margin' seconds before they expire.
+        'expires_in' must be less than the Chef server's allowed clock
+        skew (15 minutes by default).
+
+        Returns the requests_chef.presign.PresignedHeaders bundle.
+        """
+        path = path.partition('?')[0]
+        bundle = presigning.PresignedHeaders(
+            self, method, path, expires_in=expires_in,
+            refresh_margin=refresh_margin)
+        previous = self._presigned.get((bundle.method, path))
+        self._presigned[(bundle.method, path)] = bundle
+        if previous is not None:
+            previous.cancel()
+        return bundle
+
+    def unpresign(self, method=None, path=None):
+        """Stop reusing presigned headers for 'method' and 'path'.
+
+        With no arguments, every presigned bundle is dropped.
+        """
+        if method is None and path is None:
+            keys = list(self._presigned)
+        else:
+            keys = [(method.upper(), path.partition('?')[0])]
+        for key in keys:
+            bundle = self._presigned.pop(key, None)
+            if bundle is not None:
+                bundle.cancel()
+
+    def sign_many(self, requests, timestamp=None):
+        """Sign many requests at once, returning their auth headers in order.
+
+        Each item is either a PreparedRequest, which is also signed in
+        place, or a (method, path_url[, body]) tuple. All requests share
+        one timestamp, each distinct path is hashed once and identical
+        canonical requests are signed once.
+        """
+        if timestamp is None:
+            timestamp = self.clock.timestamp()
+        hashed_paths = {}
+        pending = []
+        for request in requests:
+            prepared = hasattr(request, 'path_url')
+            if prepared:
+                method, path_url, body = (
+                    request.method, request.path_url, request.body)
+            else:
+                method, path_url, body = (tuple(request) + (None,))[:3]
+            hashed_body, body, _ = _content_digest(
+                body, algorithm=self.protocol.algorithm,
+                hash_cache=self.content_hash_cache)
+            if prepared:
+                request.body = body
+            stripped_path = path_url.partition('?')[0]
+            if stripped_path not in hashed_paths:
+                hashed_paths[stripped_path] = self.protocol.hash_path(
+                    stripped_path)
+            canonical_request = self.canonical_request_bytes(
+                method, hashed_paths[stripped_path], hashed_body, timestamp)
+            pending.append((request if prepared else None,
+                            hashed_body, canonical_request))
+
+        signed = self._signed_headers_batch(
+            [canonical_request for _, _, canonical_request in pending])
+        results = []
+        for (request, hashed_body, _), signed_headers in zip(pending, signed):
+            auth_headers = self._auth_headers(hashed_body, timestamp)
+            if request is not None:
+                request.headers.update(auth_headers)
+                request.headers.update(signed_headers.pairs())
+            auth_headers.update(signed_headers.pairs())
+            results.append(auth_headers)
+        return results
+
+    def signed_headers(self, canonical_request):
+        """Return the X-Ops-Authorization-N headers for a canonical request.
 
+        The returned SignedHeaders may be shared through the signature
+        cache.
+        """
+        cache = self.signature_cache
+        if cache is not None:
+            cache_key = (self._key_id, canonical_request)
+            signed_headers = cache.get(cache_key)
+            if signed_headers is not None:
+                return signed_headers
+        signed = self.private_key.sign(
+            canonical_request, b64=True,
+            algorithm=self.protocol.sign_algorithm)
+        signed_headers = _authorization_headers(signed)
+        if cache is not None:
+            cache.set(cache_key, signed_headers)
+        return signed_headers
+
+    def _signed_headers_batch(self, canonical_requests):
+        """Return signed_headers() for each canonical request, in order.
+
+        Uses the key's sign_batch() when it has one.
+        """
+        cache = self.signature_cache
+        results = [None] * len(canonical_requests)
+        misses = collections.OrderedDict()
+        for i, canonical_request in enumerate(canonical_requests):
+            if canonical_request in misses:
+                misses[canonical_request].append(i)
+                continue
+            if cache is not None:
+                results[i] = cache.get((self._key_id, canonical_request))
+                if results[i] is not None:
+                    continue
+            misses[canonical_request] = [i]
+        if not misses:
+            return results
+
+        payloads = list(misses)
+        sign_batch = getattr(self.private_key, 'sign_batch', None)
+        algorithm = self.protocol.sign_algorithm
+        if sign_batch is not None:
+            signatures = sign_batch(payloads, b64=True, algorithm=algorithm)
+        else:
+            signatures = [self.private_key.sign(data, b64=True,
+                                                algorithm=algorithm)
+                          for data in payloads]
+        for canonical_request, signed in zip(payloads, signatures):
+            signed_headers = _authorization_headers(signed)
+            if cache is not None:
+                cache.set((self._key_id, canonical_request), signed_headers)
+            for i in misses[canonical_request]:
+                results[i] = signed_headers
+        return results
+
+    def _auth_headers(self, hashed_body, timestamp):
+        """Assemble the X-Ops-* headers other than the signature."""
         auth_headers = {
-            'X-Ops-Sign': 'algorithm=sha1;version=1.0',
+            'X-Ops-Sign': self.protocol.sign_header,
             'X-Ops-UserId': self.user_id,
             'X-Ops-Timestamp': timestamp,
             'X-Ops-Content-Hash': hashed_body,
         }
+        auth_headers.update(self.protocol.headers())
+        return auth_headers
 
-        auth_headers.update(signed_headers)
-        request.headers.update(auth_headers)
+    def canonical_request(self, method, path, content, timestamp):
+        """Return the canonical request string.
 
-        return request
+        'path' is the request path as returned by protocol.hash_path().
+        """
+        return self.protocol.canonical_request(
+            method, path, content, timestamp, self._canonical_user_id)
+
+    def canonical_request_bytes(self, method, path, content, timestamp):
+        """Return canonical_request() encoded as UTF-8, built in one step.
+
+        The constant parts (including X-Ops-UserId) are encoded once, when
+        this ChefAuth is created. If canonical_request() is overridden (here
+        or by the protocol), it is called instead.
+        """
+        if self._canonical_format is None:
+            return self.canonical_request(
+                method, path, content, timestamp).encode('utf_8')
+        return self._canonical_format % (
+            _method_bytes(method), _to_bytes(path), _to_bytes(content),
+            _to_bytes(timestamp))
+
+
+def _parse_pem(data, password=None):
+    """Parse PEM data into a cryptography private key."""
+    try:
+        return serialization.load_pem_private_key(
+            data,
+            password=password,
+            backend=crypto_backends.default_backend())
+    except ValueError as exc:
+        # keep the message stable across cryptography releases
+        six.raise_from(ValueError('Could not unserialize key data.'), exc)
 
-    def canonical_request(self, method, path, content, timestamp):
-        """Return the canonical request string."""
-        request = collections.OrderedDict([
-            ('Method', method.upper()),
-            ('Hashed Path', path),
-            ('X-Ops-Content-Hash', content),
-            ('X-Ops-Timestamp', timestamp),
-            ('X-Ops-UserId', self.user_id),
-        ])
-        return '\n'.join(['%s:%s' % (key, value)
-                          for key, value in request.items()])
+
+class KeyRegistry(object):
+
+    """Thread-safe cache of parsed private keys, shared by a process.
+
+    Keys read from a file are cached by resolved path, and reloaded when
+    the file's device, inode, size or mtime change. Keys given as PEM
+    data are cached by a hash of the data. The password is part of both
+    cache keys.
+    """
+
+    def __init__(self, maxsize=256):
+        """Hold at most 'maxsize' keys."""
+        self._keys = cache.LRUCache(maxsize=maxsize, ttl=None)
+
+    def __len__(self):
+        """Return the number of cached keys."""
+        return len(self._keys)
+
+    def load(self, private_key, password=None):
+        """Return a cryptography private key for a PEM string or path."""
+        maybe_path = normpath(private_key)
+        try:
+            path_stat = os.stat(maybe_path)
+        except (OSError, ValueError):
+            path_stat = None
+        password_hash = password and hashlib.sha256(password).digest()
+
+        if path_stat is not None and stat.S_ISREG(path_stat.st_mode):
+            cache_key = ('path', maybe_path, password_hash)
+            version = (path_stat.st_dev, path_stat.st_ino,
+                       path_stat.st_size,
+                       getattr(path_stat, 'st_mtime_ns', path_stat.st_mtime))
+            cached = self._keys.get(cache_key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            with open(maybe_path, 'rb') as pkf:
+                pkey = _parse_pem(pkf.read(), password=password)
+            self._keys.set(cache_key, (version, pkey))
+            return pkey
+
+        if not isinstance(private_key, six.binary_type):
+            private_key = private_key.encode('utf-8')
+        cache_key = ('pem', hashlib.sha256(private_key).digest(),
+                     password_hash)
+        pkey = self._keys.get(cache_key)
+        if pkey is None:
+            pkey = _parse_pem(private_key, password=password)
+            self._keys.set(cache_key, pkey)
+        return pkey
+
+    def clear(self):
+        """Forget all cached keys."""
+        self._keys.clear()
+
+
+# The registry used by RSAKey.load_pem by default.
+KEY_REGISTRY = KeyRegistry()
 
 
 class RSAKey(object):
 
-    """Requires an instance of RSAPrivateKey to initialize.
+    """An RSA private key, signing through a signer backend.
 
-    The base class for this type is found in the crytography library
-    at cryptography.hazmat.primitives.asymmetric.rsa
+    Requires an instance of RSAPrivateKey (from the cryptography library
+    at cryptography.hazmat.primitives.asymmetric.rsa), which is signed
+    with in-process, or a requests_chef.signers.SignerBackend, e.g. a
+    PKCS11Backend or an agent.AgentBackend.
     """
 
     def __init__(self, private_key):
-        """Requires an RSAPrivateKey instance.
-
-        Key class from cryptography.hazmat.primitives.asymmetric.rsa
-        """
-        if not isinstance(private_key, rsa.RSAPrivateKey):
+        """Requires an RSAPrivateKey or SignerBackend instance."""
+        if isinstance(private_key, signers.SignerBackend):
+            backend = private_key
+        elif isinstance(private_key, rsa.RSAPrivateKey):
+            backend = signers.CryptographyBackend(private_key)
+        else:
             raise TypeError("private_key must be an instance of "
-                            "cryptography-RSAPrivateKey.")
-        self.private_key = private_key
+                            "cryptography-RSAPrivateKey or SignerBackend.")
+        self.backend = backend
+        # the cryptography key, when signing in-process
+        self.private_key = getattr(backend, 'private_key', None)
+        self.fingerprint = backend.fingerprint
 
     @classmethod
-    def load_pem(cls, private_key, password=None):
+    def load_pem(cls, private_key, password=None, registry=KEY_REGISTRY):
         """Return a PrivateKey instance.
 
         :param private_key: Private key string (PEM format) or the path
                             to a local private key file.
+        :param registry: KeyRegistry used to parse each key only once.
+                         Pass None to always read and parse the key.
         """
+        if registry is not None:
+            return cls(registry.load(private_key, password=password))
         # TODO(sam): try to break this in tests
         maybe_path = normpath(private_key)
         if os.path.isfile(maybe_path):
@@ -170,23 +1075,34 @@ class RSAKey(object):
         if not isinstance(private_key, six.binary_type):
             private_key = private_key.encode('utf-8')
 
-        pkey = serialization.load_pem_private_key(
-            private_key,
-            password=password,
-            backend=crypto_backends.default_backend())
-        return cls(pkey)
+        return cls(_parse_pem(private_key, password=password))
 
-    def sign(self, data, b64=True):
+    def sign(self, data, b64=True, algorithm=None):
         """Sign data with the private key and return the signed data.
 
         The signed data will be Base64 encoded if b64 is True.
+
+        With no 'algorithm' the data itself is signed with PKCS1v15
+        padding and no DigestInfo (protocols 1.0 and 1.1). Otherwise
+        'algorithm' ('sha1' or 'sha256') is used to hash the data once
+        for a standard PKCS1v15 signature (protocol 1.3).
         """
-        padder = padding.PKCS1v15()
-        signer = self.private_key.signer(padder, None)
-        if not isinstance(data, six.binary_type):
-            data = data.encode('utf_8')
-        signer.update(data)
-        signed = signer.finalize()
+        signed = self.backend.sign(data, algorithm=algorithm)
         if b64:
             signed = base64.b64encode(signed)
         return signed
+
+    def sign_batch(self, payloads, b64=True, algorithm=None):
+        """Sign each of 'payloads', returning the signed data in order.
+
+        Identical payloads are only signed once, and the rest are passed
+        to the backend together.
+        """
+        payloads = [data if isinstance(data, six.binary_type)
+                    else data.encode('utf_8') for data in payloads]
+        unique = list(collections.OrderedDict.fromkeys(payloads))
+        signatures = self.backend.sign_batch(unique, algorithm=algorithm)
+        if b64:
+            signatures = [base64.b64encode(sig) for sig in signatures]
+        signed = dict(zip(unique, signatures))
+        return [signed[data] for data in payloads]
@@ -0,0 +1,121 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Offload RSA signing to a pool of worker processes.
+
+A SigningPool has the same sign() interface as RSAKey, so it can be
+handed to ChefAuth in place of a key:
+
+    pool = SigningPool('~/chef-user.pem')
+    auth = ChefAuth('chef-user', pool)
+
+Each worker process loads the private key once, when it starts. Calls
+to sign() block the calling thread only, so many threads sharing one
+ChefAuth (e.g. through a requests.Session) sign in parallel.
+"""
+
+import collections
+from concurrent import futures
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from requests_chef import mixlib_auth
+from requests_chef import signers
+
+# The key loaded by _load_worker_key in each worker process.
+_WORKER_KEY = None
+
+
+def _load_worker_key(pem):
+    """Process pool initializer: load the private key once per worker."""
+    global _WORKER_KEY  # pylint: disable=global-statement
+    _WORKER_KEY = mixlib_auth.RSAKey.load_pem(pem)
+
+
+def _sign(data, b64, algorithm):
+    """Sign 'data' with the worker's private key."""
+    return _WORKER_KEY.sign(data, b64=b64, algorithm=algorithm)
+
+
+def _rsa_private_key(private_key, password=None):
+    """Return 'private_key' as a cryptography RSAPrivateKey."""
+    if isinstance(private_key, mixlib_auth.RSAKey):
+        if private_key.private_key is None:
+            raise TypeError("SigningPool needs a key it can load in each "
+                            "worker, not {0!r}".format(private_key.backend))
+        private_key = private_key.private_key
+    elif not isinstance(private_key, rsa.RSAPrivateKey):
+        private_key = mixlib_auth.RSAKey.load_pem(
+            private_key, password=password).private_key
+    return private_key
+
+
+class SigningPool(object):
+
+    """Sign data with a private key loaded in a pool of worker processes.
+
+    Accepts the same private key types as ChefAuth: an RSAKey, a
+    cryptography RSAPrivateKey, a PEM string or the path to a PEM file.
+    """
+
+    def __init__(self, private_key, max_workers=None, password=None):
+        """Start 'max_workers' processes (default: one per CPU)."""
+        private_key = _rsa_private_key(private_key, password=password)
+        # ChefAuth keys its signature cache by this
+        self.fingerprint = signers.public_key_fingerprint(
+            private_key.public_key())
+        pem = private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption())
+        self._executor = futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_load_worker_key,
+            initargs=(pem,))
+
+    def __enter__(self):
+        """Use the pool as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Shut the pool down on exit."""
+        self.shutdown()
+
+    def submit(self, data, b64=True, algorithm=None):
+        """Schedule signing of 'data' and return a Future."""
+        return self._executor.submit(_sign, data, b64, algorithm)
+
+    def sign(self, data, b64=True, algorithm=None):
+        """Sign data in a worker process and return the signed data.
+
+        Arguments are the same as for RSAKey.sign.
+        """
+        return self.submit(data, b64=b64, algorithm=algorithm).result()
+
+    def sign_many(self, payloads, b64=True, algorithm=None):
+        """Sign each of 'payloads' across the pool, returning a list."""
+        return [future.result()
+                for future in [self.submit(data, b64=b64,
+                                           algorithm=algorithm)
+                               for data in payloads]]
+
+    def sign_batch(self, payloads, b64=True, algorithm=None):
+        """Like sign_many, but identical payloads are only signed once."""
+        unique = list(collections.OrderedDict.fromkeys(payloads))
+        signed = dict(zip(unique, self.sign_many(
+            unique, b64=b64, algorithm=algorithm)))
+        return [signed[data] for data in payloads]
+
+    def shutdown(self, wait=True):
+        """Stop the worker processes."""
+        self._executor.shutdown(wait=wait)
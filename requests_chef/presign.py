@@ -0,0 +1,97 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Signed header bundles reused for repeated body-less requests.
+
+A Chef server accepts a signed request for as long as its timestamp is
+within the server's allowed clock skew (15 minutes by default). For
+endpoints that are polled, ChefAuth.presign() signs a method and path
+once and reuses the headers for every matching request; a background
+timer re-signs them shortly before they expire, so requests never wait
+on the private key operation.
+"""
+
+import threading
+
+
+class PresignedHeaders(object):
+
+    """Auth headers for one method and path, re-signed before expiry.
+
+    :param auth: ChefAuth to sign with.
+    :param expires_in: Seconds the headers are used for after signing;
+                       must be less than the server's allowed skew.
+    :param refresh_margin: Seconds before expiry to re-sign.
+    """
+
+    def __init__(self, auth, method, path, expires_in=60.0,
+                 refresh_margin=5.0):
+        """Sign the headers and schedule the first refresh."""
+        if not 0 <= refresh_margin < expires_in:
+            raise ValueError("'refresh_margin' must be between 0 and "
+                             "'expires_in'.")
+        self.auth = auth
+        self.method = method.upper()
+        self.path = path
+        self.expires_in = expires_in
+        self.refresh_margin = refresh_margin
+        # (headers, expiry) replaced as one, so readers never need a lock
+        self._signed = (None, 0)
+        self._timer = None
+        self._cancelled = False
+        # guards _timer, so each bundle has a single refresh timer
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def __repr__(self):
+        """Show the method and path."""
+        return '%s(%s %s)' % (type(self).__name__, self.method, self.path)
+
+    @property
+    def expires_at(self):
+        """Return when the current headers expire, in clock time."""
+        return self._signed[1]
+
+    def headers(self):
+        """Return the current headers, or None if they have expired."""
+        headers, expires_at = self._signed
+        if self.auth.clock.time() < expires_at:
+            return headers
+        return None
+
+    def refresh(self):
+        """Sign the headers now and reschedule the next refresh."""
+        clock = self.auth.clock
+        signed_at = clock.time()
+        headers, _ = self.auth.sign_request(
+            self.method, self.path, timestamp=clock.timestamp())
+        self._signed = (headers, signed_at + self.expires_in)
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            if not self._cancelled:
+                self._timer = threading.Timer(
+                    self.expires_in - self.refresh_margin, self._refresh)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _refresh(self):
+        """Timer callback: refresh unless cancelled."""
+        if not self._cancelled:
+            self.refresh()
+
+    def cancel(self):
+        """Stop refreshing; the current headers stay usable until expiry."""
+        with self._lock:
+            self._cancelled = True
+            if self._timer is not None:
+                self._timer.cancel()
@@ -0,0 +1,233 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Chef search that yields rows as they arrive.
+
+    search = ChefSearch(ChefSession(...))
+    for node in search('node', 'role:web'):
+        ...
+
+    # partial search: only the named attributes are returned
+    for row in search('node', 'role:web',
+                      filter_result={'ip': ['ipaddress']}):
+        row['data']['ip']
+
+Pages are requested concurrently by a bounded pool of threads, and each
+response is parsed incrementally, so only a window of pages is in flight
+and no page is ever held in memory as a whole.
+
+https://docs.chef.io/server/api_chef_server/#search
+"""
+
+import codecs
+import collections
+from concurrent import futures
+import functools
+import json
+
+# Bytes read from a response at a time while parsing.
+READ_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+
+
+class _JSONStream(object):
+
+    """Incremental reader over a stream of JSON text chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self):
+        """Append the next chunk to the buffer; return False at EOF."""
+        if self.eof:
+            return False
+        # drop what has been parsed already before growing the buffer
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        for chunk in self._chunks:
+            if chunk:
+                self.buf += chunk
+                return True
+        self.eof = True
+        return False
+
+    def peek(self):
+        """Return the next non-whitespace character, or '' at EOF."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in (
+                    _WHITESPACE):
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._read():
+                return ''
+
+    def expect(self, char):
+        """Consume 'char', the next non-whitespace character."""
+        found = self.peek()
+        if found != char:
+            raise ValueError('Expected %r at offset %d, found %r.' % (
+                char, self.pos, found))
+        self.pos += 1
+
+    def value(self):
+        """Decode and consume the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self._read():
+                    continue
+                raise
+            # a number at the end of the buffer may continue in the
+            # next chunk
+            if end == len(self.buf) and self._read():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_rows(chunks, key='rows', meta=None):
+    """Yield the items of the 'key' array of a streamed JSON object.
+
+    :param chunks: Iterable of text chunks making up one JSON object.
+    :param meta: Optional dict, updated with the object's other members
+                 as they are parsed.
+    """
+    stream = _JSONStream(chunks)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        name = stream.value()
+        stream.expect(':')
+        if name == key:
+            stream.expect('[')
+            if stream.peek() != ']':
+                while True:
+                    yield stream.value()
+                    if stream.peek() != ',':
+                        break
+                    stream.expect(',')
+            stream.expect(']')
+        else:
+            value = stream.value()
+            if meta is not None:
+                meta[name] = value
+        if stream.peek() != ',':
+            break
+        stream.expect(',')
+    stream.expect('}')
+
+
+def iter_response_rows(response, meta=None, read_size=READ_SIZE):
+    """Yield the rows of a streamed search response, then close it."""
+    try:
+        response.raise_for_status()
+        decoder = codecs.getincrementaldecoder(
+            response.encoding or 'utf-8')()
+        chunks = (decoder.decode(chunk)
+                  for chunk in response.iter_content(read_size))
+        for row in iter_json_rows(chunks, meta=meta):
+            yield row
+    finally:
+        response.close()
+
+
+class ChefSearch(object):
+
+    """Search a Chef server, yielding rows from concurrently fetched pages.
+
+    :param session: Session that signs requests and resolves paths
+                    relative to the Chef server, e.g. a ChefSession. Its
+                    pool_maxsize should be at least workers + 1.
+    :param rows: Rows requested per page.
+    :param workers: Pages requested at once.
+    """
+
+    def __init__(self, session, rows=1000, workers=4):
+        """Search through 'session'."""
+        if workers < 1:
+            raise ValueError("'workers' must be at least 1.")
+        self.session = session
+        self.rows = rows
+        self.workers = workers
+
+    def __call__(self, index, q='*:*', filter_result=None, **kwargs):
+        """Shortcut for search()."""
+        return self.search(index, q=q, filter_result=filter_result,
+                           **kwargs)
+
+    def _page(self, index, q, start, rows, sort, filter_result):
+        """Request one page, returning the unread (streamed) response."""
+        params = {'q': q, 'start': start, 'rows': rows}
+        if sort:
+            params['sort'] = sort
+        path = 'search/%s' % index
+        if filter_result is None:
+            return self.session.get(path, params=params, stream=True)
+        return self.session.post(path, params=params, json=filter_result,
+                                 stream=True)
+
+    def search(self, index, q='*:*', filter_result=None, start=0,
+               rows=None, sort=None):
+        """Yield every row matching 'q' in 'index', in server order.
+
+        :param filter_result: Dict of {name: [attribute, path, ...]} for
+                              a partial search; rows are then
+                              {'url': ..., 'data': {name: value}}.
+        """
+        rows = rows or self.rows
+        fetch = functools.partial(self._page, index, q, rows=rows,
+                                  sort=sort, filter_result=filter_result)
+        meta = {}
+        first = fetch(start)
+        with futures.ThreadPoolExecutor(self.workers) as executor:
+            pending = collections.deque()
+            offsets = None
+            try:
+                for row in iter_response_rows(first, meta=meta):
+                    # total comes before rows, so start fetching the
+                    # other pages while the first one is read
+                    if offsets is None and 'total' in meta:
+                        offsets = iter(range(start + rows, meta['total'],
+                                             rows))
+                        self._fill(executor, pending, offsets, fetch)
+                    yield row
+                if offsets is None:
+                    offsets = iter(range(start + rows, meta.get('total', 0),
+                                         rows))
+                    self._fill(executor, pending, offsets, fetch)
+                while pending:
+                    response = pending.popleft().result()
+                    self._fill(executor, pending, offsets, fetch)
+                    for row in iter_response_rows(response):
+                        yield row
+            finally:
+                first.close()
+                for future in pending:
+                    if not future.cancel() and future.exception() is None:
+                        future.result().close()
+
+    def _fill(self, executor, pending, offsets, fetch):
+        """Keep up to 'workers' page requests in flight."""
+        while len(pending) < self.workers:
+            offset = next(offsets, None)
+            if offset is None:
+                return
+            pending.append(executor.submit(fetch, offset))
@@ -0,0 +1,139 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A requests.Session preconfigured to talk to a Chef server.
+
+    session = ChefSession('https://chef.example.com/organizations/acme',
+                          'chef-user', '~/chef-user.pem')
+    session.get('/nodes/web-1').json()
+
+Connections are pooled and kept alive, so requests after the first
+skip the TCP and TLS handshakes. One session can be shared by many
+threads: the pool hands each in-flight request its own connection.
+"""
+
+import collections
+import threading
+
+import requests
+from requests import adapters
+from six.moves.urllib import parse as urlparse
+from urllib3.util import retry as urllib3_retry
+
+from requests_chef import mixlib_auth
+
+DEFAULT_CHEF_VERSION = '12.0.2'
+
+# Responses retried (with backoff) for idempotent requests.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def make_retry(max_retries=3, backoff_factor=0.5,
+               status_forcelist=RETRY_STATUSES):
+    """Return a urllib3 Retry for connection errors and 'status_forcelist'.
+
+    Only idempotent methods are retried, and Retry-After is respected.
+    """
+    return urllib3_retry.Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        raise_on_status=False)
+
+
+class ChefSession(requests.Session):
+
+    """Session that signs requests with ChefAuth over pooled connections.
+
+    Either pass an auth object (e.g. a ChefAuth) as 'auth', or the
+    'user_id' and 'private_key' (and any other ChefAuth arguments as
+    keywords) to build one.
+
+    Relative URLs are resolved against 'server_url', which may include a
+    path such as /organizations/<org>.
+
+    With an auth that has a pool_prefix(url) method, such as
+    MultiChefAuth, each identity gets its own connection pool.
+    """
+
+    def __init__(self, server_url, user_id=None, private_key=None,
+                 auth=None, chef_version=DEFAULT_CHEF_VERSION,
+                 pool_connections=10, pool_maxsize=10, pool_block=False,
+                 max_retries=3, backoff_factor=0.5,
+                 status_forcelist=RETRY_STATUSES, **auth_kwargs):
+        """Configure auth, default headers and the connection pool.
+
+        :param pool_connections: Number of hosts to keep pools for.
+        :param pool_maxsize: Connections kept alive per host; size this
+                             to the number of threads sharing the session.
+        :param pool_block: Block instead of opening extra connections
+                           when the pool is exhausted.
+        :param max_retries: Retries for connection errors and for
+                            'status_forcelist' responses.
+        """
+        super(ChefSession, self).__init__()
+        self.server_url = server_url.rstrip('/') + '/'
+        if auth is None:
+            auth = mixlib_auth.ChefAuth(user_id, private_key, **auth_kwargs)
+        self.auth = auth
+        self.headers.update({
+            'Accept': 'application/json',
+            'X-Chef-Version': chef_version,
+        })
+        self._adapter_kwargs = {
+            'pool_connections': pool_connections,
+            'pool_maxsize': pool_maxsize,
+            'pool_block': pool_block,
+            'max_retries': make_retry(max_retries, backoff_factor,
+                                      status_forcelist),
+        }
+        self._mount_lock = threading.Lock()
+        adapter = adapters.HTTPAdapter(**self._adapter_kwargs)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def __repr__(self):
+        """Show the server and auth."""
+        return '%s(%s, %r)' % (type(self).__name__, self.server_url,
+                               self.auth)
+
+    def get_adapter(self, url):
+        """Return the adapter for 'url', mounting one per auth identity."""
+        pool_prefix = getattr(self.auth, 'pool_prefix', None)
+        prefix = pool_prefix(url) if pool_prefix is not None else None
+        if prefix is not None and prefix not in self.adapters:
+            with self._mount_lock:
+                if prefix not in self.adapters:
+                    self._mount_new(prefix)
+        return super(ChefSession, self).get_adapter(url)
+
+    def _mount_new(self, prefix):
+        """Mount a new adapter at 'prefix' without disturbing readers.
+
+        Like Session.mount, but the adapters dict is replaced rather than
+        changed in place, since other threads may be iterating over it.
+        """
+        mounted = collections.OrderedDict(self.adapters)
+        mounted[prefix] = adapters.HTTPAdapter(**self._adapter_kwargs)
+        for key in [key for key in mounted if len(key) < len(prefix)]:
+            mounted[key] = mounted.pop(key)
+        self.adapters = mounted
+
+    def url(self, path):
+        """Return the absolute URL for 'path' on the Chef server."""
+        return urlparse.urljoin(self.server_url, path.lstrip('/'))
+
+    def request(self, method, url, *args, **kwargs):
+        """Send a request, resolving 'url' against the server URL."""
+        # pylint: disable=arguments-differ
+        return super(ChefSession, self).request(
+            method, self.url(url), *args, **kwargs)
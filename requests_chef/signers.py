@@ -0,0 +1,167 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Signer backends: where RSAKey's private key operations happen.
+
+A backend signs bytes with PKCS1v15 padding and returns the raw
+signature. With no 'algorithm' the data is signed as is, with no
+DigestInfo (Chef protocols 1.0 and 1.1); otherwise the data is hashed
+with 'algorithm' ('sha1' or 'sha256') for a standard PKCS1v15 signature
+(protocol 1.3).
+
+    CryptographyBackend  in-process, using the cryptography library
+    PKCS11Backend        a key held in a PKCS#11 token (an HSM, SoftHSM)
+    agent.AgentBackend   a SigningAgent listening on a Unix socket
+"""
+
+import hashlib
+import threading
+
+import six
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import utils as crypto_utils
+
+# Digest algorithms (hashlib names) used for signing, by cryptography name.
+SIGN_ALGORITHMS = {
+    'sha1': hashes.SHA1,
+    'sha256': hashes.SHA256,
+}
+
+
+def _to_bytes(data):
+    """Encode text as UTF-8."""
+    if not isinstance(data, six.binary_type):
+        data = data.encode('utf_8')
+    return data
+
+
+def public_key_fingerprint(public_key):
+    """Return the hex SHA-256 of an RSAPublicKey's DER encoding."""
+    der = public_key.public_bytes(
+        serialization.Encoding.DER,
+        serialization.PublicFormat.SubjectPublicKeyInfo)
+    return hashlib.sha256(der).hexdigest()
+
+
+class SignerBackend(object):
+
+    """Base class for signer backends."""
+
+    # Identifies the key, e.g. in signature cache keys; None if the
+    # backend cannot tell which key it signs with.
+    fingerprint = None
+
+    def sign(self, data, algorithm=None):
+        """Return the raw PKCS1v15 signature of 'data' (bytes)."""
+        raise NotImplementedError
+
+    def sign_batch(self, payloads, algorithm=None):
+        """Return the signatures of each of 'payloads', in order.
+
+        Backends that can sign several payloads at once (e.g. in one
+        round trip) override this.
+        """
+        return [self.sign(data, algorithm=algorithm) for data in payloads]
+
+
+class CryptographyBackend(SignerBackend):
+
+    """Sign in-process with a cryptography RSAPrivateKey."""
+
+    def __init__(self, private_key):
+        """Sign with 'private_key', an RSAPrivateKey."""
+        if not isinstance(private_key, rsa.RSAPrivateKey):
+            raise TypeError("private_key must be an instance of "
+                            "cryptography-RSAPrivateKey.")
+        self.private_key = private_key
+        self.fingerprint = public_key_fingerprint(private_key.public_key())
+        self._padding = padding.PKCS1v15()
+        self._no_digest_info = crypto_utils.NoDigestInfo()
+
+    def sign(self, data, algorithm=None):
+        """Return the raw PKCS1v15 signature of 'data'."""
+        data = _to_bytes(data)
+        if algorithm is None:
+            return self.private_key.sign(data, self._padding,
+                                         self._no_digest_info)
+        digest = getattr(hashlib, algorithm)(data).digest()
+        return self.private_key.sign(
+            digest, self._padding,
+            crypto_utils.Prehashed(SIGN_ALGORITHMS[algorithm]()))
+
+
+def _import_pkcs11():
+    """Import python-pkcs11, which is only needed by PKCS11Backend."""
+    try:
+        import pkcs11  # pylint: disable=import-error
+    except ImportError as exc:
+        six.raise_from(ImportError(
+            "PKCS11Backend requires python-pkcs11 "
+            "('pip install requests-chef[pkcs11]')."), exc)
+    return pkcs11
+
+
+class PKCS11Backend(SignerBackend):
+
+    """Sign with an RSA private key held in a PKCS#11 token.
+
+    Requires python-pkcs11. For local testing, SoftHSM provides a token:
+
+        softhsm2-util --init-token --free --label chef --pin 1234 --so-pin 0
+        PKCS11Backend('/usr/lib/softhsm/libsofthsm2.so', 'chef',
+                      key_label='chef-user', pin='1234')
+
+    :param module: Path to the PKCS#11 module (shared library).
+    :param token_label: Label of the token holding the key.
+    :param key_label: Label of the private key; may be omitted if the
+                      token holds a single private key.
+    :param pin: User PIN to log in to the token.
+    """
+
+    def __init__(self, module, token_label, key_label=None, pin=None):
+        """Open a session on the token and find the private key."""
+        pkcs11 = _import_pkcs11()
+        self.fingerprint = 'pkcs11:%s:%s:%s' % (module, token_label,
+                                                key_label)
+        self.token = pkcs11.lib(module).get_token(token_label=token_label)
+        self._session = self.token.open(user_pin=pin)
+        self.private_key = self._session.get_key(
+            object_class=pkcs11.ObjectClass.PRIVATE_KEY,
+            key_type=pkcs11.KeyType.RSA,
+            label=key_label)
+        self._mechanisms = {
+            # CKM_RSA_PKCS pads the data without adding a DigestInfo
+            None: pkcs11.Mechanism.RSA_PKCS,
+            'sha1': pkcs11.Mechanism.SHA1_RSA_PKCS,
+            'sha256': pkcs11.Mechanism.SHA256_RSA_PKCS,
+        }
+        # a PKCS#11 session must not be used by two threads at once
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """Show the token."""
+        return '%s(%s)' % (type(self).__name__, self.token.label)
+
+    def sign(self, data, algorithm=None):
+        """Return the raw PKCS1v15 signature of 'data'."""
+        mechanism = self._mechanisms[algorithm]
+        with self._lock:
+            return self.private_key.sign(_to_bytes(data),
+                                         mechanism=mechanism)
+
+    def close(self):
+        """Close the session with the token."""
+        self._session.close()
@@ -0,0 +1,153 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Upload files to a Chef server sandbox, e.g. the files of a cookbook.
+
+    uploader = SandboxUploader(ChefSession(...))
+    result = uploader.upload(['recipes/default.rb', 'metadata.rb'])
+    result.checksums  # {path: md5 hex}, for the cookbook manifest
+
+The pipeline is:
+
+1. checksum every file, in a pool of processes;
+2. create a sandbox (POST /sandboxes) listing the checksums;
+3. PUT each file the server does not have yet ('needs_upload') to the
+   URL it returned, concurrently, streaming the file from disk;
+4. commit the sandbox (PUT /sandboxes/<id> {"is_completed": true}).
+
+https://docs.chef.io/server/api_chef_server/#sandboxes
+"""
+
+import base64
+import binascii
+import collections
+from concurrent import futures
+import hashlib
+
+from requests_chef import mixlib_auth
+
+UploadResult = collections.namedtuple(
+    'UploadResult', 'sandbox_id checksums uploaded skipped')
+UploadResult.__doc__ = """Outcome of SandboxUploader.upload.
+
+checksums maps each path to the MD5 hex digest the server knows it by;
+uploaded and skipped list the paths that were and were not sent.
+"""
+
+
+def file_checksum(path, chunksize=mixlib_auth.CHUNK_SIZE):
+    """Return the MD5 hex digest of the file at 'path'."""
+    hasher = hashlib.md5()
+    buf = bytearray(chunksize)
+    view = memoryview(buf)
+    with open(path, 'rb') as fileobj:
+        while True:
+            count = fileobj.readinto(buf)
+            if not count:
+                break
+            hasher.update(view[:count])
+    return hasher.hexdigest()
+
+
+def file_checksums(paths, executor=None, max_workers=None):
+    """Return {path: MD5 hex digest} for 'paths', hashed in parallel.
+
+    Files are hashed in 'executor' if given, otherwise in a new pool of
+    'max_workers' processes (default: one per CPU).
+    """
+    paths = list(paths)
+    if executor is None:
+        with futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return file_checksums(paths, executor=pool)
+    return dict(zip(paths, executor.map(file_checksum, paths)))
+
+
+class SandboxUploader(object):
+
+    """Upload files to a Chef server through a sandbox.
+
+    :param session: Session that signs requests and resolves paths
+                    relative to the Chef server, e.g. a ChefSession. Its
+                    pool_maxsize should be at least 'workers'.
+    :param workers: Files uploaded at once.
+    :param hash_workers: Processes hashing files (default: one per CPU).
+    """
+
+    def __init__(self, session, workers=8, hash_workers=None):
+        """Upload through 'session'."""
+        if workers < 1:
+            raise ValueError("'workers' must be at least 1.")
+        self.session = session
+        self.workers = workers
+        self.hash_workers = hash_workers
+
+    def __repr__(self):
+        """Show the session."""
+        return '%s(%r)' % (type(self).__name__, self.session)
+
+    def create_sandbox(self, checksums):
+        """POST /sandboxes for 'checksums'; return the parsed response."""
+        response = self.session.post(
+            'sandboxes',
+            json={'checksums': dict.fromkeys(checksums)})
+        response.raise_for_status()
+        return response.json()
+
+    def upload_file(self, url, path, checksum):
+        """Stream the file at 'path' to a sandbox checksum 'url'."""
+        content_md5 = base64.b64encode(binascii.unhexlify(checksum))
+        with open(path, 'rb') as fileobj:
+            response = self.session.put(url, data=fileobj, headers={
+                'Content-Type': 'application/x-binary',
+                'Content-MD5': content_md5.decode('ascii'),
+            })
+        response.raise_for_status()
+        return response
+
+    def commit_sandbox(self, sandbox_id):
+        """Mark the sandbox as complete; return the parsed response."""
+        response = self.session.put('sandboxes/%s' % sandbox_id,
+                                    json={'is_completed': True})
+        response.raise_for_status()
+        return response.json()
+
+    def upload(self, paths):
+        """Upload the files at 'paths' and commit them; return a result.
+
+        Files with identical content are only uploaded once.
+        """
+        checksums = file_checksums(paths, max_workers=self.hash_workers)
+        by_checksum = {}
+        for path, checksum in checksums.items():
+            by_checksum.setdefault(checksum, path)
+        sandbox = self.create_sandbox(by_checksum)
+        needed = dict((checksum, info['url'])
+                      for checksum, info in sandbox['checksums'].items()
+                      if info.get('needs_upload'))
+        with futures.ThreadPoolExecutor(self.workers) as executor:
+            jobs = [executor.submit(self.upload_file, url,
+                                    by_checksum[checksum], checksum)
+                    for checksum, url in needed.items()]
+            try:
+                for job in futures.as_completed(jobs):
+                    job.result()
+            except Exception:
+                for job in jobs:
+                    job.cancel()
+                raise
+        self.commit_sandbox(sandbox['sandbox_id'])
+        uploaded = [path for path, checksum in checksums.items()
+                    if checksum in needed]
+        skipped = [path for path, checksum in checksums.items()
+                   if checksum not in needed]
+        return UploadResult(sandbox['sandbox_id'], checksums, uploaded,
+                            skipped)
@@ -0,0 +1,332 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Verify Chef-signed requests on the receiving side.
+
+    verifier = ChefAuthVerifier({'chef-user': '/etc/keys/chef-user.pub'})
+    user_id = verifier.verify('GET', '/nodes/web-1', headers, body)
+
+    # or in front of a WSGI app; the client is in environ['chef.user_id']
+    app = WSGIMiddleware(app, verifier)
+
+(aio.ASGIMiddleware does the same for ASGI apps.)
+
+The canonical request is rebuilt by the same protocol classes ChefAuth
+signs with, and checked against the X-Ops-Authorization-N headers with
+the client's public key. Parsed public keys are cached, and so are
+verified signatures: a request whose headers were verified before (e.g.
+a retry, or presigned headers) is accepted without another RSA
+operation, or refused as a replay if replays are rejected.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import re
+
+from cryptography import exceptions as crypto_exceptions
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+import six
+from six.moves.urllib import parse as urlparse
+
+from requests_chef import cache
+from requests_chef import clock as clocks
+from requests_chef import mixlib_auth
+
+# Chef server's default allowed clock skew, in seconds.
+ALLOWED_SKEW = 15 * 60
+
+parse_timestamp = clocks.parse_timestamp
+
+# X-Ops-Server-API-Version values whose protocols are memoized; others
+# (e.g. junk from unauthenticated clients) get a protocol per request.
+_API_VERSION = re.compile(r'^[0-9]{1,2}$')
+
+_BASE64 = re.compile(r'^(?:[A-Za-z0-9+/]{4})*(?:[A-Za-z0-9+/]{2}==|'
+                     r'[A-Za-z0-9+/]{3}=)?$')
+
+
+class AuthenticationError(Exception):
+
+    """A request's signature headers did not verify."""
+
+
+def load_public_key(key):
+    """Return an RSAPublicKey for a public or private key.
+
+    Accepts an RSAPublicKey, an RSAPrivateKey or RSAKey, or PEM data (or
+    the path to a PEM file) holding either.
+    """
+    if isinstance(key, rsa.RSAPublicKey):
+        return key
+    if isinstance(key, mixlib_auth.RSAKey):
+        key = key.private_key
+    if isinstance(key, rsa.RSAPrivateKey):
+        return key.public_key()
+    data = key
+    try:
+        with open(mixlib_auth.normpath(key), 'rb') as pem:
+            data = pem.read()
+    except (IOError, OSError, TypeError, ValueError):
+        pass
+    if not isinstance(data, six.binary_type):
+        data = data.encode('utf_8')
+    if b'PUBLIC KEY' in data:
+        return serialization.load_pem_public_key(data)
+    return mixlib_auth.RSAKey.load_pem(data).private_key.public_key()
+
+
+def sign_version(sign_header):
+    """Return the protocol version from an X-Ops-Sign header."""
+    fields = dict(field.strip().partition('=')[::2]
+                  for field in sign_header.split(';'))
+    return fields.get('version', '1.0')
+
+
+def join_signature(headers):
+    """Return the signature split across X-Ops-Authorization-N headers.
+
+    The inverse of mixlib_auth.splitter; 'headers' has lower-case names.
+    """
+    chunks = []
+    while True:
+        chunk = headers.get('x-ops-authorization-%d' % (len(chunks) + 1))
+        if chunk is None:
+            break
+        chunks.append(chunk)
+    encoded = ''.join(chunks)
+    # b64decode skips stray characters; a signature must be exact
+    if not encoded or not _BASE64.match(encoded):
+        raise AuthenticationError('X-Ops-Authorization is missing or not '
+                                  'base64.')
+    return base64.b64decode(encoded)
+
+
+def _text(value):
+    """Return a header value as text."""
+    if isinstance(value, six.binary_type):
+        return value.decode('latin-1')
+    return value
+
+
+class ChefAuthVerifier(object):
+
+    """Verify the X-Ops-* signature headers of incoming requests.
+
+    :param public_keys: dict of {user_id: key}, keys in any form
+                        accepted by load_public_key.
+    :param key_loader: Optional callable(user_id) returning the key of a
+                       client not in 'public_keys' (or None if unknown);
+                       parsed keys are kept in 'key_cache'.
+    :param key_cache: Cache of parsed public keys (default: an LRUCache
+                      of 1024 keys for 5 minutes).
+    :param allowed_skew: Seconds a timestamp may differ from the clock.
+    :param clock: requests_chef.clock.Clock timestamps are checked
+                  against.
+    :param verified_size: Verified signatures remembered, for as long as
+                          their timestamps are valid.
+    :param reject_replays: Refuse a signature seen before, instead of
+                           accepting it without verifying it again.
+    """
+
+    def __init__(self, public_keys=None, key_loader=None, key_cache=None,
+                 allowed_skew=ALLOWED_SKEW, clock=None,
+                 verified_size=65536, reject_replays=False):
+        """Configure the keys, caches and skew window."""
+        self.public_keys = dict(
+            (user_id, load_public_key(key))
+            for user_id, key in (public_keys or {}).items())
+        self.key_loader = key_loader
+        self.key_cache = (cache.LRUCache(maxsize=1024, ttl=300.0)
+                          if key_cache is None else key_cache)
+        self.allowed_skew = allowed_skew
+        self.clock = clocks.DEFAULT_CLOCK if clock is None else clock
+        self.verified = cache.LRUCache(maxsize=verified_size,
+                                       ttl=2 * allowed_skew)
+        self.reject_replays = reject_replays
+        self._protocols = {}
+
+    def __repr__(self):
+        """Show the number of known clients."""
+        return '%s(%d clients)' % (type(self).__name__,
+                                   len(self.public_keys))
+
+    def public_key(self, user_id):
+        """Return the RSAPublicKey of 'user_id', or None if unknown."""
+        key = self.public_keys.get(user_id)
+        if key is not None or self.key_loader is None:
+            return key
+        key = self.key_cache.get(user_id)
+        if key is None:
+            loaded = self.key_loader(user_id)
+            if loaded is None:
+                return None
+            key = load_public_key(loaded)
+            self.key_cache.set(user_id, key)
+        return key
+
+    def protocol(self, headers):
+        """Return the protocol a request was signed with."""
+        version = sign_version(headers.get('x-ops-sign', ''))
+        api_version = headers.get('x-ops-server-api-version', '0')
+        key = (version, api_version if version == '1.3' else None)
+        protocol = self._protocols.get(key)
+        if protocol is None:
+            try:
+                protocol = mixlib_auth.get_protocol(version)
+            except ValueError as exc:
+                raise AuthenticationError(str(exc))
+            if version == '1.3':
+                protocol = mixlib_auth.ProtocolV13(api_version)
+                if not _API_VERSION.match(api_version):
+                    return protocol
+            # only known versions get here, so the dict stays small
+            self._protocols[key] = protocol
+        return protocol
+
+    def check_timestamp(self, timestamp):
+        """Raise AuthenticationError unless 'timestamp' is in the window."""
+        try:
+            signed_at = parse_timestamp(timestamp)
+        except ValueError as exc:
+            raise AuthenticationError(str(exc))
+        if abs(self.clock.time() - signed_at) > self.allowed_skew:
+            raise AuthenticationError(
+                'X-Ops-Timestamp %s is outside the allowed clock skew of %d '
+                'seconds.' % (timestamp, self.allowed_skew))
+
+    def verify(self, method, path, headers, body=b''):
+        """Verify a request and return the client's user id.
+
+        :param path: The request path as sent (still percent-encoded),
+                     without the query string.
+        :param headers: Mapping of the request headers; names in any case.
+        :param body: The request body, as bytes.
+        Raises AuthenticationError if the request is not signed correctly.
+        """
+        headers = dict((name.lower(), _text(value))
+                       for name, value in headers.items())
+        user_id = headers.get('x-ops-userid')
+        public_key = self.public_key(user_id) if user_id else None
+        if public_key is None:
+            raise AuthenticationError('Unknown client %r.' % user_id)
+        protocol = self.protocol(headers)
+        timestamp = headers.get('x-ops-timestamp', '')
+        self.check_timestamp(timestamp)
+        content_hash = headers.get('x-ops-content-hash', '')
+        if mixlib_auth.digester(body or b'', algorithm=protocol.algorithm) != (
+                content_hash):
+            raise AuthenticationError('X-Ops-Content-Hash does not match '
+                                      'the body.')
+        signature = join_signature(headers)
+        canonical = protocol.canonical_request(
+            method, protocol.hash_path(path), content_hash, timestamp,
+            protocol.canonical_user_id(user_id)).encode('utf_8')
+        seen_key = hashlib.sha256(canonical + b'\n' + signature).digest()
+        if self.verified.get(seen_key) is not None:
+            if self.reject_replays:
+                raise AuthenticationError('Replayed request for %s.'
+                                          % user_id)
+            return user_id
+        if not self._signature_valid(public_key, signature, canonical,
+                                     protocol):
+            raise AuthenticationError('Invalid signature for %s.' % user_id)
+        self.verified.set(seen_key, user_id)
+        return user_id
+
+    @staticmethod
+    def _signature_valid(public_key, signature, canonical, protocol):
+        """Return True if 'signature' signs 'canonical' for 'protocol'."""
+        try:
+            if protocol.sign_algorithm is None:
+                return public_key.recover_data_from_signature(
+                    signature, padding.PKCS1v15(), None) == canonical
+            public_key.verify(
+                signature, canonical, padding.PKCS1v15(),
+                mixlib_auth.SIGN_ALGORITHMS[protocol.sign_algorithm]())
+        except (crypto_exceptions.InvalidSignature, ValueError):
+            return False
+        return True
+
+
+def error_document(exc):
+    """Return the JSON body of a 401 response, as the Chef server sends."""
+    return json.dumps({'error': [str(exc)]}).encode('utf_8')
+
+
+def _wsgi_body(environ):
+    """Read the whole request body from a WSGI environ."""
+    stream = environ.get('wsgi.input')
+    if stream is None:
+        return b''
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or -1)
+    except ValueError:
+        length = -1
+    if length >= 0:
+        return stream.read(length)
+    if environ.get('wsgi.input_terminated'):
+        return stream.read()
+    return b''
+
+
+def _wsgi_path(environ):
+    """Return the request path as the client sent (and signed) it."""
+    raw = environ.get('REQUEST_URI') or environ.get('RAW_URI')
+    if raw:
+        return urlparse.urlsplit(raw).path
+    path = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+    if six.PY3:
+        # PEP 3333 native strings hold the bytes as latin-1
+        path = path.encode('latin-1')
+    return urlparse.quote(path)
+
+
+class WSGIMiddleware(object):
+
+    """Verify requests before passing them to a WSGI app.
+
+    Unsigned or badly signed requests get a 401 with a Chef-style JSON
+    error; verified ones reach 'app' with the client's user id in
+    environ[environ_key]. The body is read (to check its hash) and
+    handed on in a new wsgi.input.
+    """
+
+    def __init__(self, app, verifier, environ_key='chef.user_id'):
+        """Wrap 'app', verifying with a ChefAuthVerifier."""
+        self.app = app
+        self.verifier = verifier
+        self.environ_key = environ_key
+
+    def __call__(self, environ, start_response):
+        """Verify, then call the app or answer 401."""
+        body = _wsgi_body(environ)
+        environ['wsgi.input'] = io.BytesIO(body)
+        headers = dict((name[5:].replace('_', '-'), value)
+                       for name, value in environ.items()
+                       if name.startswith('HTTP_X_OPS_'))
+        try:
+            user_id = self.verifier.verify(
+                environ['REQUEST_METHOD'], _wsgi_path(environ), headers,
+                body)
+        except AuthenticationError as exc:
+            payload = error_document(exc)
+            start_response('401 Unauthorized', [
+                ('Content-Type', 'application/json'),
+                ('Content-Length', str(len(payload))),
+            ])
+            return [payload]
+        environ[self.environ_key] = user_id
+        return self.app(environ, start_response)
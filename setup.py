@@ -42,17 +42,22 @@ else:
 
 
 INSTALL_REQUIRES = [
-    'cryptography==1.3.1f',
+    'cryptography>=47.0',
     'requests>=2.7.0',
     'six>=1.9.0',
 ]
 
 
-# cryptography==1.3.1f is not on pypi, so provide a link
-DEPENDENCY_LINKS = [
-    ('https://github.com/samstav/cryptography'
-     '/tarball/rsa-bypass-hash-on-signer#egg=cryptography-1.3.1f'),
-]
+EXTRAS_REQUIRE = {
+    'pkcs11': ['python-pkcs11'],
+}
+
+
+ENTRY_POINTS = {
+    'console_scripts': [
+        'requests-chef-bench = requests_chef.bench:main',
+    ],
+}
 
 
 TESTS_REQUIRE = [
@@ -67,13 +72,19 @@ CLASSIFIERS = [
     'Topic :: Software Development',
     'Development Status :: 4 - Beta',
     'Programming Language :: Python',
-    'Programming Language :: Python :: 2',
-    'Programming Language :: Python :: 2.7',
     'Programming Language :: Python :: 3',
-    'Programming Language :: Python :: 3.4',
+    'Programming Language :: Python :: 3 :: Only',
+    'Programming Language :: Python :: 3.9',
+    'Programming Language :: Python :: 3.10',
+    'Programming Language :: Python :: 3.11',
+    'Programming Language :: Python :: 3.12',
 ]
 
 
+# cryptography>=47.0 and the asyncio modules need a recent Python 3.
+PYTHON_REQUIRES = '>=3.9'
+
+
 # Add the commit hash to the keywords for sanity.
 if any(k in ' '.join(sys.argv).lower() for k in ['upload', 'dist']):
     try:
@@ -90,12 +101,14 @@ package_attributes = {
     'name': about['__title__'],
     'description': about['__summary__'],
     'long_description': LONG_DESCRIPTION,
-    'dependency_links': DEPENDENCY_LINKS,
     'keywords': ' '.join(about['__keywords__']),
     'version': about['__version__'],
     'tests_require': TESTS_REQUIRE,
     'test_suite': 'tests',
+    'python_requires': PYTHON_REQUIRES,
     'install_requires': INSTALL_REQUIRES,
+    'extras_require': EXTRAS_REQUIRE,
+    'entry_points': ENTRY_POINTS,
     'packages': setuptools.find_packages(exclude=['tests']),
     'author': about['__author__'],
     'author_email': about['__email__'],
@@ -0,0 +1,43 @@
+"""A FakeChefServer that records requests, shared by the client tests."""
+
+import os
+
+from requests_chef import fake_server
+
+TEST_PEM = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'test.pem')
+
+
+class RecordingChefServer(fake_server.FakeChefServer):
+
+    """A FakeChefServer that records requests and fails on demand.
+
+    Every request is kept in 'requests' as (method, target, headers),
+    headers with lower-case names. Statuses queued in 'statuses' are
+    answered, in turn, to correctly signed requests instead of the
+    usual response.
+    """
+
+    def __init__(self, clients=None, **kwargs):
+        super(RecordingChefServer, self).__init__(
+            clients or {'patsy': TEST_PEM}, **kwargs)
+        self.requests = []
+        self.statuses = []
+
+    def reset(self):
+        """Forget the requests, queued statuses, data and uploads."""
+        del self.requests[:]
+        del self.statuses[:]
+        self.data_bags.clear()
+        self.sandboxes.clear()
+        self.checksums.clear()
+        self.stats.clear()
+
+    def respond(self, method, target, headers, body=b''):
+        self.requests.append((method, target, headers))
+        status, document = super(RecordingChefServer, self).respond(
+            method, target, headers, body)
+        if self.statuses and status != 401:
+            status = self.statuses.pop(0)
+            document = {'error': ['Queued status %d.' % status]}
+        return status, document
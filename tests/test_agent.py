@@ -0,0 +1,164 @@
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+
+import mock
+import six
+
+import requests_chef
+from requests_chef import agent
+from requests_chef import signers
+
+TEST_PEM = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'test.pem')
+
+if not hasattr(socket, 'AF_UNIX'):
+    raise unittest.SkipTest('Unix sockets are not available.')
+
+
+class FailingBackend(signers.SignerBackend):
+
+    def sign(self, data, algorithm=None):
+        raise ValueError('token removed')
+
+
+class TestSigningAgent(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rsakey = requests_chef.RSAKey.load_pem(TEST_PEM)
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'agent.sock')
+        self.agent = agent.SigningAgent(TEST_PEM, self.path)
+        self.agent.start()
+        self.addCleanup(self.agent.shutdown)
+        self.backend = agent.AgentBackend(self.path)
+        self.addCleanup(self.backend.close)
+
+    def test_sign_matches_rsakey(self):
+        rsakey = requests_chef.RSAKey(self.backend)
+        for algorithm in (None, 'sha1', 'sha256'):
+            self.assertEqual(self.rsakey.sign('data', algorithm=algorithm),
+                             rsakey.sign('data', algorithm=algorithm))
+
+    def test_sign_batch(self):
+        payloads = [b'a', b'b', b'a']
+        self.assertEqual(
+            [self.rsakey.sign(data, b64=False) for data in payloads],
+            self.backend.sign_batch(payloads))
+
+    def test_sign_batch_in_chunks(self):
+        payloads = [six.int2byte(i) for i in range(7)]
+        with mock.patch.object(agent, 'MAX_COUNT', 3):
+            self.assertEqual(
+                [self.rsakey.sign(data, b64=False) for data in payloads],
+                self.backend.sign_batch(payloads))
+
+    def test_oversized_request_is_refused(self):
+        with mock.patch.object(agent, 'MAX_COUNT', 3):
+            with self.assertRaises(agent.AgentError) as caught:
+                self.backend._round_trip(agent._pack(0, [b'a'] * 4))
+            self.assertIn('Too many items', str(caught.exception))
+            with self.assertRaises(agent.AgentError) as caught:
+                self.backend._round_trip(agent._pack(
+                    0, [b'x' * (agent.MAX_ITEM_SIZE + 1)]))
+            self.assertIn('Item too large', str(caught.exception))
+        # the connection stays in step
+        self.assertEqual(self.rsakey.sign(b'a', b64=False),
+                         self.backend.sign(b'a'))
+
+    def test_socket_is_private(self):
+        mode = os.stat(self.path).st_mode
+        self.assertTrue(stat.S_ISSOCK(mode))
+        self.assertEqual(0o600, stat.S_IMODE(mode))
+
+    def test_socket_is_private_under_permissive_umask(self):
+        path = self.path + '.2'
+        umask = os.umask(0o002)
+        try:
+            with mock.patch('os.umask', side_effect=AssertionError(
+                    'the process umask was changed')):
+                with agent.SigningAgent(TEST_PEM, path):
+                    self.assertEqual(0o600,
+                                     stat.S_IMODE(os.stat(path).st_mode))
+        finally:
+            os.umask(umask)
+        self.assertEqual(['agent.sock'],
+                         os.listdir(os.path.dirname(self.path)))
+
+    def test_concurrent_clients(self):
+        results = {}
+
+        def sign(index):
+            results[index] = self.backend.sign('payload-%d' % index)
+
+        threads = [threading.Thread(target=sign, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            dict((i, self.rsakey.sign('payload-%d' % i, b64=False))
+                 for i in range(8)),
+            results)
+
+    def test_reconnects_after_restart(self):
+        self.assertEqual(self.rsakey.sign('a', b64=False),
+                         self.backend.sign('a'))
+        self.agent.shutdown()
+        self.agent = agent.SigningAgent(self.rsakey, self.path)
+        self.agent.start()
+        self.assertEqual(self.rsakey.sign('b', b64=False),
+                         self.backend.sign('b'))
+
+    def test_refuses_second_agent(self):
+        other = agent.SigningAgent(self.rsakey, self.path)
+        self.assertRaises(ValueError, other.start)
+
+    def test_chef_auth(self):
+        auth = requests_chef.ChefAuth(
+            'patsy', requests_chef.RSAKey(self.backend))
+        expected = requests_chef.ChefAuth('patsy', self.rsakey)
+        self.assertEqual(
+            expected.sign_request('GET', '/nodes', timestamp='now'),
+            auth.sign_request('GET', '/nodes', timestamp='now'))
+
+
+class TestSigningAgentErrors(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'agent.sock')
+
+    def test_backend_error(self):
+        with agent.SigningAgent(FailingBackend(), self.path):
+            backend = agent.AgentBackend(self.path)
+            self.addCleanup(backend.close)
+            with self.assertRaises(agent.AgentError) as context:
+                backend.sign(b'data')
+        self.assertEqual('token removed', str(context.exception))
+
+    def test_no_agent(self):
+        backend = agent.AgentBackend(self.path)
+        self.assertRaises(socket.error, backend.sign, b'data')
+
+    def test_path_is_not_a_socket(self):
+        with open(self.path, 'w') as fileobj:
+            fileobj.write('keep me')
+        self.assertRaises(ValueError,
+                          agent.SigningAgent(TEST_PEM, self.path).start)
+        self.assertTrue(os.path.isfile(self.path))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
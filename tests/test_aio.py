@@ -0,0 +1,146 @@
+import os
+import unittest
+
+import six
+
+if six.PY2:
+    raise unittest.SkipTest("requests_chef.aio requires Python 3.")
+
+import asyncio  # noqa
+import datetime  # noqa
+from unittest import mock  # noqa
+
+import requests_chef  # noqa
+from requests_chef import aio  # noqa
+from requests_chef import verify  # noqa
+
+TEST_PEM = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'test.pem')
+TIMESTAMP = '2015-06-29T15:30:22Z'
+
+
+class TestAsyncChefAuth(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.auth = requests_chef.ChefAuth(
+            'patsy', TEST_PEM, clock=requests_chef.clock.FixedClock(
+                datetime.datetime(2015, 6, 29, 15, 30, 22)))
+        cls.signer = aio.AsyncChefAuth(cls.auth)
+
+    def expected_headers(self, method, path_url, body=None):
+        headers, _ = self.auth.sign_request(
+            method, path_url, body, timestamp=TIMESTAMP)
+        return headers
+
+    def test_sign_matches_sync_path(self):
+        headers = asyncio.run(self.signer.sign(
+            'PUT', '/nodes/a?b=c', body=b'{}', timestamp=TIMESTAMP))
+        self.assertEqual(
+            self.expected_headers('PUT', '/nodes/a', b'{}'), headers)
+
+    def test_builds_chef_auth(self):
+        signer = aio.AsyncChefAuth('patsy', TEST_PEM)
+        self.assertEqual('AsyncChefAuth(patsy)', repr(signer))
+        self.assertIsInstance(signer.auth, requests_chef.ChefAuth)
+
+    def test_aiohttp_middleware(self):
+        try:
+            import yarl
+        except ImportError:
+            self.skipTest("aiohttp is not installed.")
+        request = mock.Mock(method='POST', body=b'{"a": 1}', headers={},
+                            url=yarl.URL('http://chef/search/node?q=*'))
+        handler = mock.AsyncMock(return_value='response')
+        result = asyncio.run(self.signer.aiohttp_middleware(request, handler))
+        self.assertEqual('response', result)
+        handler.assert_awaited_once_with(request)
+        self.assertEqual(
+            self.expected_headers('POST', '/search/node', b'{"a": 1}'),
+            request.headers)
+
+    def test_httpx_auth(self):
+        if aio.httpx is None:
+            self.skipTest("httpx is not installed.")
+        seen = []
+
+        def handler(request):
+            seen.append(request)
+            return aio.httpx.Response(200)
+
+        transport = aio.httpx.MockTransport(handler)
+        auth = self.signer.httpx_auth()
+
+        async def fetch():
+            async with aio.httpx.AsyncClient(
+                    transport=transport, auth=auth) as client:
+                await client.put('http://chef/nodes/a', content=b'{}')
+
+        asyncio.run(fetch())
+        with aio.httpx.Client(transport=transport, auth=auth) as client:
+            client.put('http://chef/nodes/a', content=b'{}')
+
+        expected = self.expected_headers('PUT', '/nodes/a', b'{}')
+        for request in seen:
+            for name, value in expected.items():
+                self.assertEqual(six.ensure_str(value),
+                                 request.headers[name])
+
+
+class TestASGIMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.auth = requests_chef.ChefAuth(
+            'patsy', TEST_PEM, clock=requests_chef.clock.FixedClock(
+                1435591822))
+        verifier = verify.ChefAuthVerifier(
+            {'patsy': TEST_PEM},
+            clock=requests_chef.clock.FixedClock(1435591822))
+        self.seen = []
+        self.middleware = aio.ASGIMiddleware(self.app, verifier)
+
+    async def app(self, scope, receive, send):
+        message = await receive()
+        self.seen.append((scope['chef.user_id'], message['body']))
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    def call(self, method, raw_path, headers, chunks=(b'',)):
+        scope = {
+            'type': 'http', 'method': method, 'path': raw_path,
+            'raw_path': raw_path.encode('ascii'), 'query_string': b'',
+            'headers': [(name.lower().encode('ascii'), six.ensure_binary(
+                value)) for name, value in headers.items()],
+        }
+        messages = [{'type': 'http.request', 'body': chunk,
+                     'more_body': i < len(chunks) - 1}
+                    for i, chunk in enumerate(chunks)]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.middleware(scope, receive, send))
+        return sent[0]['status'], sent[1]['body']
+
+    def test_verified(self):
+        headers, _ = self.auth.sign_request('POST', '/roles', b'{"a": 1}')
+        self.assertEqual((200, b'ok'), self.call(
+            'POST', '/roles', headers, chunks=(b'{"a"', b': 1}')))
+        self.assertEqual([('patsy', b'{"a": 1}')], self.seen)
+
+    def test_unauthorized(self):
+        headers, _ = self.auth.sign_request('GET', '/roles')
+        status, body = self.call('GET', '/nodes', headers)
+        self.assertEqual(401, status)
+        self.assertIn('Invalid signature', body.decode('utf-8'))
+        self.assertEqual([], self.seen)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,115 @@
+import io
+import json
+import os
+import unittest
+
+import mock
+
+from requests_chef import bench
+from requests_chef import fake_server
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+TEST_PEM = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'test.pem')
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_parse_mix(self):
+        self.assertEqual([('get', 8.0), ('search', 1.0)],
+                         bench.parse_mix('get=8, search,put=0'))
+        for text in ('post=1', 'get=-1', 'put=0'):
+            self.assertRaises(ValueError, bench.parse_mix, text)
+
+    def test_parse_size(self):
+        self.assertEqual([512, 65536, 1572864],
+                         [bench.parse_size(text)
+                          for text in ('512', '64k', '1.5MB')])
+
+    def test_schedule(self):
+        mix = bench.parse_mix('get=3,put=1')
+        kinds = bench.schedule(mix, 4000)
+        self.assertEqual(kinds, bench.schedule(mix, 4000))
+        self.assertAlmostEqual(0.25, kinds.count('put') / 4000.0, places=1)
+
+    def test_percentile(self):
+        ordered = list(range(1, 101))
+        self.assertEqual([50, 99, 100, 1],
+                         [bench.percentile(ordered, percent)
+                          for percent in (50, 99, 99.9, 0)])
+        self.assertEqual(0.0, bench.percentile([], 50))
+
+
+class TestSummarize(unittest.TestCase):
+
+    def test_summarize(self):
+        records = [bench.Record('get', 200, 0.010),
+                   bench.Record('get', 200, 0.030),
+                   bench.Record('put', 500, 0.060)]
+        report = bench.summarize(records, [0.001, 0.001, 0.008], 0.5)
+        self.assertEqual(6.0, report['throughput'])
+        self.assertEqual(1, report['errors'])
+        self.assertEqual({'200': 2, '500': 1}, report['statuses'])
+        self.assertAlmostEqual(0.1, report['signing_share'])
+        self.assertAlmostEqual(60.0, report['latency_ms']['max'])
+        self.assertEqual(2, report['kinds']['get']['count'])
+        self.assertNotIn('search', report['kinds'])
+        self.assertIn('put', bench.format_report(report))
+
+
+class TestWorkload(unittest.TestCase):
+
+    def test_requests(self):
+        workload = bench.Workload(['a', 'b'], put_size=100, items=2)
+        self.assertEqual(('GET', 'nodes/b', None),
+                         workload.request('get', 3))
+        self.assertEqual('GET', workload.request('search', 0)[0])
+        method, path, body = workload.request('put', 1)
+        self.assertEqual(('PUT', 'data/requests-chef-bench/item-1'),
+                         (method, path))
+        self.assertEqual(100, len(body))
+        self.assertEqual(3, len(workload.get_paths()))
+
+
+class TestMain(unittest.TestCase):
+
+    def main(self, *argv):
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as out:
+            status = bench.main(['--key', TEST_PEM, '--json',
+                                 '--requests', '40', '--put-size', '4k',
+                                 '--concurrency', '4'] + list(argv))
+        report = json.loads(out.getvalue())
+        self.assertEqual(0, status, report)
+        self.assertEqual(['200'], list(report['statuses']))
+        return report
+
+    def test_threads(self):
+        report = self.main('--signing', 'presign', '--mix', 'get')
+        self.assertEqual(40, report['requests'])
+        self.assertLess(report['signed'], 40)
+
+    def test_processes(self):
+        report = self.main('--mode', 'process', '--processes', '2',
+                           '--protocol', '1.3')
+        self.assertEqual(40, report['signed'])
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_asyncio(self):
+        report = self.main('--mode', 'asyncio', '--signing', 'cache')
+        self.assertEqual(40, report['requests'])
+
+    def test_url(self):
+        with fake_server.FakeChefServer({'patsy': TEST_PEM}) as server:
+            report = self.main('--url', server.url, '--user', 'patsy',
+                               '--duration', '0.5')
+            self.assertGreater(report['requests'], 0)
+        self.assertIn('requests-chef-bench', server.data_bags)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,221 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import stat
+import tempfile
+import unittest
+
+import mock
+
+import requests_chef
+from requests_chef import cache
+from requests_chef import mixlib_auth
+
+TEST_PEM = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'test.pem')
+
+
+def _fill(path, worker):
+    shared = cache.SharedLRUCache(path, maxsize=50)
+    for i in range(100):
+        shared.set((worker, i), b'x' * i)
+        shared.get((worker, i // 2))
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_counts_hits_and_misses(self):
+        lru = cache.LRUCache(maxsize=2)
+        self.assertIsNone(lru.get('a'))
+        lru.set('a', 1)
+        self.assertEqual(1, lru.get('a'))
+        self.assertEqual((1, 1), (lru.hits, lru.misses))
+
+    def test_evicts_least_recently_used(self):
+        lru = cache.LRUCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(2, len(lru))
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(1, lru.get('a'))
+        self.assertEqual(3, lru.get('c'))
+
+    def test_entries_expire(self):
+        lru = cache.LRUCache(ttl=1)
+        with mock.patch.object(cache, '_clock', return_value=100.0):
+            lru.set('a', 1)
+        with mock.patch.object(cache, '_clock', return_value=100.5):
+            self.assertEqual(1, lru.get('a'))
+        with mock.patch.object(cache, '_clock', return_value=101.5):
+            self.assertIsNone(lru.get('a'))
+        self.assertEqual(0, len(lru))
+
+    def test_entries_without_ttl_never_expire(self):
+        lru = cache.LRUCache(ttl=None)
+        with mock.patch.object(cache, '_clock', return_value=100.0):
+            lru.set('a', 1)
+        with mock.patch.object(cache, '_clock', return_value=1e9):
+            self.assertEqual(1, lru.get('a'))
+
+    def test_clear(self):
+        lru = cache.LRUCache()
+        lru.set('a', 1)
+        lru.get('a')
+        lru.clear()
+        self.assertEqual((0, 0, 0), (len(lru), lru.hits, lru.misses))
+
+    def test_maxsize_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            cache.LRUCache(maxsize=0)
+
+
+class TestSharedLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.now = [100.0]
+        self.clock_patch = mock.patch.object(
+            cache, '_wall_clock', side_effect=lambda: self.now[0])
+        self.clock_patch.start()
+        self.addCleanup(self.clock_patch.stop)
+
+    def shared(self, name='cache.db', **kwargs):
+        return cache.SharedLRUCache(os.path.join(self.tmpdir, name),
+                                    **kwargs)
+
+    def tick(self):
+        self.now[0] += 1.0
+
+    def test_get_counts_hits_and_misses(self):
+        shared = self.shared()
+        self.assertIsNone(shared.get(b'a'))
+        shared.set(b'a', {'X-Ops-Sign': 'version=1.0'})
+        self.assertEqual({'X-Ops-Sign': 'version=1.0'}, shared.get(b'a'))
+        self.assertEqual((1, 1), (shared.hits, shared.misses))
+
+    def test_shared_between_instances(self):
+        self.shared().set((1, 2, 'sha1'), ('hash', 3))
+        self.assertEqual(('hash', 3), self.shared().get((1, 2, 'sha1')))
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(
+            os.path.join(self.tmpdir, 'cache.db')).st_mode))
+
+    def test_evicts_least_recently_used(self):
+        shared = self.shared(maxsize=2)
+        for key in ('a', 'b'):
+            shared.set(key, key)
+            self.tick()
+        shared.get('a')
+        self.tick()
+        shared.set('c', 'c')
+        self.assertEqual(2, len(shared))
+        self.assertIsNone(shared.get('b'))
+        self.assertEqual(['a', 'c'], [shared.get('a'), shared.get('c')])
+
+    def used(self, shared):
+        return shared._connection().execute(
+            'SELECT used FROM entries').fetchone()[0]
+
+    def test_hits_touch_entries_occasionally(self):
+        shared = self.shared(touch_interval=1.0)
+        shared.set('a', 1)
+        self.now[0] += 0.5
+        self.assertEqual(1, shared.get('a'))
+        self.assertEqual(100.0, self.used(shared))
+        self.now[0] += 0.5
+        self.assertEqual(1, shared.get('a'))
+        self.assertEqual(101.0, self.used(shared))
+
+    def test_database_errors_are_misses(self):
+        shared = self.shared()
+        shared.set('a', 1)
+        locked = sqlite3.OperationalError('database is locked')
+        with mock.patch.object(shared, '_connection', side_effect=locked):
+            self.assertIsNone(shared.get('a'))
+            shared.set('b', 2)
+            auth = requests_chef.ChefAuth('patsy', TEST_PEM,
+                                          signature_cache=shared)
+            headers, _ = auth.sign_request('GET', '/nodes')
+        self.assertIn('X-Ops-Authorization-1', headers)
+        self.assertEqual((0, 2), (shared.hits, shared.misses))
+        self.assertEqual(1, shared.get('a'))
+
+    def test_unreadable_entries_are_misses(self):
+        shared = self.shared()
+        for key, payload in (('a', b'\x80\x05\x95'), ('b', b'junk')):
+            shared.set(key, 1)
+            shared._connection().execute(
+                'UPDATE entries SET value = ? WHERE key = ?',
+                (sqlite3.Binary(payload), shared._key(key)))
+            self.assertEqual('miss', shared.get(key, 'miss'))
+        self.assertEqual((0, 2), (shared.hits, shared.misses))
+        self.assertEqual(0, len(shared))
+
+    def test_entries_expire(self):
+        shared = self.shared(ttl=1)
+        shared.set('a', 1)
+        self.now[0] += 0.5
+        self.assertEqual(1, shared.get('a'))
+        self.now[0] += 1
+        self.assertIsNone(shared.get('a'))
+        never = self.shared(ttl=None)
+        never.set('b', 2)
+        self.now[0] += 1e9
+        self.assertEqual(2, never.get('b'))
+
+    def test_clear(self):
+        shared = self.shared()
+        shared.set('a', 1)
+        shared.get('a')
+        shared.clear()
+        self.assertEqual((0, 0, 0),
+                         (len(shared), shared.hits, shared.misses))
+
+    def test_signed_headers(self):
+        signed = mixlib_auth.SignedHeaders(b'A' * 100)
+        shared = self.shared()
+        shared.set(b'canonical', signed)
+        self.assertEqual(dict(signed), dict(shared.get(b'canonical')))
+
+    def auth(self):
+        return requests_chef.ChefAuth(
+            'patsy', TEST_PEM, signature_cache=self.shared('signatures.db'),
+            content_hash_cache=self.shared('hashes.db', ttl=None),
+            clock=requests_chef.FixedClock(1435591822))
+
+    def test_chef_auth_caches(self):
+        body_path = os.path.join(self.tmpdir, 'body')
+        with open(body_path, 'wb') as body:
+            body.write(b'{"name": "web"}')
+        signed = []
+        for other in (self.auth(), self.auth()):
+            with open(body_path, 'rb') as body:
+                signed.append(other.sign_request('PUT', '/roles/web', body))
+        self.assertEqual(signed[0][0], signed[1][0])
+        self.assertEqual(1, other.signature_cache.hits)
+        self.assertEqual(1, other.content_hash_cache.hits)
+
+    def test_processes(self):
+        self.clock_patch.stop()
+        path = os.path.join(self.tmpdir, 'cache.db')
+        workers = [multiprocessing.Process(target=_fill,
+                                           args=(path, worker))
+                   for worker in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(60)
+        self.assertEqual([0] * 4, [worker.exitcode for worker in workers])
+        self.assertEqual(50, len(self.shared()))
+
+    def test_maxsize_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            self.shared(maxsize=0)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
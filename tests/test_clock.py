@@ -0,0 +1,63 @@
+import datetime
+import threading
+import unittest
+
+import mock
+
+from requests_chef import clock
+
+
+class TestClock(unittest.TestCase):
+
+    def test_timestamp_format(self):
+        fixed = clock.FixedClock(datetime.datetime(2015, 6, 29, 15, 30, 22))
+        self.assertEqual('2015-06-29T15:30:22Z', fixed.timestamp())
+
+    def test_formats_each_second_once(self):
+        now = [1435591822.25]
+        ticking = clock.Clock(time_func=lambda: now[0])
+        with mock.patch.object(clock.time, 'strftime',
+                               wraps=clock.time.strftime) as strftime:
+            first = ticking.timestamp()
+            now[0] += 0.5
+            self.assertIs(first, ticking.timestamp())
+            now[0] += 0.5
+            self.assertEqual('2015-06-29T15:30:23Z', ticking.timestamp())
+        self.assertEqual(2, strftime.call_count)
+
+    def test_offset(self):
+        skewed = clock.FixedClock(1435591822, offset=-62)
+        self.assertEqual('2015-06-29T15:29:20Z', skewed.timestamp())
+        skewed.offset = 0
+        self.assertEqual('2015-06-29T15:30:22Z', skewed.timestamp())
+
+    def test_correct(self):
+        skewed = clock.FixedClock(1435591822, offset=-3600)
+        skewed.correct(1435591900)
+        self.assertEqual(78, skewed.offset)
+        self.assertEqual('2015-06-29T15:31:40Z', skewed.timestamp())
+
+    def test_parse_timestamp(self):
+        self.assertEqual(1435591822,
+                         clock.parse_timestamp('2015-06-29T15:30:22Z'))
+        self.assertRaises(ValueError, clock.parse_timestamp, 'yesterday')
+
+    def test_threads(self):
+        results = set()
+        shared = clock.Clock()
+
+        def stamp():
+            for _ in range(1000):
+                results.add(len(shared.timestamp()))
+
+        threads = [threading.Thread(target=stamp) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({20}, results)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,206 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+import requests
+import six
+
+if six.PY2:
+    raise unittest.SkipTest("requests_chef.fake_server requires Python 3.")
+
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa
+
+import requests_chef  # noqa
+from requests_chef import clock  # noqa
+from requests_chef import mixlib_auth  # noqa
+from requests_chef import fake_server  # noqa
+from requests_chef import upload  # noqa
+from requests_chef import verify  # noqa
+
+TEST_PEM = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'test.pem')
+
+
+class TestFakeChefServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = fake_server.FakeChefServer({'patsy': TEST_PEM})
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def session(self, **kwargs):
+        session = requests_chef.ChefSession(
+            self.server.url, 'patsy', TEST_PEM, max_retries=0, **kwargs)
+        self.addCleanup(session.close)
+        return session
+
+    def test_protocols(self):
+        for protocol in ('1.0', '1.1', '1.3'):
+            response = self.session(protocol=protocol).get('/nodes/node-1')
+            self.assertEqual(200, response.status_code, response.text)
+            self.assertEqual('node-1', response.json()['name'])
+
+    def test_collections(self):
+        session = self.session()
+        self.assertEqual(100, len(session.get('nodes').json()))
+        self.assertEqual({'web', 'db'}, set(session.get('roles').json()))
+        self.assertEqual(404, session.get('nodes/missing').status_code)
+        self.assertEqual(404, session.get('clients').status_code)
+
+    def test_unsigned(self):
+        response = requests.get(self.server.url + '/nodes')
+        self.assertEqual(401, response.status_code)
+        self.assertIn('Unknown client', response.json()['error'][0])
+
+    def test_wrong_key(self):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        session = requests_chef.ChefSession(self.server.url, 'patsy', key)
+        self.addCleanup(session.close)
+        response = session.get('/nodes')
+        self.assertEqual(401, response.status_code)
+        self.assertIn('Invalid signature', response.json()['error'][0])
+
+    def test_tampered_body(self):
+        session = self.session()
+        request = session.prepare_request(requests.Request(
+            'POST', session.url('search/node'), json={'ip': ['ipaddress']}))
+        # same length, so Content-Length still holds
+        request.body = request.body.replace(b'ipaddress', b'ipaddrexx')
+        response = session.send(request)
+        self.assertEqual(401, response.status_code)
+        self.assertIn('Content-Hash', response.json()['error'][0])
+
+    def test_skew(self):
+        skewed = clock.Clock(offset=-verify.ALLOWED_SKEW - 60)
+        response = self.session(clock=skewed).get('/nodes')
+        self.assertEqual(401, response.status_code)
+        self.assertIn('clock skew', response.json()['error'][0])
+        self.assertIn('Date', response.headers)
+
+    def test_correct_skew(self):
+        skewed = clock.Clock(offset=-verify.ALLOWED_SKEW - 60)
+        session = self.session(clock=skewed, correct_skew=True)
+        with mock.patch.object(mixlib_auth, '_content_digest',
+                               wraps=mixlib_auth._content_digest) as digest:
+            response = session.post('search/node', params={'q': 'name:x'},
+                                    json={'ip': ['ipaddress']})
+        self.assertEqual(200, response.status_code, response.text)
+        self.assertEqual([401], [r.status_code for r in response.history])
+        self.assertEqual(1, digest.call_count)
+        self.assertLess(abs(skewed.offset), 5)
+        self.assertEqual(200, session.get('/nodes/node-1').status_code)
+
+    def test_correct_skew_rewinds_file_body(self):
+        skewed = clock.Clock(offset=verify.ALLOWED_SKEW + 60)
+        body = tempfile.TemporaryFile()
+        self.addCleanup(body.close)
+        body.write(b'{"ip": ["ipaddress"]}')
+        body.seek(0)
+        response = self.session(clock=skewed, correct_skew=True).post(
+            'search/node', params={'q': 'name:node-2'}, data=body)
+        self.assertEqual(200, response.status_code, response.text)
+        self.assertEqual(1, len(response.history))
+        self.assertEqual({'ip': '10.0.0.2'},
+                         response.json()['rows'][0]['data'])
+
+    def test_correct_skew_generator_body(self):
+        skewed = clock.Clock(offset=-verify.ALLOWED_SKEW - 60)
+        response = self.session(clock=skewed, correct_skew=True).post(
+            'search/node', data=(chunk for chunk in (b'{}',)))
+        self.assertEqual(401, response.status_code)
+        self.assertLess(abs(skewed.offset), 5)
+
+    def test_search(self):
+        search = requests_chef.ChefSearch(self.session(), rows=7, workers=3)
+        names = [node['name'] for node in search('node', 'role:web')]
+        self.assertEqual(['node-%d' % i for i in range(0, 100, 2)], names)
+        rows = list(search('node', 'name:node-1*',
+                           filter_result={'ip': ['ipaddress']}))
+        self.assertEqual(11, len(rows))
+        self.assertEqual({'ip': '10.0.0.1'}, rows[0]['data'])
+
+    def test_chunked_body(self):
+        response = self.session().post(
+            'search/node', params={'q': 'name:node-2'},
+            data=(chunk for chunk in (b'{"ip": ', b'["ipaddress"]}')))
+        self.assertEqual(200, response.status_code, response.text)
+        self.assertEqual({'ip': '10.0.0.2'},
+                         response.json()['rows'][0]['data'])
+
+    def test_sandbox_upload(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        paths = []
+        for name in ('metadata.rb', 'default.rb'):
+            paths.append(os.path.join(tmpdir, name))
+            with open(paths[-1], 'w') as fileobj:
+                fileobj.write('# %s\n' % name)
+        uploader = upload.SandboxUploader(self.session(), hash_workers=1)
+        result = uploader.upload(paths)
+        self.assertEqual(sorted(paths), sorted(result.uploaded))
+        self.assertTrue(
+            self.server.sandboxes[result.sandbox_id]['is_completed'])
+        self.assertEqual(sorted(paths),
+                         sorted(uploader.upload(paths).skipped))
+
+    def test_data_bags(self):
+        session = self.session()
+        self.assertEqual(201, session.post(
+            'data', json={'name': 'apps'}).status_code)
+        self.assertEqual(409, session.post(
+            'data', json={'name': 'apps'}).status_code)
+        self.assertEqual(201, session.post(
+            'data/apps', json={'id': 'web'}).status_code)
+        response = session.put('data/apps/web',
+                               json={'id': 'web', 'port': 80})
+        self.assertEqual(200, response.status_code, response.text)
+        self.assertEqual(80, session.get('data/apps/web').json()['port'])
+        self.assertEqual(['web'], list(session.get('data/apps').json()))
+        self.assertEqual(404, session.put('data/apps/db', json={
+            'id': 'db'}).status_code)
+        self.assertEqual(404, session.get('data/missing').status_code)
+
+    def test_bad_requests_get_a_status(self):
+        session = self.session()
+        self.assertEqual(405, session.put('data', json={}).status_code)
+        for document in ([1], {'name': ['apps']}, {}):
+            self.assertEqual(400, session.post(
+                'data', json=document).status_code, document)
+        sandbox = session.post('sandboxes', json={'checksums': {}}).json()
+        for body in (b'[]', b'"x"', b'\xff'):
+            self.assertEqual(400, session.put(
+                'sandboxes/%s' % sandbox['sandbox_id'],
+                data=body).status_code, body)
+        with mock.patch.object(self.server, '_nodes',
+                               side_effect=RuntimeError('boom')):
+            response = session.get('nodes')
+        self.assertEqual(500, response.status_code)
+        self.assertIn('boom', response.json()['error'][0])
+
+    def test_concurrent_connections(self):
+        sessions = [self.session() for _ in range(32)]
+        statuses = []
+
+        def fetch(session):
+            for _ in range(5):
+                statuses.append(session.get('/nodes/node-3').status_code)
+
+        threads = [threading.Thread(target=fetch, args=(session,))
+                   for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([200] * 160, statuses)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
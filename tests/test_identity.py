@@ -0,0 +1,156 @@
+import threading
+import unittest
+
+import mock
+from cryptography.hazmat.primitives.asymmetric import rsa
+import requests
+
+import requests_chef
+from requests_chef import clock
+from requests_chef import identity
+from requests_chef import mixlib_auth
+from requests_chef import verify
+
+from chef_server import RecordingChefServer
+from chef_server import TEST_PEM
+
+ORGS = ('acme', 'initech', 'hooli')
+
+
+class TestMultiChefAuth(unittest.TestCase):
+
+    def setUp(self):
+        self.auth = identity.MultiChefAuth(default=('default', TEST_PEM))
+        self.acme = self.auth.add_org('acme', 'acme-client', TEST_PEM)
+        self.legacy = self.auth.add('https://old.example.com/chef',
+                                    'legacy', TEST_PEM)
+        self.special = self.auth.add('/organizations/acme/data/secrets',
+                                     'secrets', TEST_PEM)
+
+    def test_route(self):
+        routes = {
+            'https://chef.example.com/organizations/acme/nodes': self.acme,
+            '/organizations/acme?x=1': self.acme,
+            '/organizations/acme/data/secrets/db': self.special,
+            'https://old.example.com/chef/nodes': self.legacy,
+            'https://old.example.com/chefs/nodes': self.auth.default,
+            '/organizations/acme2/nodes': self.auth.default,
+            '/users/patsy': self.auth.default,
+        }
+        for url, expected in routes.items():
+            self.assertIs(expected, self.auth.route(url), url)
+
+    def test_no_default(self):
+        auth = identity.MultiChefAuth()
+        self.assertRaises(ValueError, auth.route, '/organizations/acme')
+
+    def test_pool_prefix(self):
+        self.assertEqual(
+            'https://chef/organizations/acme/',
+            self.auth.pool_prefix('https://chef/organizations/acme/nodes'))
+        self.assertEqual(
+            'https://old.example.com/chef/',
+            self.auth.pool_prefix('https://old.example.com/chef/x'))
+        self.assertIsNone(self.auth.pool_prefix('https://chef/users/a'))
+
+    def test_keys_load_lazily(self):
+        with mock.patch.object(mixlib_auth.RSAKey, 'load_pem',
+                               wraps=mixlib_auth.RSAKey.load_pem) as load:
+            auth = identity.MultiChefAuth(protocol='1.3')
+            acme = auth.add_org('acme', 'acme-client', TEST_PEM)
+            auth.add_org('initech', 'initech-client', TEST_PEM)
+            self.assertFalse(load.called)
+            headers, _ = auth.sign_request(
+                'GET', 'https://chef/organizations/acme/nodes')
+            self.assertEqual(1, load.call_count)
+        self.assertEqual('acme-client', headers['X-Ops-UserId'])
+        self.assertEqual('algorithm=sha256;version=1.3',
+                         headers['X-Ops-Sign'])
+        self.assertIs(acme.auth, acme.auth)
+
+    def test_call_signs_prepared_request(self):
+        request = requests.Request(
+            'GET', 'http://chef/organizations/acme/nodes').prepare()
+        self.auth(request)
+        self.assertEqual('acme-client', request.headers['X-Ops-UserId'])
+
+    def test_shared_signature_cache_keeps_keys_apart(self):
+        other_key = rsa.generate_private_key(public_exponent=65537,
+                                             key_size=2048)
+        auth = identity.MultiChefAuth(
+            signature_cache=requests_chef.LRUCache(),
+            clock=clock.FixedClock(1435591822))
+        keys = {'https://chef-a.example.com': TEST_PEM,
+                'https://chef-b.example.com': other_key}
+        for server, key in keys.items():
+            auth.add(server, 'admin', key)
+        for server, key in keys.items():
+            headers, _ = auth.sign_request('GET', server + '/nodes')
+            verifier = verify.ChefAuthVerifier(
+                {'admin': key}, clock=clock.FixedClock(1435591822))
+            self.assertEqual('admin', verifier.verify('GET', '/nodes',
+                                                      headers))
+        self.assertEqual(0, auth.auth_kwargs['signature_cache'].hits)
+
+
+class TestMultiChefAuthSession(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RecordingChefServer(dict(
+            ('%s-client' % org, TEST_PEM) for org in ORGS))
+        cls.server.start()
+        cls.url = 'http://%s:%d' % (cls.server.host, cls.server.port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.reset()
+        auth = requests_chef.MultiChefAuth()
+        for org in ORGS:
+            auth.add_org(org, '%s-client' % org, TEST_PEM)
+        self.session = requests_chef.ChefSession(self.url, auth=auth)
+        self.addCleanup(self.session.close)
+
+    def test_fan_out(self):
+        statuses = []
+
+        def fetch(org):
+            statuses.append(self.session.get(
+                '/organizations/%s/nodes' % org).status_code)
+
+        threads = [threading.Thread(target=fetch, args=(org,))
+                   for org in ORGS * 3]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # the fake server only serves acme, but checks every signature
+        self.assertEqual([200] * 3 + [404] * 6, sorted(statuses))
+        users = set((target.split('/')[2], headers['x-ops-userid'])
+                    for _, target, headers in self.server.requests)
+        self.assertEqual(set((org, '%s-client' % org) for org in ORGS),
+                         users)
+
+    def test_pool_per_identity(self):
+        self.session.get('/organizations/acme/nodes')
+        self.session.get('/organizations/initech/nodes')
+        acme = self.session.get_adapter(
+            self.url + '/organizations/acme/roles')
+        initech = self.session.get_adapter(
+            self.url + '/organizations/initech/roles')
+        self.assertIsNot(acme, initech)
+        self.assertIs(acme, self.session.adapters[
+            self.url + '/organizations/acme/'])
+        self.assertIs(self.session.adapters['http://'],
+                      self.session.get_adapter(self.url + '/users/patsy'))
+        # longest prefixes first, as Session.mount keeps them
+        self.assertEqual({'http://', 'https://'},
+                         set(list(self.session.adapters)[-2:]))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
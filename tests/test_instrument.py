@@ -0,0 +1,77 @@
+import io
+import os
+import unittest
+
+import mock
+
+import requests_chef
+from requests_chef import instrument
+
+TEST_PEM = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'test.pem')
+TIMESTAMP = '2015-06-29T15:30:22Z'
+
+
+class TestInstrumentedChefAuth(unittest.TestCase):
+
+    def setUp(self):
+        self.records = []
+        self.auth = requests_chef.ChefAuth(
+            'patsy', TEST_PEM,
+            instrument=lambda *record: self.records.append(record))
+
+    def test_records_each_phase(self):
+        self.auth.sign_request('PUT', '/nodes/a', b'x' * 100)
+        self.assertEqual(1, len(self.records))
+        timings, body_bytes = self.records[0]
+        self.assertEqual(set(instrument.PHASES), set(timings))
+        self.assertTrue(all(seconds >= 0 for seconds in timings.values()))
+        self.assertEqual(100, body_bytes)
+
+    def test_counts_streamed_bytes(self):
+        self.auth.sign_request('PUT', '/nodes/a', io.BytesIO(b'x' * 10))
+        self.auth.sign_request('PUT', '/nodes/a', iter([b'x', b'yz']))
+        self.assertEqual([10, 3], [record[1] for record in self.records])
+
+    def test_same_headers_as_uninstrumented(self):
+        plain = requests_chef.ChefAuth('patsy', TEST_PEM)
+        self.assertEqual(
+            plain.sign_request('GET', '/nodes', timestamp=TIMESTAMP),
+            self.auth.sign_request('GET', '/nodes', timestamp=TIMESTAMP))
+
+
+class TestAdapters(unittest.TestCase):
+
+    timings = {'sign': 0.002, 'total': 0.003}
+
+    def test_statsd(self):
+        client = mock.Mock()
+        instrument.StatsdInstrument(client, prefix='chef').record(
+            self.timings, 42)
+        client.timing.assert_has_calls([
+            mock.call('chef.sign', 2.0),
+            mock.call('chef.total', 3.0),
+        ], any_order=True)
+        client.incr.assert_called_once_with('chef.body_bytes', 42)
+
+    def test_prometheus(self):
+        histogram, counter = mock.Mock(), mock.Mock()
+        instrument.PrometheusInstrument(histogram, counter).record(
+            self.timings, 42)
+        histogram.labels.assert_any_call(phase='sign')
+        histogram.labels.return_value.observe.assert_any_call(0.002)
+        counter.inc.assert_called_once_with(42)
+
+    def test_get_instrument(self):
+        adapter = instrument.StatsdInstrument(mock.Mock())
+        self.assertIs(adapter, instrument.get_instrument(adapter))
+        self.assertIsNone(instrument.get_instrument(None))
+        self.assertIsInstance(instrument.get_instrument(lambda *_: None),
+                              instrument.CallbackInstrument)
+        with self.assertRaises(TypeError):
+            instrument.get_instrument(object())
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import unittest
+
+import requests
+
+import requests_chef
+
+TEST_PEM = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'test.pem')
+
+
+class TestSigningPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rsakey = requests_chef.RSAKey.load_pem(TEST_PEM)
+        cls.pool = requests_chef.SigningPool(cls.rsakey, max_workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def test_sign_matches_rsakey(self):
+        data = 'e394cd9ef34341ca9d592a8fb515a8d4f03c1219'
+        self.assertEqual(self.rsakey.sign(data), self.pool.sign(data))
+        self.assertEqual(self.rsakey.sign(data, b64=False),
+                         self.pool.sign(data, b64=False))
+
+    def test_sign_many_keeps_order(self):
+        payloads = ['payload-%d' % i for i in range(8)]
+        expected = [self.rsakey.sign(data) for data in payloads]
+        self.assertEqual(expected, self.pool.sign_many(payloads))
+
+    def test_from_path(self):
+        with requests_chef.SigningPool(TEST_PEM, max_workers=1) as pool:
+            self.assertEqual(self.rsakey.sign('data'), pool.sign('data'))
+
+    def test_chef_auth_signs_through_pool(self):
+        handler = requests_chef.ChefAuth('patsy', self.pool)
+        canonical = handler.canonical_request(
+            'GET', 'path', 'content', '2015-06-29T15:30:22Z')
+        expected = requests_chef.ChefAuth(
+            'patsy', self.rsakey).signed_headers(canonical)
+        self.assertEqual(expected, handler.signed_headers(canonical))
+        request = requests.Request(
+            method='GET', url='http://chef-server.com/nodes/a').prepare()
+        self.assertIn('X-Ops-Authorization-1', handler(request).headers)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
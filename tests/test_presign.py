@@ -0,0 +1,116 @@
+import threading
+import unittest
+
+import mock
+from cryptography.hazmat import backends as crypto_backends
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from requests_chef import clock
+from requests_chef import mixlib_auth
+from requests_chef import presign
+
+
+class TestPresign(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.private_key = mixlib_auth.RSAKey(rsa.generate_private_key(
+            public_exponent=65537, key_size=2048,
+            backend=crypto_backends.default_backend()))
+
+    def setUp(self):
+        self.now = [1435591822.0]
+        self.clock = clock.Clock(time_func=lambda: self.now[0])
+        self.auth = mixlib_auth.ChefAuth(
+            'patsy', self.private_key, clock=self.clock)
+        self.timer = mock.patch.object(presign.threading, 'Timer').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_reuses_headers(self):
+        bundle = self.auth.presign('get', '/nodes/web-1', expires_in=60)
+        with mock.patch.object(self.private_key, 'sign') as sign:
+            self.now[0] += 30
+            headers, body = self.auth.sign_request(
+                'GET', '/nodes/web-1?x=1')
+        self.assertFalse(sign.called)
+        self.assertIsNone(body)
+        self.assertEqual(bundle.headers(), headers)
+        self.assertEqual('2015-06-29T15:30:22Z', headers['X-Ops-Timestamp'])
+
+    def test_signs_other_requests(self):
+        self.auth.presign('GET', '/nodes/web-1')
+        self.now[0] += 1
+        for method, path, body in (('GET', '/nodes/web-2', None),
+                                   ('DELETE', '/nodes/web-1', None),
+                                   ('GET', '/nodes/web-1', b'{}')):
+            headers, _ = self.auth.sign_request(method, path, body)
+            self.assertEqual('2015-06-29T15:30:23Z',
+                             headers['X-Ops-Timestamp'])
+
+    def test_expired_headers_are_not_used(self):
+        bundle = self.auth.presign('GET', '/nodes/web-1', expires_in=60)
+        self.now[0] += 60
+        self.assertIsNone(bundle.headers())
+        headers, _ = self.auth.sign_request('GET', '/nodes/web-1')
+        self.assertEqual('2015-06-29T15:31:22Z', headers['X-Ops-Timestamp'])
+
+    def test_refresh_schedules_next(self):
+        bundle = self.auth.presign('GET', '/nodes/web-1', expires_in=60,
+                                   refresh_margin=5)
+        self.timer.assert_called_once_with(55, bundle._refresh)
+        self.now[0] += 55
+        bundle._refresh()
+        self.assertEqual(2, self.timer.call_count)
+        self.assertEqual(1435591822.0 + 115, bundle.expires_at)
+        headers, _ = self.auth.sign_request('GET', '/nodes/web-1')
+        self.assertEqual('2015-06-29T15:31:17Z', headers['X-Ops-Timestamp'])
+
+    def test_refresh_replaces_timer(self):
+        timers = [mock.Mock(), mock.Mock()]
+        self.timer.side_effect = timers
+        bundle = self.auth.presign('GET', '/nodes/web-1')
+        bundle.refresh()
+        timers[0].cancel.assert_called_once_with()
+        self.assertFalse(timers[1].cancel.called)
+        self.assertIs(timers[1], bundle._timer)
+
+    def test_unpresign(self):
+        bundle = self.auth.presign('GET', '/nodes/web-1')
+        self.auth.unpresign('GET', '/nodes/web-1')
+        self.timer.return_value.cancel.assert_called_once_with()
+        bundle._refresh()
+        self.assertEqual(1, self.timer.call_count)
+        self.now[0] += 1
+        headers, _ = self.auth.sign_request('GET', '/nodes/web-1')
+        self.assertEqual('2015-06-29T15:30:23Z', headers['X-Ops-Timestamp'])
+
+    def test_presign_replaces_bundle(self):
+        first = self.auth.presign('GET', '/nodes/web-1')
+        second = self.auth.presign('GET', '/nodes/web-1')
+        self.assertTrue(first._cancelled)
+        self.assertFalse(second._cancelled)
+
+    def test_bad_margin(self):
+        self.assertRaises(ValueError, self.auth.presign, 'GET', '/nodes',
+                          expires_in=5, refresh_margin=5)
+
+
+class TestPresignTimer(unittest.TestCase):
+
+    def test_background_refresh(self):
+        key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048,
+            backend=crypto_backends.default_backend())
+        auth = mixlib_auth.ChefAuth('patsy', key)
+        refreshed = threading.Event()
+        bundle = auth.presign('GET', '/nodes', expires_in=0.2,
+                              refresh_margin=0.15)
+        self.addCleanup(auth.unpresign)
+        with mock.patch.object(bundle, 'refresh',
+                               side_effect=refreshed.set):
+            self.assertTrue(refreshed.wait(5))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -1,9 +1,13 @@
 
+import base64
 import datetime
 import hashlib
+import io
 import os
 import random
 import string
+import subprocess
+import sys
 import tempfile
 import unittest
 
@@ -12,7 +16,9 @@ import requests
 import six
 
 from cryptography.hazmat import backends as crypto_backends
+from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.asymmetric import rsa
 
 import requests_chef
@@ -29,6 +35,32 @@ def ascii_digest(n=1024):
     return hashlib.sha1(chars).hexdigest()
 
 
+class TestLazyImport(unittest.TestCase):
+
+    def test_import_is_lazy(self):
+        script = ('import sys, requests_chef; '
+                  'print([name for name in ("requests", "cryptography") '
+                  'if name in sys.modules]); '
+                  'requests_chef.ChefAuth; '
+                  'requests_chef.mixlib_auth.digester; '
+                  'print("cryptography" in sys.modules)')
+        output = subprocess.check_output(
+            [sys.executable, '-c', script],
+            cwd=os.path.dirname(os.path.dirname(TEST_PEM)))
+        self.assertEqual(['[]', 'True'], output.decode('ascii').split())
+
+    def test_star_import(self):
+        namespace = {}
+        exec('from requests_chef import *', namespace)
+        for name in ('ChefAuth', 'RSAKey', 'ChefSession', '__version__'):
+            self.assertIn(name, namespace)
+        self.assertIs(requests_chef.ChefAuth, namespace['ChefAuth'])
+
+    def test_unknown_attribute(self):
+        self.assertRaises(AttributeError, getattr, requests_chef, 'Nope')
+        self.assertIn('ChefAuth', dir(requests_chef))
+
+
 class TestChefAuth(unittest.TestCase):
 
     @classmethod
@@ -50,22 +82,8 @@ class TestChefAuth(unittest.TestCase):
         }
         self.request = requests.Request(**req).prepare()
 
-        # workaround for:
-        #
-        # TypeError: can't set attributes of built-in/extension
-        #            type 'datetime.datetime'
-        class MockDatetime(datetime.datetime):
-            @classmethod
-            def utcnow(cls):
-                return original_datetime.utcnow()
-        original_datetime, datetime.datetime = datetime.datetime, MockDatetime
-
-        utcnow_patcher = mock.patch.object(
-            requests_chef.mixlib_auth.datetime.datetime, 'utcnow')
-        self.mock_utcnow = utcnow_patcher.start()
-        self.mock_utcnow.return_value = datetime.datetime(
-            2015, 6, 29, 15, 30, 22)
-        self.addCleanup(utcnow_patcher.stop)
+        self.clock = requests_chef.clock.FixedClock(
+            datetime.datetime(2015, 6, 29, 15, 30, 22))
 
     def assert_xops_headers(self, request):
         self.assertEqual(
@@ -99,7 +117,8 @@ class TestChefAuth(unittest.TestCase):
             format=serialization.PrivateFormat.PKCS8,
             encryption_algorithm=serialization.NoEncryption()
         )
-        handler = requests_chef.ChefAuth(self.user, serialized_key)
+        handler = requests_chef.ChefAuth(
+            self.user, serialized_key, clock=self.clock)
         request = handler(self.request)
         self.assert_xops_headers(request)
 
@@ -110,18 +129,21 @@ class TestChefAuth(unittest.TestCase):
             encryption_algorithm=serialization.NoEncryption()
         )
         rsakey = requests_chef.RSAKey.load_pem(serialized_key)
-        handler = requests_chef.ChefAuth(self.user, rsakey)
+        handler = requests_chef.ChefAuth(
+            self.user, rsakey, clock=self.clock)
         request = handler(self.request)
         self.assert_xops_headers(request)
 
     def test_from_cryptography_rsaprivatekey(self):
-        handler = requests_chef.ChefAuth(self.user, self.private_key)
+        handler = requests_chef.ChefAuth(
+            self.user, self.private_key, clock=self.clock)
         request = handler(self.request)
         self.assert_xops_headers(request)
 
     def test_from_requests_chef_rsakey_direct(self):
         rsakey = requests_chef.RSAKey(self.private_key)
-        handler = requests_chef.ChefAuth(self.user, rsakey)
+        handler = requests_chef.ChefAuth(
+            self.user, rsakey, clock=self.clock)
         request = handler(self.request)
         self.assert_xops_headers(request)
 
@@ -142,8 +164,59 @@ class TestChefAuth(unittest.TestCase):
         )
         self.assertEqual(expected, result)
 
+    def test_signature_cache_reuses_headers(self):
+        rsakey = requests_chef.RSAKey(self.private_key)
+        handler = requests_chef.ChefAuth(
+            self.user, rsakey, clock=self.clock,
+            signature_cache=requests_chef.LRUCache(maxsize=8))
+        with mock.patch.object(rsakey, 'sign', wraps=rsakey.sign) as sign:
+            self.assert_xops_headers(handler(self.request.copy()))
+            self.assert_xops_headers(handler(self.request.copy()))
+        self.assertEqual(1, sign.call_count)
+        self.assertEqual(1, handler.signature_cache.hits)
+        self.assertEqual(1, handler.signature_cache.misses)
+
+    def test_correct_skew_uses_own_clock(self):
+        default_clock = requests_chef.clock.DEFAULT_CLOCK
+        handler = requests_chef.ChefAuth(self.user, self.private_key,
+                                         correct_skew=True)
+        self.assertIsNot(default_clock, handler.clock)
+        handler.clock.correct(handler.clock.time() + 3600)
+        self.assertEqual(0, default_clock.offset)
+        self.assertIs(default_clock, requests_chef.ChefAuth(
+            self.user, self.private_key).clock)
+
+    def test_sign_many(self):
+        rsakey = requests_chef.RSAKey(self.private_key)
+        handler = requests_chef.ChefAuth(
+            self.user, rsakey, clock=self.clock)
+        other = requests.Request(
+            method='GET', url='http://chef-server.com/nodes/a').prepare()
+        with mock.patch.object(rsakey, 'sign_batch',
+                               wraps=rsakey.sign_batch) as sign_batch:
+            headers = handler.sign_many([
+                self.request,
+                ('GET', '/', self.data),
+                other,
+            ])
+        self.assert_xops_headers(self.request)
+        self.assertEqual(dict(self.request.headers, **headers[0]),
+                         self.request.headers)
+        self.assertEqual(headers[0], headers[1])
+        self.assertEqual(headers[2]['X-Ops-Authorization-1'],
+                         other.headers['X-Ops-Authorization-1'])
+        # the two identical canonical requests are only signed once
+        self.assertEqual(2, len(sign_batch.call_args[0][0]))
+
+    def test_rsakey_sign_batch(self):
+        rsakey = requests_chef.RSAKey(self.private_key)
+        payloads = [self.data, six.b(self.data), 'other']
+        expected = [rsakey.sign(data) for data in payloads]
+        self.assertEqual(expected, rsakey.sign_batch(payloads))
+
     def test_repr(self):
-        handler = requests_chef.ChefAuth(self.user, self.private_key)
+        handler = requests_chef.ChefAuth(
+            self.user, self.private_key, clock=self.clock)
         expected = 'ChefAuth(patsy)'
         self.assertEqual(expected, repr(handler))
 
@@ -221,6 +294,209 @@ class TestChefAuthGeneratedKey(unittest.TestCase):
         self.assert_xops_headers(request)
 
 
+class TestChefAuthProtocols(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.user = 'patsy'
+        self.rsakey = requests_chef.RSAKey.load_pem(TEST_PEM)
+        self.public_key = self.rsakey.private_key.public_key()
+        self.timestamp = '2015-06-29T15:30:22Z'
+        self.body = '07af154a81a86ccec33c213a0c71487a19cc3b76'
+
+    def sign(self, protocol):
+        handler = requests_chef.ChefAuth(
+            self.user, self.rsakey, protocol=protocol)
+        headers, _ = handler.sign_request(
+            'post', '/nodes/a?b=c', self.body, timestamp=self.timestamp)
+        return headers, self.signature(headers)
+
+    def signature(self, headers):
+        chunks = sorted((int(name.rpartition('-')[2]), value)
+                        for name, value in headers.items()
+                        if name.startswith('X-Ops-Authorization-'))
+        return base64.b64decode(six.b('').join(
+            value for _, value in chunks))
+
+    def recover(self, signature):
+        return self.public_key.recover_data_from_signature(
+            signature, padding.PKCS1v15(), None).decode('utf_8')
+
+    def test_v10(self):
+        headers, signature = self.sign('1.0')
+        self.assertEqual('algorithm=sha1;version=1.0', headers['X-Ops-Sign'])
+        expected = '\n'.join([
+            'Method:POST',
+            'Hashed Path:%s' % requests_chef.mixlib_auth.digester('/nodes/a'),
+            'X-Ops-Content-Hash:%s' % headers['X-Ops-Content-Hash'],
+            'X-Ops-Timestamp:%s' % self.timestamp,
+            'X-Ops-UserId:patsy',
+        ])
+        self.assertEqual(expected, self.recover(signature))
+
+    def test_v11_hashes_user_id(self):
+        headers, signature = self.sign('1.1')
+        self.assertEqual('algorithm=sha1;version=1.1', headers['X-Ops-Sign'])
+        self.assertEqual('patsy', headers['X-Ops-UserId'])
+        self.assertTrue(self.recover(signature).endswith(
+            '\nX-Ops-UserId:%s' % requests_chef.mixlib_auth.digester(
+                'patsy')))
+
+    def test_v13(self):
+        headers, signature = self.sign('1.3')
+        self.assertEqual('algorithm=sha256;version=1.3',
+                         headers['X-Ops-Sign'])
+        self.assertEqual('0', headers['X-Ops-Server-API-Version'])
+        self.assertEqual(
+            requests_chef.mixlib_auth.digester(self.body, 'sha256'),
+            headers['X-Ops-Content-Hash'])
+        canonical = '\n'.join([
+            'Method:POST',
+            'Path:/nodes/a',
+            'X-Ops-Content-Hash:%s' % headers['X-Ops-Content-Hash'],
+            'X-Ops-Sign:version=1.3',
+            'X-Ops-Timestamp:%s' % self.timestamp,
+            'X-Ops-UserId:patsy',
+            'X-Ops-Server-API-Version:0',
+        ])
+        # raises InvalidSignature if the signature doesn't match
+        self.public_key.verify(signature, canonical.encode('utf_8'),
+                               padding.PKCS1v15(), hashes.SHA256())
+
+    def test_v13_server_api_version(self):
+        protocol = requests_chef.mixlib_auth.ProtocolV13(
+            server_api_version=1)
+        headers, _ = self.sign(protocol)
+        self.assertEqual('1', headers['X-Ops-Server-API-Version'])
+
+    def test_canonical_request_bytes_is_identical(self):
+        for protocol in sorted(requests_chef.mixlib_auth.PROTOCOLS):
+            for user in (self.user, u'p%sts\u00ff %d'):
+                handler = requests_chef.ChefAuth(
+                    user, self.rsakey, protocol=protocol)
+                args = ('delete', handler.protocol.hash_path(u'/nodes/\u00e9'),
+                        'content-hash', self.timestamp)
+                self.assertEqual(
+                    handler.canonical_request(*args).encode('utf_8'),
+                    handler.canonical_request_bytes(*args))
+
+    def test_overridden_canonical_request_is_signed(self):
+
+        class LowerChefAuth(requests_chef.ChefAuth):
+            def canonical_request(self, *args):
+                return super(LowerChefAuth, self).canonical_request(
+                    *args).lower()
+
+        class LowerProtocol(requests_chef.mixlib_auth.ProtocolV11):
+            def canonical_request(self, *args):
+                return super(LowerProtocol, self).canonical_request(
+                    *args).lower()
+
+        for handler in (LowerChefAuth(self.user, self.rsakey,
+                                      protocol='1.1'),
+                        requests_chef.ChefAuth(self.user, self.rsakey,
+                                               protocol=LowerProtocol())):
+            headers, _ = handler.sign_request(
+                'post', '/nodes/a', self.body, timestamp=self.timestamp)
+            expected = handler.canonical_request(
+                'post', handler.protocol.hash_path('/nodes/a'),
+                headers['X-Ops-Content-Hash'], self.timestamp)
+            self.assertIn('method:post', expected)
+            self.assertEqual(expected,
+                             self.recover(self.signature(headers)))
+
+    def test_unsupported_version(self):
+        with self.assertRaises(ValueError):
+            requests_chef.ChefAuth(self.user, self.rsakey, protocol='1.2')
+
+
+class TestKeyRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = requests_chef.mixlib_auth.KeyRegistry()
+        with open(TEST_PEM, 'rb') as pem:
+            self.pem = pem.read()
+
+    def test_path_is_parsed_once(self):
+        first = self.registry.load(TEST_PEM)
+        self.assertIs(first, self.registry.load(TEST_PEM))
+        self.assertEqual(1, len(self.registry))
+
+    def test_pem_data_is_parsed_once(self):
+        first = self.registry.load(self.pem)
+        self.assertIs(first, self.registry.load(self.pem.decode('utf-8')))
+
+    def test_changed_file_is_reloaded(self):
+        other = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048,
+            backend=crypto_backends.default_backend())
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'client.pem')
+        self.addCleanup(os.rmdir, tmpdir)
+        self.addCleanup(os.remove, path)
+        with open(path, 'wb') as pem:
+            pem.write(self.pem)
+        first = self.registry.load(path)
+        with open(path, 'wb') as pem:
+            pem.write(other.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()))
+        os.utime(path, (0, 0))
+        second = self.registry.load(path)
+        self.assertIsNot(first, second)
+        self.assertEqual(other.private_numbers(), second.private_numbers())
+        self.assertEqual(1, len(self.registry))
+
+    def test_clear(self):
+        first = self.registry.load(TEST_PEM)
+        self.registry.clear()
+        self.assertEqual(0, len(self.registry))
+        self.assertIsNot(first, self.registry.load(TEST_PEM))
+
+    def test_load_pem_uses_registry(self):
+        first = requests_chef.RSAKey.load_pem(TEST_PEM, registry=self.registry)
+        second = requests_chef.RSAKey.load_pem(
+            TEST_PEM, registry=self.registry)
+        self.assertIs(first.private_key, second.private_key)
+        uncached = requests_chef.RSAKey.load_pem(TEST_PEM, registry=None)
+        self.assertIsNot(first.private_key, uncached.private_key)
+
+
+class TestSignedHeaders(unittest.TestCase):
+
+    def setUp(self):
+        self.signature = base64.b64encode(bytes(bytearray(range(256))))
+        self.signed = requests_chef.mixlib_auth.SignedHeaders(self.signature)
+
+    def test_mapping(self):
+        chunks = list(requests_chef.mixlib_auth.splitter(self.signature))
+        names = ['X-Ops-Authorization-%d' % i for i in range(1, 7)]
+        self.assertEqual(6, len(self.signed))
+        self.assertEqual(names, list(self.signed))
+        self.assertEqual(dict(zip(names, chunks)), dict(self.signed))
+        self.assertEqual(list(zip(names, chunks)), list(self.signed.pairs()))
+        self.assertEqual(chunks[5], self.signed['x-ops-authorization-6'])
+        for name in ('X-Ops-Authorization-0', 'X-Ops-Authorization-7',
+                     'X-Ops-Authorization-x', 'X-Ops-Sign'):
+            self.assertNotIn(name, self.signed)
+
+    def test_compact(self):
+        self.assertRaises(AttributeError, setattr, self.signed, 'extra', 1)
+        self.assertIs(self.signed.values_tuple(), self.signed.values_tuple())
+
+    def test_cached_headers_are_shared(self):
+        auth = requests_chef.ChefAuth(
+            'patsy', TEST_PEM, signature_cache=requests_chef.LRUCache(),
+            clock=requests_chef.clock.FixedClock(1435591822))
+        requests_ = [requests.Request(
+            'GET', 'http://chef-server.com/nodes').prepare()
+            for _ in range(2)]
+        first, second = [auth(request).headers['X-Ops-Authorization-1']
+                         for request in requests_]
+        self.assertIs(first, second)
+
+
 class TestChefAuthFails(unittest.TestCase):
 
     def test_non_string_username_object_fails(self):
@@ -274,6 +550,94 @@ class TestDigester(unittest.TestCase):
         self.assertEqual(self.expected_result, result)
 
 
+class TestContentDigester(unittest.TestCase):
+
+    def setUp(self):
+        self.data = six.b('e394cd9ef34341ca9d592a8fb515a8d4f03c1219') * 100
+        self.expected_result = requests_chef.mixlib_auth.digester(self.data)
+
+    def test_handles_buffers(self):
+        for body in (bytearray(self.data), memoryview(self.data)):
+            result, same = requests_chef.mixlib_auth.content_digester(body)
+            self.assertEqual(self.expected_result, result)
+            self.assertIs(body, same)
+
+    def test_handles_none(self):
+        result, body = requests_chef.mixlib_auth.content_digester(None)
+        self.assertEqual(requests_chef.mixlib_auth.digester(''), result)
+        self.assertIsNone(body)
+
+    def test_file_is_rewound(self):
+        fileobj = io.BytesIO(six.b('skipped') + self.data)
+        fileobj.seek(7)
+        result, body = requests_chef.mixlib_auth.content_digester(
+            fileobj, chunksize=7)
+        self.assertEqual(self.expected_result, result)
+        self.assertIs(fileobj, body)
+        self.assertEqual(7, fileobj.tell())
+
+    def test_file_is_mapped_and_cached(self):
+        hash_cache = requests_chef.LRUCache(ttl=None)
+        with tempfile.TemporaryFile() as fileobj:
+            fileobj.write(six.b('skipped') + self.data)
+            fileobj.seek(7)
+            with mock.patch.object(requests_chef.mixlib_auth,
+                                   'CONTENT_HASH_CACHE', hash_cache):
+                with mock.patch.object(
+                        requests_chef.mixlib_auth.mmap, 'mmap',
+                        wraps=requests_chef.mixlib_auth.mmap.mmap) as mmap:
+                    for _ in range(2):
+                        result, body = (
+                            requests_chef.mixlib_auth.content_digester(
+                                fileobj))
+                        self.assertEqual(self.expected_result, result)
+                        self.assertIs(fileobj, body)
+                        self.assertEqual(7, fileobj.tell())
+                    self.assertEqual(1, mmap.call_count)
+                    self.assertEqual(1, hash_cache.hits)
+
+                    # a change to the file is noticed
+                    fileobj.seek(0, os.SEEK_END)
+                    fileobj.write(six.b('more'))
+                    fileobj.flush()
+                    os.utime(fileobj.fileno(), (0, 0))
+                    fileobj.seek(7)
+                    result, _ = requests_chef.mixlib_auth.content_digester(
+                        fileobj)
+                    self.assertEqual(requests_chef.mixlib_auth.digester(
+                        self.data + six.b('more')), result)
+                    self.assertEqual(2, mmap.call_count)
+
+    def test_empty_file(self):
+        with tempfile.TemporaryFile() as fileobj:
+            result, _ = requests_chef.mixlib_auth.content_digester(fileobj)
+        self.assertEqual(requests_chef.mixlib_auth.digester(''), result)
+
+    def test_text_file(self):
+        fileobj = io.StringIO(self.data.decode('utf_8'))
+        result, _ = requests_chef.mixlib_auth.content_digester(fileobj)
+        self.assertEqual(self.expected_result, result)
+
+    def test_generator_is_resupplied(self):
+        chunks = [self.data[i:i + 13] for i in range(0, len(self.data), 13)]
+        result, body = requests_chef.mixlib_auth.content_digester(
+            (chunk for chunk in chunks), chunksize=100)
+        self.assertEqual(self.expected_result, result)
+        self.assertEqual(self.data, six.b('').join(body))
+
+    def test_generator_body_is_signed_and_streamed(self):
+        request = requests.Request(
+            method='PUT', url='http://chef-server.com/sandboxes/abc',
+            data=(chunk for chunk in (self.data[:10], self.data[10:])),
+        ).prepare()
+        handler = requests_chef.ChefAuth('patsy', TEST_PEM)
+        request = handler(request)
+        self.assertEqual(self.expected_result,
+                         request.headers['X-Ops-Content-Hash'])
+        self.assertEqual('chunked', request.headers['Transfer-Encoding'])
+        self.assertEqual(self.data, six.b('').join(request.body))
+
+
 if __name__ == '__main__':
 
     unittest.main()
@@ -0,0 +1,93 @@
+import json
+import unittest
+
+from six.moves.urllib import parse as urlparse
+
+import requests_chef
+from requests_chef import fake_server
+from requests_chef import search
+
+from chef_server import RecordingChefServer
+from chef_server import TEST_PEM
+
+NODES = fake_server.make_nodes(23)
+
+
+class TestIterJSONRows(unittest.TestCase):
+
+    def test_streams_one_character_at_a_time(self):
+        document = json.dumps({'total': 1234, 'start': 0, 'rows': NODES,
+                               'after': [1.5, None]})
+        meta = {}
+        rows = list(search.iter_json_rows(iter(document), meta=meta))
+        self.assertEqual(NODES, rows)
+        self.assertEqual({'total': 1234, 'start': 0, 'after': [1.5, None]},
+                         meta)
+
+    def test_empty(self):
+        self.assertEqual([], list(search.iter_json_rows(['{ }'])))
+        self.assertEqual([], list(search.iter_json_rows(['{"rows": []}'])))
+
+    def test_truncated_document_fails(self):
+        with self.assertRaises(ValueError):
+            list(search.iter_json_rows(['{"rows": [{"a": 1}, {"a"']))
+
+
+class TestChefSearch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RecordingChefServer(nodes=NODES)
+        cls.session = requests_chef.ChefSession(
+            cls.server.start(), 'patsy', TEST_PEM)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.session.close()
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.reset()
+
+    def pages(self):
+        """Return the (method, start) of each search request."""
+        pages = []
+        for method, target, _ in self.server.requests:
+            query = dict(urlparse.parse_qsl(urlparse.urlsplit(target).query))
+            pages.append((method, int(query['start'])))
+        return pages
+
+    def test_yields_all_pages_in_order(self):
+        searcher = search.ChefSearch(self.session, rows=5, workers=2)
+        self.assertEqual(NODES, list(searcher('node')))
+        self.assertEqual([0, 5, 10, 15, 20],
+                         sorted(start for _, start in self.pages()))
+
+    def test_partial_search(self):
+        searcher = search.ChefSearch(self.session, rows=10)
+        rows = list(searcher('node', 'role:web',
+                             filter_result={'ip': ['ipaddress']}))
+        self.assertEqual([{'ip': node['automatic']['ipaddress']}
+                          for node in NODES[::2]],
+                         [row['data'] for row in rows])
+        self.assertEqual({'POST'},
+                         set(method for method, _ in self.pages()))
+
+    def test_start(self):
+        searcher = search.ChefSearch(self.session, rows=10)
+        self.assertEqual(NODES[20:], list(searcher('node', start=20)))
+
+    def test_stop_early(self):
+        searcher = search.ChefSearch(self.session, rows=2, workers=3)
+        results = searcher('node')
+        self.assertEqual(NODES[:3], [next(results) for _ in range(3)])
+        results.close()
+
+    def test_workers_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            search.ChefSearch(self.session, workers=0)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+import requests_chef
+
+from chef_server import RecordingChefServer
+from chef_server import TEST_PEM
+
+
+class TestChefSession(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RecordingChefServer()
+        cls.url = cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.reset()
+        self.session = requests_chef.ChefSession(
+            self.url, 'patsy', TEST_PEM, backoff_factor=0)
+        self.addCleanup(self.session.close)
+
+    def test_signs_relative_requests(self):
+        response = self.session.get('/nodes/node-1')
+        self.assertEqual(200, response.status_code, response.text)
+        self.assertEqual('node-1', response.json()['name'])
+        _, target, headers = self.server.requests[0]
+        self.assertEqual('/organizations/acme/nodes/node-1', target)
+        self.assertEqual('patsy', headers['x-ops-userid'])
+        self.assertEqual(requests_chef.session.DEFAULT_CHEF_VERSION,
+                         headers['x-chef-version'])
+        self.assertEqual('application/json', headers['accept'])
+
+    def test_keeps_connections_alive(self):
+        for _ in range(3):
+            self.assertEqual(200, self.session.get('nodes').status_code)
+        self.assertEqual(1, self.server.stats['connections'])
+
+    def test_retries_server_errors(self):
+        self.server.statuses.extend([503, 429])
+        response = self.session.get('nodes')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_accepts_auth(self):
+        auth = requests_chef.ChefAuth('patsy', TEST_PEM)
+        session = requests_chef.ChefSession(self.url, auth=auth)
+        self.assertIs(auth, session.auth)
+        self.assertEqual(
+            'ChefSession(%s/, ChefAuth(patsy))' % self.url, repr(session))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
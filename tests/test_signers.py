@@ -0,0 +1,142 @@
+import base64
+import os
+import unittest
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+
+import requests_chef
+from requests_chef import mixlib_auth
+from requests_chef import signers
+
+TEST_PEM = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'test.pem')
+
+
+class CountingBackend(signers.SignerBackend):
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.batches = []
+
+    def sign(self, data, algorithm=None):
+        return self.sign_batch([data], algorithm=algorithm)[0]
+
+    def sign_batch(self, payloads, algorithm=None):
+        self.batches.append(list(payloads))
+        return self.backend.sign_batch(payloads, algorithm=algorithm)
+
+
+class TestCryptographyBackend(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rsakey = requests_chef.RSAKey.load_pem(TEST_PEM)
+
+    def test_default_backend(self):
+        self.assertIsInstance(self.rsakey.backend,
+                              signers.CryptographyBackend)
+        self.assertIs(self.rsakey.private_key,
+                      self.rsakey.backend.private_key)
+
+    def test_raw_signature(self):
+        signature = self.rsakey.backend.sign(u'data')
+        public_key = self.rsakey.private_key.public_key()
+        self.assertEqual(b'data', public_key.recover_data_from_signature(
+            signature, padding.PKCS1v15(), None))
+
+    def test_sha256_signature(self):
+        signature = self.rsakey.backend.sign(b'data', algorithm='sha256')
+        self.rsakey.private_key.public_key().verify(
+            signature, b'data', padding.PKCS1v15(), hashes.SHA256())
+
+    def test_rejects_other_keys(self):
+        self.assertRaises(TypeError, signers.CryptographyBackend, 'pem')
+        self.assertRaises(TypeError, requests_chef.RSAKey, object())
+
+
+class TestRSAKeyBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.inner = requests_chef.RSAKey.load_pem(TEST_PEM)
+        self.backend = CountingBackend(self.inner.backend)
+        self.rsakey = requests_chef.RSAKey(self.backend)
+
+    def test_sign_through_backend(self):
+        self.assertEqual(self.inner.sign('data'), self.rsakey.sign('data'))
+        self.assertEqual(base64.b64decode(self.rsakey.sign('data')),
+                         self.rsakey.sign('data', b64=False))
+        self.assertIsNone(self.rsakey.private_key)
+
+    def test_sign_batch_is_one_backend_call(self):
+        payloads = ['a', 'b', 'a', u'c']
+        signed = self.rsakey.sign_batch(payloads, algorithm='sha256')
+        self.assertEqual([[b'a', b'b', b'c']], self.backend.batches)
+        self.assertEqual(
+            [self.inner.sign(data, algorithm='sha256') for data in payloads],
+            signed)
+
+    def test_chef_auth(self):
+        auth = requests_chef.ChefAuth('patsy', self.rsakey, protocol='1.3')
+        headers, _ = auth.sign_request('GET', '/nodes',
+                                       timestamp='2015-06-29T15:30:22Z')
+        expected, _ = requests_chef.ChefAuth(
+            'patsy', self.inner, protocol='1.3').sign_request(
+                'GET', '/nodes', timestamp='2015-06-29T15:30:22Z')
+        self.assertEqual(expected, headers)
+
+
+@unittest.skipUnless(os.environ.get('PKCS11_MODULE'),
+                     'set PKCS11_MODULE (e.g. libsofthsm2.so), '
+                     'PKCS11_TOKEN and PKCS11_PIN to test against a token')
+class TestPKCS11Backend(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        import pkcs11
+        from pkcs11.util import rsa as pkcs11_rsa
+        from cryptography.hazmat.primitives import serialization
+
+        lib = pkcs11.lib(os.environ['PKCS11_MODULE'])
+        token = lib.get_token(token_label=os.environ['PKCS11_TOKEN'])
+        pin = os.environ['PKCS11_PIN']
+        with token.open(rw=True, user_pin=pin) as session:
+            for key in session.get_objects({
+                    pkcs11.Attribute.LABEL: 'requests-chef-test'}):
+                key.destroy()
+            public, _ = session.generate_keypair(
+                pkcs11.KeyType.RSA, 2048, label='requests-chef-test',
+                store=True)
+            cls.public_key = serialization.load_der_public_key(
+                pkcs11_rsa.encode_rsa_public_key(public))
+        cls.backend = signers.PKCS11Backend(
+            os.environ['PKCS11_MODULE'], os.environ['PKCS11_TOKEN'],
+            key_label='requests-chef-test', pin=pin)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.backend.close()
+
+    def test_raw_signature(self):
+        signature = self.backend.sign(b'canonical request')
+        self.assertEqual(
+            b'canonical request',
+            self.public_key.recover_data_from_signature(
+                signature, padding.PKCS1v15(), None))
+
+    def test_sha256_signature(self):
+        signature = self.backend.sign(b'canonical request',
+                                      algorithm='sha256')
+        self.public_key.verify(signature, b'canonical request',
+                               padding.PKCS1v15(), hashes.SHA256())
+
+    def test_rsakey(self):
+        rsakey = mixlib_auth.RSAKey(self.backend)
+        signature = base64.b64decode(rsakey.sign('data'))
+        self.assertEqual(b'data', self.public_key.recover_data_from_signature(
+            signature, padding.PKCS1v15(), None))
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+import requests_chef
+from requests_chef import upload
+
+from chef_server import RecordingChefServer
+from chef_server import TEST_PEM
+
+
+class TestSandboxUploader(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RecordingChefServer()
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.reset()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.files = {}
+        for name, content in (('metadata.rb', b"name 'web'\n"),
+                              ('default.rb', b"package 'nginx'\n" * 5000),
+                              ('copy.rb', b"name 'web'\n"),
+                              ('empty.rb', b'')):
+            path = os.path.join(self.tmpdir, name)
+            with open(path, 'wb') as fileobj:
+                fileobj.write(content)
+            self.files[path] = content
+        self.session = requests_chef.ChefSession(
+            self.server.url, 'patsy', TEST_PEM, backoff_factor=0)
+        self.addCleanup(self.session.close)
+        self.uploader = upload.SandboxUploader(self.session, workers=3,
+                                               hash_workers=2)
+
+    def completed(self):
+        return [sandbox_id for sandbox_id, sandbox in
+                self.server.sandboxes.items() if sandbox['is_completed']]
+
+    def test_file_checksums(self):
+        expected = dict((path, hashlib.md5(content).hexdigest())
+                        for path, content in self.files.items())
+        self.assertEqual(expected, upload.file_checksums(self.files,
+                                                         max_workers=2))
+
+    def test_upload(self):
+        result = self.uploader.upload(sorted(self.files))
+        self.assertEqual(
+            sorted(set(self.files.values())),
+            sorted(self.server.checksums.values()))
+        self.assertEqual(sorted(self.files), sorted(result.uploaded))
+        self.assertEqual([], result.skipped)
+        self.assertEqual([result.sandbox_id], self.completed())
+
+    def test_skips_stored_files(self):
+        stored = hashlib.md5(b"name 'web'\n").hexdigest()
+        self.server.checksums[stored] = b"name 'web'\n"
+        result = self.uploader.upload(self.files)
+        self.assertEqual(
+            sorted(os.path.join(self.tmpdir, name)
+                   for name in ('metadata.rb', 'copy.rb')),
+            sorted(result.skipped))
+        self.assertEqual(3, len(self.server.checksums))
+        self.assertEqual(stored, result.checksums[
+            os.path.join(self.tmpdir, 'copy.rb')])
+
+    def test_failed_upload_is_not_committed(self):
+        original = upload.SandboxUploader.upload_file
+
+        def corrupt(uploader, url, path, checksum):
+            return original(uploader, url, path, '0' * 32)
+
+        self.uploader.upload_file = corrupt.__get__(self.uploader)
+        self.assertRaises(requests.HTTPError, self.uploader.upload,
+                          self.files)
+        self.assertEqual([], self.completed())
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,178 @@
+import base64
+import io
+import json
+import os
+import unittest
+
+from cryptography.hazmat.primitives import serialization
+import mock
+import requests
+
+import requests_chef
+from requests_chef import clock
+from requests_chef import mixlib_auth
+from requests_chef import verify
+
+TEST_PEM = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'test.pem')
+NOW = 1435591822
+
+
+class TestChefAuthVerifier(unittest.TestCase):
+
+    def setUp(self):
+        self.auth = requests_chef.ChefAuth(
+            'patsy', TEST_PEM, clock=clock.FixedClock(NOW))
+        self.clock = clock.FixedClock(NOW)
+        self.verifier = verify.ChefAuthVerifier(
+            {'patsy': TEST_PEM}, clock=self.clock)
+
+    def verify(self, headers, body=b'', path='/nodes', verifier=None):
+        verifier = verifier or self.verifier
+        return verifier.verify('GET', path, headers, body)
+
+    def test_verifies(self):
+        for protocol in ('1.0', '1.1', '1.3'):
+            auth = requests_chef.ChefAuth('patsy', TEST_PEM,
+                                          protocol=protocol,
+                                          clock=clock.FixedClock(NOW))
+            headers, _ = auth.sign_request('GET', '/nodes')
+            self.assertEqual('patsy', self.verify(headers))
+
+    def test_protocols_memoized_for_valid_api_versions(self):
+        for api_version in ['0', '1'] + ['junk-%d' % i for i in range(50)]:
+            self.verifier.protocol({'x-ops-sign': 'version=1.3',
+                                    'x-ops-server-api-version': api_version})
+        self.assertEqual(2, len(self.verifier._protocols))
+        self.assertRaises(verify.AuthenticationError, self.verifier.protocol,
+                          {'x-ops-sign': 'version=9.9'})
+        self.assertEqual(2, len(self.verifier._protocols))
+
+    def test_skew_window(self):
+        headers, _ = self.auth.sign_request('GET', '/nodes')
+        self.clock.offset = 900
+        self.assertEqual('patsy', self.verify(headers))
+        self.clock.offset = 901
+        self.assertRaises(verify.AuthenticationError, self.verify, headers)
+
+    def test_rejects(self):
+        headers, _ = self.auth.sign_request('GET', '/nodes')
+        for kwargs in ({'body': b'x'}, {'path': '/roles'}):
+            self.assertRaises(verify.AuthenticationError,
+                              self.verify, headers, **kwargs)
+        unknown = dict(headers, **{'X-Ops-Userid': 'mallory'})
+        self.assertRaises(verify.AuthenticationError, self.verify, unknown)
+        truncated = dict(headers)
+        del truncated['X-Ops-Authorization-2']
+        self.assertRaises(verify.AuthenticationError, self.verify, truncated)
+
+    def test_join_signature(self):
+        signature = bytes(bytearray(range(256)))
+        headers = dict(
+            (name.lower(), value.decode('ascii'))
+            for name, value in mixlib_auth.SignedHeaders(
+                base64.b64encode(signature)).items())
+        self.assertEqual(signature, verify.join_signature(headers))
+        headers['x-ops-authorization-1'] = 'A'
+        self.assertRaises(verify.AuthenticationError,
+                          verify.join_signature, headers)
+
+    def test_prepared_request_headers(self):
+        request = requests.Request('GET', 'http://chef/nodes').prepare()
+        self.assertEqual('patsy', self.verify(self.auth(request).headers))
+
+    def test_verified_cache_skips_rsa(self):
+        headers, _ = self.auth.sign_request('GET', '/nodes')
+        with mock.patch.object(verify.ChefAuthVerifier, '_signature_valid',
+                               return_value=True) as valid:
+            self.verify(headers)
+            self.verify(headers)
+        self.assertEqual(1, valid.call_count)
+        self.assertEqual(1, len(self.verifier.verified))
+
+    def test_reject_replays(self):
+        verifier = verify.ChefAuthVerifier(
+            {'patsy': TEST_PEM}, clock=self.clock, reject_replays=True)
+        headers, _ = self.auth.sign_request('GET', '/nodes')
+        self.assertEqual('patsy', self.verify(headers, verifier=verifier))
+        self.assertRaises(verify.AuthenticationError, self.verify, headers,
+                          verifier=verifier)
+
+    def test_key_loader_is_cached(self):
+        loader = mock.Mock(side_effect=lambda user_id: (
+            TEST_PEM if user_id == 'patsy' else None))
+        verifier = verify.ChefAuthVerifier(key_loader=loader,
+                                           clock=self.clock)
+        for body in (b'a', b'b'):
+            headers, _ = self.auth.sign_request('POST', '/nodes', body)
+            self.assertEqual('patsy', verifier.verify('POST', '/nodes',
+                                                      headers, body))
+        self.assertIsNone(verifier.public_key('mallory'))
+        self.assertEqual([mock.call('patsy'), mock.call('mallory')],
+                         loader.call_args_list)
+
+    def test_public_key_forms(self):
+        rsakey = requests_chef.RSAKey.load_pem(TEST_PEM)
+        public_key = rsakey.private_key.public_key()
+        pem = public_key.public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo)
+        for key in (rsakey, rsakey.private_key, public_key, pem,
+                    pem.decode('ascii')):
+            self.assertEqual(public_key.public_numbers(),
+                             verify.load_public_key(key).public_numbers())
+
+
+class TestWSGIMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.auth = requests_chef.ChefAuth(
+            'patsy', TEST_PEM, clock=clock.FixedClock(NOW))
+        verifier = verify.ChefAuthVerifier(
+            {'patsy': TEST_PEM}, clock=clock.FixedClock(NOW))
+        self.seen = []
+        self.middleware = verify.WSGIMiddleware(self.app, verifier)
+
+    def app(self, environ, start_response):
+        self.seen.append((environ['chef.user_id'],
+                          environ['wsgi.input'].read()))
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'ok']
+
+    def call(self, method, path, headers, body=b''):
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': 'q=*',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+        }
+        for name, value in headers.items():
+            if isinstance(value, bytes):
+                value = value.decode('ascii')
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        statuses = []
+        result = self.middleware(
+            environ, lambda status, headers: statuses.append(status))
+        return statuses[0], b''.join(result)
+
+    def test_verified(self):
+        body = b'{"name": "web"}'
+        headers, _ = self.auth.sign_request('POST', '/roles?q=*', body)
+        self.assertEqual(('200 OK', b'ok'),
+                         self.call('POST', '/roles', headers, body))
+        self.assertEqual([('patsy', body)], self.seen)
+
+    def test_unauthorized(self):
+        headers, _ = self.auth.sign_request('GET', '/roles')
+        status, body = self.call('GET', '/nodes', headers)
+        self.assertEqual('401 Unauthorized', status)
+        self.assertIn('Invalid signature', json.loads(
+            body.decode('utf-8'))['error'][0])
+        self.assertEqual([], self.seen)
+
+
+if __name__ == '__main__':
+
+    unittest.main()